@@ -51,20 +51,26 @@ USAGE = \
 	wts has several command line formats:
 		wts --addNote <tr #>
 		wts --addNoteFromFile <tr #> <full path to file>
+		wts --ancestorTree <tr #>
 		wts --batchInput <full path to file>
+		wts --buildStatusIntervals
+		wts --buildTextIndexes
 		wts --dir <tr #>
-		wts --display <tr #>
+		wts --display <tr #, or list of tr #s and ranges (eg- 1-5,8)>
 		wts --edit <tr #>
-		wts --fixTC <tr #>
+		wts --fixTC <tr #, or all>
 		wts --getField <tr #> <fieldname>
+		wts --graphReport
 		wts --locks
 		wts --new
 		wts --newMinimal <Title> <Status>
 		wts --plainTree <tr #>
+		wts --queryCacheStats
 		wts --queryTitle <query string>
 		wts --routing
 		wts --setField <tr #> <fieldname> <field value>
 		wts --tree <tr #>
+		wts --treeDepth <tr #> <number of levels>
 		wts --unlock <tr #>
 
 	For working with the MASS-T, you can substitute masst for wts in each
@@ -242,6 +248,45 @@ def display_Tracking_Record (
 			print value	# and the value on the next.
 		
 
+def display_Tracking_Records (
+	raw_tr_nums	# string; one tracking record number, or a comma-
+			# separated list of numbers and ranges (eg- 1-5,8)
+	):
+	# Purpose: print plain text representations of the specified tracking
+	#	records to stdout
+	# Returns: nothing
+	# Assumes: db's SQL routines have been initialized
+	# Effects: queries the database, writes to stdout
+	# Throws: propagates ValueError if we cannot parse "raw_tr_nums" or
+	#	if a single specified tracking record does not exist
+
+	tr_nums = string.translate (raw_tr_nums, string.maketrans ('',''),
+		'TR ')
+
+	# a single TR is handled as always...
+
+	if (string.find (tr_nums, ',') == -1) and \
+			(string.find (tr_nums, '-') == -1) and \
+			(string.find (tr_nums, '..') == -1):
+		tr = TrackRec.TrackRec (string.atoi (tr_nums))
+		display_Tracking_Record (tr)
+		return
+
+	# while for a list or range, we load them all at once
+
+	first = 1
+	for tr in TrackRec.load_many (TrackRec.find_TR_Numbers (tr_nums)):
+		if not first:
+			print
+			print '-' * 70
+			print
+		first = 0
+		display_Tracking_Record (tr)
+	if first:
+		print 'No tracking records found for %s' % raw_tr_nums
+	return
+
+
 def unlock_Tracking_Record (
 	tr				# the tracking record to be unlocked
 	):
@@ -666,9 +711,9 @@ def cleanTrackRecNumber (
 
 def fixClosure (
 	tr_num		# integer; TR num in the connected component where we'd
-	):		# like to patch the transitive closure
+	):		# like to patch the transitive closure, or None for all
 	# Purpose: patch up the transitive closure (if needed) of the connected
-	#	component containing "tr_num"
+	#	component containing "tr_num", or of the whole database
 	# Returns: nothing
 	# Assumes: db's SQL routines have been initialized
 	# Effects: updates the relationships table in the database to reflect
@@ -678,10 +723,15 @@ def fixClosure (
 	#	database
 
 	# update the transtive closure and get the ArcSets of Arcs which were
-	# added and deleted
+	# added and deleted.  The whole database is only practical to do
+	# inside the database server.
 
-	added, deleted = TrackRec.updateTransitiveClosure (tr_num,
-		TrackRec.DEPENDS_ON)
+	if (tr_num is None) or (TrackRec.closureEngine () == 'sql'):
+		added, deleted = TrackRec.sqlTransitiveClosure (tr_num,
+			TrackRec.DEPENDS_ON)
+	else:
+		added, deleted = TrackRec.recomputeTransitiveClosure (tr_num,
+			TrackRec.DEPENDS_ON)
 
 	added_arcs = added.getArcs ()		# list of Arc objects added
 	deleted_arcs = deleted.getArcs ()	# list of Arc objects deleted
@@ -689,6 +739,7 @@ def fixClosure (
 	if (len (added_arcs) == 0) and (len (deleted_arcs) == 0):
 		print "No problems found"
 	else:
+		TrackRec.invalidateQueryCache ()
 		print "Added %d transitive closure arcs" % len (added_arcs)
 		for arc in added_arcs:
 			print "\t%d to %d" % (arc.getFromNode(),
@@ -941,9 +992,12 @@ def addNote (
 if __name__ == '__main__':
 	options, error_flag = wtslib.parseCommandLine (sys.argv,
 		[ 'dir=', 'display=', 'edit=', 'locks', 'new', 'unlock=',
-		  'fixTC=', 'tree=', 'simpleTree=', 'routing', 'batchInput=',
+		  'fixTC=', 'tree=', 'simpleTree=', 'plainTree=',
+		  'ancestorTree=', 'treeDepth=2', 'routing', 'batchInput=',
 		  'getField=2', 'setField=3', 'addNote=', 'newMinimal=2',
-		  'queryTitle=', 'addNoteFromFile=2' ])
+		  'queryTitle=', 'addNoteFromFile=2', 'graphReport',
+		  'queryCacheStats', 'buildTextIndexes',
+		  'buildStatusIntervals' ])
 	try:
 		# Now, because of the was the interface is defined, we can only
 		# handle one command at a time.  If we got too many or too few
@@ -959,9 +1013,7 @@ if __name__ == '__main__':
 
 		elif options.has_key ('display'):
 			raw_tr_num = options ['display'][0]
-			tr_num = cleanTrackRecNumber (raw_tr_num)
-			tr = TrackRec.TrackRec (tr_num)		# load and...
-			display_Tracking_Record (tr)		# display
+			display_Tracking_Records (raw_tr_num)	# load & display
 
 		elif options.has_key ('unlock'):
 			raw_tr_num = options ['unlock'][0]
@@ -977,21 +1029,46 @@ if __name__ == '__main__':
 
 		elif options.has_key ('fixTC'):
 			raw_tr_num = options ['fixTC'][0]
-			tr_num = cleanTrackRecNumber (raw_tr_num)
-			fixClosure (tr_num)
+			if string.lower (raw_tr_num) == 'all':
+				fixClosure (None)
+			else:
+				tr_num = cleanTrackRecNumber (raw_tr_num)
+				fixClosure (tr_num)
 
-		elif options.has_key ('simpleTree'):
-			raw_tr_num = options ['simpleTree'][0]
+		elif options.has_key ('simpleTree') or \
+				options.has_key ('plainTree'):
+			if options.has_key ('simpleTree'):
+				raw_tr_num = options ['simpleTree'][0]
+			else:
+				raw_tr_num = options ['plainTree'][0]
 			tr_num = cleanTrackRecNumber (raw_tr_num)
 			for line in TrackRec.graphTree (tr_num, 0):
 				print line
 
+		elif options.has_key ('ancestorTree'):
+			raw_tr_num = options ['ancestorTree'][0]
+			tr_num = cleanTrackRecNumber (raw_tr_num)
+			for line in TrackRec.graphTree (tr_num, 1, 1):
+				print line
+
+		elif options.has_key ('treeDepth'):
+			raw_tr_num, depth = options ['treeDepth']
+			tr_num = cleanTrackRecNumber (raw_tr_num)
+			for line in TrackRec.graphTree (tr_num, 1, 0,
+					string.atoi (depth)):
+				print line
+
 		elif options.has_key ('tree'):
 			raw_tr_num = options ['tree'][0]
 			tr_num = cleanTrackRecNumber (raw_tr_num)
 			for line in TrackRec.graphTree (tr_num, 1):
 				print line
 
+		elif options.has_key ('graphReport'):
+			for line in TrackRec.graphReportLines (
+					TrackRec.graphReport ()):
+				print line
+
 		elif options.has_key ('locks'):
 			showLocks ()
 
@@ -1029,6 +1106,21 @@ if __name__ == '__main__':
 			tr_num = cleanTrackRecNumber (raw_tr_num)
 			addNote (raw_tr_num)
 
+		elif options.has_key ('queryCacheStats'):
+			stats = TrackRec.queryCacheStats ()
+			print 'hits: %d  misses: %d  entries: %d  ' \
+				'generation: %d  ttl: %d seconds' % (stats ['hits'],
+				stats ['misses'], stats ['entries'],
+				stats ['generation'], stats ['ttl'])
+
+		elif options.has_key ('buildStatusIntervals'):
+			print '%d Status intervals' % \
+				TrackRec.buildStatusIntervals ()
+
+		elif options.has_key ('buildTextIndexes'):
+			TrackRec.buildTextIndexes ()
+			print 'Full-text indexes are in place'
+
 		elif options.has_key ('queryTitle'):
 			[value] = options['queryTitle']
 			print TrackRec.queryTitle (value)
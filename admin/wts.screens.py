@@ -764,6 +764,11 @@ def gen_Query_Form (
 			if item[0] != 'Directory':
 				sort_fields.append ( (item [1], item [0]) )
 
+	# the relevance of the matches is only known for a search of the Text
+	# Fields, so it is not displayed as the other fields are
+
+	sort_fields.append ( ('Relevance (Text Fields)', 'Relevance') )
+
 	# now, let's go through our three levels of sorting and add a row to
 	# the sorting table for each...
 
@@ -0,0 +1,352 @@
+#!/usr/local/bin/python
+
+# Program: wtsPooler.py
+# Purpose: runs the local database session pooler for WTS.  The pooler keeps
+#	a set of warm database sessions (connected, with the WTS schema already
+#	set) and lends them to WTS CGI scripts and command-line runs over a
+#	Unix socket, so those processes do not each pay for a connection
+#	handshake.
+# System Requirements Satisfied by This Program:
+#	Usage: see definition of USAGE variable below
+#	Uses: Python 2.4+, WTS modules: Configuration, wtslib
+#	Envvars: none
+#	Inputs: config parameters DB_POOL_SOCKET (required; path of the Unix
+#		socket to listen on) and DB_POOL_SIZE (optional; number of idle
+#		sessions to keep warm, default 5)
+#	Outputs: with --start, runs until stopped, writing a log of pool
+#		hits and misses to wts.pooler.log in DIAG_DIR.  With --stats,
+#		prints the pooler's current counters to stdout.  With --stop,
+#		asks a running pooler to shut down.
+#	Exit Codes: 0 if okay, 1 if an error occurred
+# Assumes: wtslib.sql() in client processes finds the pooler by reading the
+#	same DB_POOL_SOCKET parameter from wts.cfg
+# Implementation:
+#	Each client connection gets one dedicated session for as long as it
+#	stays connected, so transactions work just as they would on a direct
+#	connection.  When the client disconnects, we roll back anything left
+#	uncommitted and return the session to the idle list.  A "hit" is a
+#	client which found a warm session waiting; a "miss" is one for which
+#	we had to open a new connection.
+#	Messages go over the socket in marshal format (see wtslib.sendMessage),
+#	never as pickles, so a client cannot make the pooler run code.  Only
+#	the pooler's own user or root may stop it; we check the client's
+#	credentials with SO_PEERCRED.
+
+import os
+import sys
+import string
+import socket
+import struct
+import threading
+import SocketServer
+
+import Configuration
+import wtslib
+
+USAGE = '''Usage: wtsPooler.py --start | --stats | --stop
+'''
+
+lock = threading.Lock ()	# protects 'idle' and 'stats'
+idle = []			# list of idle wtslib.DirectSession objects
+stats = {			# maps counter name -> integer count
+	'hits' : 0,
+	'misses' : 0,
+	'requests' : 0,
+	'errors' : 0,
+	'active' : 0,
+	}
+SO_PEERCRED = getattr (socket, 'SO_PEERCRED', 17)	# not in Python 2.4's
+							# socket module
+
+###--- Functions ---###
+
+def log (
+	message		# string; message to write to the log
+	):
+	# Purpose: write a dated 'message' to the pooler's log file
+	# Returns: nothing
+	# Assumes: we can write to DIAG_DIR
+	# Effects: appends to DIAG_DIR/wts.pooler.log
+	# Throws: nothing
+
+	try:
+		fp = open (os.path.join (Configuration.config['DIAG_DIR'],
+			'wts.pooler.log'), 'a')
+		fp.write ('%s  %s\n' % (wtslib.current_Time (), message))
+		fp.close ()
+	except IOError:
+		pass
+	return
+
+def poolSize ():
+	# Purpose: get the number of idle sessions we should keep warm
+	# Returns: integer
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	try:
+		return string.atoi (str (wtslib.fileConfig ('DB_POOL_SIZE',
+			'5')))
+	except ValueError:
+		return 5
+
+def checkOut ():
+	# Purpose: get a session for a newly connected client
+	# Returns: a wtslib.DirectSession object
+	# Assumes: nothing
+	# Effects: updates 'stats'; may open a new connection to the server
+	# Throws: propagates any exception from opening a connection
+	# Notes: A session only counts as active once we have it in hand, so
+	#	a failed connection does not leave 'active' too high.
+
+	lock.acquire ()
+	try:
+		if idle:
+			stats['hits'] = stats['hits'] + 1
+			stats['active'] = stats['active'] + 1
+			session = idle.pop ()
+			session.warm = wtslib.TRUE
+			return session
+		stats['misses'] = stats['misses'] + 1
+	finally:
+		lock.release ()
+
+	session = wtslib.DirectSession ()
+	lock.acquire ()
+	stats['active'] = stats['active'] + 1
+	lock.release ()
+	return session
+
+def checkIn (
+	session,	# wtslib.DirectSession to return to the pool
+	healthy		# boolean; is 'session' still usable?
+	):
+	# Purpose: return a client's session to the pool
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: rolls back uncommitted work, then keeps 'session' idle or
+	#	closes it
+	# Throws: nothing
+
+	# drop any temp tables the client left behind, so they do not
+	# collide with the next client's
+
+	if healthy:
+		try:
+			session.rollback ()
+			session.execute ('discard temp')
+			session.commit ()
+		except:
+			healthy = wtslib.FALSE
+
+	lock.acquire ()
+	try:
+		stats['active'] = stats['active'] - 1
+		if healthy and (len (idle) < poolSize ()):
+			idle.append (session)
+			session = None
+	finally:
+		lock.release ()
+
+	if session is not None:
+		wtslib.discardSession (session)
+	return
+
+def peerUid (
+	sock		# connected Unix socket.socket object
+	):
+	# Purpose: find which user is on the other end of 'sock'
+	# Returns: integer user id of the client process
+	# Assumes: we are on Linux, where SO_PEERCRED gives a struct ucred
+	#	(pid, uid, gid) for a Unix socket
+	# Effects: nothing
+	# Throws: propagates socket.error if the credentials are unavailable
+
+	creds = sock.getsockopt (socket.SOL_SOCKET, SO_PEERCRED,
+		struct.calcsize ('3i'))
+	pid, uid, gid = struct.unpack ('3i', creds)
+	return uid
+
+def statsString ():
+	# Purpose: summarize the pool's counters
+	# Returns: string
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	lock.acquire ()
+	try:
+		return 'hits: %d  misses: %d  requests: %d  errors: %d  ' \
+			'active: %d  idle: %d' % (stats['hits'],
+			stats['misses'], stats['requests'], stats['errors'],
+			stats['active'], len (idle))
+	finally:
+		lock.release ()
+
+###--- Classes ---###
+
+class PoolHandler (SocketServer.BaseRequestHandler):
+	# Concept:
+	#	IS: the handler for one client connection to the pooler
+	#	DOES: lends the client a session and runs its requests on it
+	#		until the client disconnects
+
+	def handle (self):
+		session = None
+		healthy = wtslib.TRUE
+		try:
+			while 1:
+				request = wtslib.receiveMessage (self.request)
+				if request is None:
+					break
+				operation, arg = request
+				reply = self.dispatch (operation, arg, session)
+				if operation == 'hello':
+					session = reply
+					reply = session.warm
+				try:
+					wtslib.sendMessage (self.request,
+						('ok', reply))
+				except socket.error:
+					break
+				if operation == 'stop':
+					self.server.running = wtslib.FALSE
+					break
+		except (socket.error, EOFError):
+			healthy = wtslib.FALSE
+		except:
+			healthy = wtslib.FALSE
+			lock.acquire ()
+			stats['errors'] = stats['errors'] + 1
+			lock.release ()
+			try:
+				wtslib.sendMessage (self.request, ('error',
+					'%s: %s' % (sys.exc_type,
+					sys.exc_value)))
+			except socket.error:
+				pass
+		if session is not None:
+			checkIn (session, healthy)
+		return
+
+	def dispatch (self,
+		operation,	# string; name of the requested operation
+		arg,		# argument for 'operation'
+		session		# session lent to this client, if any yet
+		):
+		lock.acquire ()
+		stats['requests'] = stats['requests'] + 1
+		lock.release ()
+
+		if operation == 'hello':
+			# a second hello would orphan the first session, which
+			# would then never be checked back in
+
+			if session is not None:
+				raise wtslib.error, 'Already said hello'
+			return checkOut ()
+		elif operation == 'stats':
+			s = statsString ()
+			log (s)
+			return s
+		elif operation == 'stop':
+			# anyone in the www group may connect, but only the
+			# pooler's own user (or root) may shut it down
+
+			if peerUid (self.request) not in (os.getuid (), 0):
+				raise wtslib.error, 'Not allowed to stop the pooler'
+			return None
+		elif session is None:
+			raise wtslib.error, 'Must say hello first'
+		elif operation == 'execute':
+			query, params = arg
+			return session.execute (query, params)
+		elif operation == 'prepared':
+			# the definition comes with each request, so one
+			# client's statements never leak into another's
+
+			name, definition, params = arg
+			return session.executePrepared (name, params,
+				definition)
+		elif operation == 'batch':
+			return session.batch (arg)
+		elif operation == 'commit':
+			return session.commit ()
+		elif operation == 'rollback':
+			return session.rollback ()
+		raise wtslib.error, 'Unknown operation: %s' % operation
+
+class PoolServer (SocketServer.ThreadingUnixStreamServer):
+	# Concept:
+	#	IS: the pooler's listening socket
+	#	DOES: starts a PoolHandler thread for each client
+
+	daemon_threads = 1
+	timeout = 1.0		# so we notice a --stop request promptly
+
+	def serve (self):
+		self.running = wtslib.TRUE
+		while self.running:
+			self.handle_request ()
+		return
+
+###--- Main Program ---###
+
+def request (
+	path,		# string; path to the pooler's socket
+	operation	# string; operation to request
+	):
+	# Purpose: send a one-off request to a running pooler
+	# Returns: the pooler's reply value
+	# Assumes: nothing
+	# Effects: communicates with the pooler
+	# Throws: socket.error if no pooler is listening at 'path'
+
+	sock = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.connect (path)
+	wtslib.sendMessage (sock, (operation, None))
+	status, value = wtslib.receiveMessage (sock)
+	sock.close ()
+	return value
+
+def main ():
+	path = wtslib.fileConfig ('DB_POOL_SOCKET')
+	if not path:
+		sys.stderr.write ('DB_POOL_SOCKET is not defined in wts.cfg\n')
+		return 1
+
+	if sys.argv[1:] == [ '--stats' ]:
+		print request (path, 'stats')
+	elif sys.argv[1:] == [ '--stop' ]:
+		request (path, 'stop')
+	elif sys.argv[1:] == [ '--start' ]:
+		if os.path.exists (path):
+			os.remove (path)	# left over from a prior run
+		server = PoolServer (path, PoolHandler)
+		os.chmod (path, 0770)	# CGIs connect via the www group
+
+		# open the warm sessions before we take any clients
+
+		for i in range (0, poolSize ()):
+			idle.append (wtslib.DirectSession ())
+
+		log ('started with %d sessions' % len (idle))
+		server.serve ()
+		log ('stopped; ' + statsString ())
+		os.remove (path)
+		wtslib.closeSessions ()
+		while idle:
+			wtslib.discardSession (idle.pop ())
+	else:
+		sys.stderr.write (USAGE)
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	try:
+		sys.exit (main ())
+	except socket.error:
+		sys.stderr.write ('Cannot contact WTS pooler: %s\n' % \
+			str (sys.exc_value))
+		sys.exit (1)
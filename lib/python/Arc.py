@@ -3,7 +3,7 @@
 # Name:		Arc.py
 # Purpose:	implements the Arc class for WTS
 
-class Arc:
+class Arc (object):
 	# Concept:
 	#	IS:	An Arc is an edge in a directed graph.  For now, we
 	#		assume that the nodes are represented by integers.
@@ -19,12 +19,14 @@ class Arc:
 	#	This class is very straightforward.  It merely serves as an
 	#	abstraction for a single arc in a digraph of tracking record
 	#	relationships.  Each object stores a "from node" and a "to node"
-	#	which may be retrieved.
+	#	which may be retrieved.  We use __slots__ so that each Arc is
+	#	just the two references, without an instance dictionary.
 	# Methods:
 	#	__init__ (self, from node, to node)
 	#	getFromNode (self)
 	#	getToNode (self)
 
+	__slots__ = ('from_node', 'to_node')
 
 	def __init__ (self,
 		from_node,	# integer node number for arc's origin
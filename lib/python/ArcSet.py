@@ -5,7 +5,6 @@
 # Purpose:	implements the ArcSet class for WTS
 
 import Arc
-import Set
 
 class ArcSet:
 	# Concept:
@@ -23,21 +22,27 @@ class ArcSet:
 	#	that it happens fairly quickly.  To this end, we do not store
 	#	a list of Arcs (which would involve an expensive list traversal
 	#	for each Arc existence check).  We set up a dictionary which is
-	#	keyed using the "from node" of each arc to reference a Set of
-	#	the "to nodes".  Thus, for a given Arc existence check, we can
-	#	use the "from node" (in a single memory access) to weed out
-	#	all arcs that do not begin at that node.  The efficiency in
-	#	looking at the Set of "to nodes" then depends on the
-	#	implementation of a Set object, though it should be no worse
-	#	than a list traversal on this much smaller set of items.
+	#	keyed using the "from node" of each arc to reference a builtin
+	#	set of the "to nodes".  Thus, for a given Arc existence check,
+	#	we can use the "from node" (in a single memory access) to weed
+	#	out all arcs that do not begin at that node, and then check the
+	#	"to node" with one more hash lookup.  We do not keep the Arc
+	#	objects themselves; the "Pair" methods work with (from node,
+	#	to node) tuples, so hot loops need not create Arcs at all.
 	# Methods:
 	#	__init__ (self, optional list of Arcs)
 	#	addArcs (self, list of Arcs)
 	#	addArc (self, Arc)
+	#	addPair (self, from node, to node)
+	#	addPairsFrom (self, from node, to nodes)
 	#	exists (self, Arc)
+	#	existsPair (self, from node, to node)
 	#	removeArcs (self, list of Arcs)
 	#	removeArc (self, Arc)
 	#	getArcs (self)
+	#	getPairs (self)
+	#	difference (self, ArcSet)
+	#	count (self)
 
 	def __init__ (self,
 		arcs = []	# optional list of Arc objects to add to this
@@ -51,7 +56,7 @@ class ArcSet:
 		#	which were passed in the parameter.
 		# Throws: nothing
 
-		self.arcs = {}		# arcs [from node] = Set of to_nodes,
+		self.arcs = {}		# arcs [from node] = set of to_nodes,
 					# further described in class comments
 		self.addArcs (arcs)
 		return
@@ -78,17 +83,45 @@ class ArcSet:
 		# Effects: see Purpose.  updates the dictionary of arcs
 		# Throws: nothing
 
-		to_node = arc.getToNode ()	# arc's destination node
-		from_node = arc.getFromNode ()	# arc's origin node
+		self.addPair (arc.getFromNode (), arc.getToNode ())
+		return
+
+	def addPair (self,
+		from_node,	# integer; origin node of the arc to add
+		to_node		# integer; destination node of the arc to add
+		):
+		# Purpose: adds a single arc to this ArcSet object, without
+		#	needing an Arc object
+		# Returns: nothing
+		# Assumes: nothing
+		# Effects: see Purpose.  updates the dictionary of arcs
+		# Throws: nothing
 
 		# if there are not yet any arcs originating with this from_node,
 		# then we need to create a new entry with a new set of to_nodes
 
 		if not self.arcs.has_key (from_node):
-			self.arcs [from_node] = Set.Set ()
+			self.arcs [from_node] = set ()
 		self.arcs [from_node].add (to_node)
 		return
 
+	def addPairsFrom (self,
+		from_node,	# integer; origin node of the arcs to add
+		to_nodes	# iterable of integers; destination nodes
+		):
+		# Purpose: adds an arc from "from_node" to each of "to_nodes"
+		# Returns: nothing
+		# Assumes: nothing
+		# Effects: see Purpose.  updates the dictionary of arcs
+		# Throws: nothing
+
+		if not self.arcs.has_key (from_node):
+			self.arcs [from_node] = set ()
+		self.arcs [from_node].update (to_nodes)
+		if not self.arcs [from_node]:
+			del self.arcs [from_node]
+		return
+
 	def exists (self,
 		arc		# Arc object to look for in this ArcSet object
 		):
@@ -99,14 +132,25 @@ class ArcSet:
 		# Effects: see Purpose
 		# Throws: nothing
 
-		to_node = arc.getToNode ()	# destination node of arc
-		from_node = arc.getFromNode ()	# origin node of arc
-		
+		return self.existsPair (arc.getFromNode (), arc.getToNode ())
+
+	def existsPair (self,
+		from_node,	# integer; origin node of the arc to look for
+		to_node		# integer; destination node of the arc
+		):
+		# Purpose: return a boolean (0/1) indicating whether there is
+		#	an arc from "from_node" to "to_node" in this ArcSet (1)
+		#	or not (0)
+		# Returns: see Purpose.
+		# Assumes: nothing
+		# Effects: see Purpose
+		# Throws: nothing
+
 		# first, see if any arcs start at this from_node.  If so, then
 		# see if any of them go to the to_node.
 
 		if self.arcs.has_key (from_node):
-			if self.arcs [from_node].contains (to_node):
+			if to_node in self.arcs [from_node]:
 				return 1
 		return 0
 
@@ -142,8 +186,8 @@ class ArcSet:
 		# entry for from_node.
 
 		if self.arcs.has_key (from_node):
-			self.arcs [from_node].remove (to_node)
-			if self.arcs [from_node].empty():
+			self.arcs [from_node].discard (to_node)
+			if not self.arcs [from_node]:
 				del self.arcs [from_node]
 		return
 
@@ -160,6 +204,53 @@ class ArcSet:
 		# to "arcs") an Arc from it to each of its to_nodes.
 
 		for from_node in self.arcs.keys ():
-			for to_node in self.arcs [from_node].values ():
+			for to_node in self.arcs [from_node]:
 				arcs.append (Arc.Arc (from_node, to_node))
 		return arcs
+
+	def getPairs (self):
+		# Purpose: return a list of the arcs in this ArcSet, without
+		#	creating Arc objects for them
+		# Returns: list of (from node, to node) tuples
+		# Assumes: nothing
+		# Effects: see Purpose.
+		# Throws: nothing
+
+		pairs = []
+		for (from_node, to_nodes) in self.arcs.items ():
+			for to_node in to_nodes:
+				pairs.append ( (from_node, to_node) )
+		return pairs
+
+	def difference (self,
+		arc_set		# ArcSet to use for self - arc_set
+		):
+		# Purpose: return an ArcSet of the arcs in self which are not
+		#	in "arc_set"
+		# Returns: see Purpose.
+		# Assumes: "arc_set" is an ArcSet
+		# Effects: builds a new ArcSet, comparing the set of to_nodes
+		#	for each from_node all at once
+		# Throws: nothing
+
+		result = ArcSet ()
+		for (from_node, to_nodes) in self.arcs.items ():
+			if arc_set.arcs.has_key (from_node):
+				to_nodes = to_nodes - arc_set.arcs [from_node]
+			else:
+				to_nodes = set (to_nodes)
+			if to_nodes:
+				result.arcs [from_node] = to_nodes
+		return result
+
+	def count (self):
+		# Purpose: see how many arcs are in this ArcSet
+		# Returns: integer number of arcs
+		# Assumes: nothing
+		# Effects: nothing
+		# Throws: nothing
+
+		total = 0
+		for to_nodes in self.arcs.values ():
+			total = total + len (to_nodes)
+		return total
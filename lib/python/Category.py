@@ -12,9 +12,10 @@ import Set
 import regex
 
 # ---------- globals: ----------
-						# get cntrl vocab objects for:
-STAFF_CV = Controlled_Vocab.cv ['CV_Staff']		# staff members
-CATEGORY_CV = Controlled_Vocab.cv ['CV_WTS_Category']	# categories
+						# cntrl vocab objects (loaded
+						# on first use) for:
+STAFF_CV = Controlled_Vocab.vocab ('CV_Staff')		# staff members
+CATEGORY_CV = Controlled_Vocab.vocab ('CV_WTS_Category')	# categories
 
 TRUE = 1
 FALSE = 0
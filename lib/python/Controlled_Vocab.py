@@ -4,14 +4,22 @@
 # Purpose: implements the Controlled_Vocab class for WTS, a class which provides
 #	a standard mechanism for working with controlled vocabulary fields.
 # On Import, this is what happens...
-#	initializes a global dictionary named 'cv' which is accessible by other
-#	modules.  Its keys are the names of the WTS controlled vocabulary
-#	tables.  The values stored in the dictionary are Controlled_Vocab
-#	objects.  (This arrangement allows all the controlled vocabularies to be
-#	loaded once.  Each module doesn't need to load its own copies as needed.
-#	And, multiple modules can share a single copy)  Thus, we can look up the
-#	key for 'Small' in the Size controlled vocabulary table by using:
+#	initializes a global dictionary-like object named 'cv' which is
+#	accessible by other modules.  Its keys are the names of the WTS
+#	controlled vocabulary tables.  The values stored in it are
+#	Controlled_Vocab objects, each loaded on first access, so a module
+#	pays only for the vocabularies it actually uses.  (This arrangement
+#	allows all the controlled vocabularies to be loaded once.  Each module
+#	doesn't need to load its own copies as needed.  And, multiple modules
+#	can share a single copy)  Thus, we can look up the key for 'Small' in
+#	the Size controlled vocabulary table by using:
 #		Controlled_Vocab.cv ['CV_WTS_Size']['Small']
+#	The vocabularies come from a snapshot file shared by all WTS processes
+#	(see load_Controlled_Vocabs), so a normal request does not need to
+#	query the database for them at all.  The snapshot is tagged with a
+#	version counter, which table_edit.cgi bumps whenever it saves a change
+#	to a CV table; a snapshot with a stale version is rebuilt from the
+#	database by the first process to notice.
 # Assumptions:
 #	* REMOTE_USER environment variable identifies the current user
 #	* ConfigurationWrapper has been imported
@@ -33,15 +41,21 @@
 # Functions:
 #	getCVtables (table name)
 #	get_Controlled_Vocabs (table names)
+#	get_CV_Version ()
+#	bump_CV_Version ()
+#	load_Controlled_Vocabs (table names)
+#	vocab (table name)
 #	self_test ()
 
 import os
 import copy
+import marshal
 import ConfigurationWrapper
 import wtslib
 import string
 import screenlib
 import HTMLgen
+import WriteLock
 
 config = ConfigurationWrapper.ConfigurationWrapper()
 
@@ -69,7 +83,7 @@ class Controlled_Vocab:
 	#		and validate a string of comma-separated string names.
 	# Implementation:
 	#	Methods:
-	#		__init__ (table name)
+	#		__init__ (table name, cached state)
 	#		__getitem__ (item name)
 	#               keyToName (key)
 	#		default_key ()
@@ -78,14 +92,18 @@ class Controlled_Vocab:
 	#		ordered_map ()
 	#		ordered_names ()
 	#		validate (string of string names)
+	#		cache_State ()
 
 	def __init__ (self,
-		table_name	# name of the controlled vocabulary table (in
+		table_name,	# name of the controlled vocabulary table (in
 				# the database) which this Controlled_Vocab
 				# object represents
+		state = None	# dictionary; state of this vocabulary as
+				# returned by cache_State(), if we have it
+				# from the shared cache
 		):
 		# Purpose: create a new Controlled_Vocab object and load its
-		#	corresponding info from the database
+		#	corresponding info from the database (or from 'state')
 		# Returns: nothing
 		# Assumes: db's SQL routines have been initialized, and
 		#	that the REMOTE_USER environment variable has been
@@ -101,6 +119,16 @@ class Controlled_Vocab:
 		#	executing the database queries
 		# Example: CV = Controlled_Vocab ('CV_WTS_Size')
 
+		# if we were given a cached state, then we just take it over.
+		# The CV_Staff default is the current user, which is specific
+		# to this process, so it is never taken from the cache.
+
+		if state is not None:
+			self.__dict__.update (state)
+			if table_name.lower() == 'cv_staff':
+				self.def_key = os.environ ['REMOTE_USER']
+			return
+
 		# prepare a query to load in the information for the
 		# specified controlled vocabulary.  Provide special handling
 		# for CV_Staff, since it has a non-standard ordering and a
@@ -383,6 +411,23 @@ class Controlled_Vocab:
 			active = active + [ '----------' ] + retired
 		return active
 
+
+	def cache_State (self):
+		# Purpose: get this object's state for the shared CV cache
+		# Returns: dictionary mapping attribute name to value, suitable
+		#	for passing to the constructor as 'state'
+		# Assumes: nothing
+		# Effects: computes all of the pre-computed lookups (the two
+		#	dictionaries and the two ordered lists of names), so
+		#	that processes using the cache need not build them
+		# Throws: nothing
+
+		self.name_dict ()
+		self.key_dict ()
+		self.ordered_names (0)
+		self.ordered_names (1)
+		return copy.copy (self.__dict__)
+
 ### End of Class: Controlled_Vocab ###
 
 #-MODULE FUNCTIONS-------------------------------------------------
@@ -506,23 +551,248 @@ def get_Controlled_Vocabs (
 
 	dict = {}
 
-	# this should probably be speeded up by doing all the queries in
-	# one batch, rather than a sequence of independent ones.  If it does
-	# not turn out to be a real bottleneck, though, let's wait for now.
+	# Most processes get their vocabularies from the shared cache via
+	# load_Controlled_Vocabs(), so this only runs when it is rebuilt.
 
 	for table_name in table_names:
 		dict [table_name] = Controlled_Vocab (table_name)
 	return dict
 
 
+#-SHARED CONTROLLED VOCABULARY CACHE---------------------------------------
+
+# names of the controlled vocabulary tables kept in the shared cache
+
+CV_TABLES = [ 'CV_WTS_Area', 'CV_WTS_Type', 'CV_Staff', 'CV_WTS_Size',
+	'CV_WTS_Status', 'CV_WTS_Priority', 'CV_WTS_Category' ]
+
+cv_states = None	# dict; table name -> cached state, once this process
+			# has read (or rebuilt) the snapshot
+
+def cache_Path ():
+	# Purpose: get the path to the shared CV cache file
+	# Returns: string; the CV_CACHE parameter from the config file, or
+	#	wts.cv.cache in DIAG_DIR if that is not defined
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: The version counter lives beside it, in a file with the same
+	#	name plus '.version'.
+
+	return wtslib.fileConfig ('CV_CACHE', os.path.join (
+		wtslib.fileConfig ('DIAG_DIR', '.'), 'wts.cv.cache'))
+
+def write_File (
+	path,		# string; path to the file to write
+	contents	# string; new contents for the file
+	):
+	# Purpose: replace the file at 'path' with 'contents' in one step, so
+	#	that other processes never see a partially written file
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: writes a temporary file and renames it to 'path'
+	# Throws: propagates IOError or OSError if we cannot write the file
+
+	temp_path = '%s.%d' % (path, os.getpid ())
+	fp = open (temp_path, 'wb')
+	fp.write (contents)
+	fp.close ()
+	os.rename (temp_path, path)
+	return
+
+def get_CV_Version ():
+	# Purpose: get the current version of the controlled vocabularies
+	# Returns: integer; 0 if no CV table has been edited since the counter
+	#	was created
+	# Assumes: nothing
+	# Effects: reads the version counter file
+	# Throws: nothing
+
+	try:
+		fp = open (cache_Path () + '.version', 'r')
+		version = string.atoi (string.strip (fp.read ()))
+		fp.close ()
+	except (IOError, ValueError):
+		version = 0
+	return version
+
+def bump_CV_Version ():
+	# Purpose: note that a controlled vocabulary table has changed, so that
+	#	every process reloads the vocabularies from the database
+	# Returns: nothing
+	# Assumes: we can write to the directory containing the cache
+	# Effects: increments the version counter, which marks the current
+	#	cache snapshot as stale
+	# Throws: IOError if we cannot lock the counter within 5 seconds;
+	#	propagates IOError or OSError if we cannot write it
+	# Notes: Two edits saved at once must each bump the counter.  If both
+	#	read the same old value, the second bump would be lost, and a
+	#	snapshot taken between the two edits would look current.  So,
+	#	we hold a WriteLock on the counter while reading and writing.
+
+	path = cache_Path () + '.version'
+	padlock = WriteLock.WriteLock (path + '.lock')
+	if not padlock.lock ():
+		raise IOError, 'Cannot lock CV version counter %s' % path
+	try:
+		write_File (path, '%d\n' % (get_CV_Version () + 1))
+	finally:
+		padlock.unlock ()
+	return
+
+def load_Controlled_Vocabs (
+	table_names	# list of strings, each of which is the name of a
+			# controlled vocabulary table in CV_TABLES
+	):
+	# Purpose: get a dictionary which maps each table name to its
+	#	Controlled_Vocab object, using the shared cache where we can
+	# Returns: return the dictionary described in Purpose
+	# Assumes: each string in "table_names" is in CV_TABLES
+	# Effects: If the cache snapshot is missing or its version does not
+	#	match the current version counter, we load all of CV_TABLES
+	#	from the database and write a new snapshot.  Otherwise, we make
+	#	no database queries at all.
+	# Throws: propagates wtslib.sqlError if there is a problem in
+	#	executing the database queries
+	# Notes: A failure to read or write the cache is not an error; we
+	#	just fall back on the database.  The snapshot is only read
+	#	once per process.  It is stored with marshal rather than
+	#	pickle, since the cache directory is group-writable and a
+	#	state holds only lists, dictionaries, strings, and integers.
+
+	global cv_states
+
+	if cv_states is not None:
+		dict = {}
+		for table_name in table_names:
+			dict [table_name] = Controlled_Vocab (table_name,
+				cv_states [table_name])
+		return dict
+
+	version = get_CV_Version ()
+	states = None		# dict; table name -> cached state
+
+	try:
+		fp = open (cache_Path (), 'rb')
+		(cached_version, cached_states) = marshal.loads (fp.read ())
+		fp.close ()
+		if cached_version == version:
+			states = cached_states
+			for table_name in table_names:
+				if not states.has_key (table_name):
+					states = None	# older snapshot
+					break
+	except:
+		pass		# missing or unreadable -- rebuild it
+
+	if states is None:
+		states = {}
+		for (table_name, vocab) in get_Controlled_Vocabs (
+				CV_TABLES).items ():
+			states [table_name] = vocab.cache_State ()
+		try:
+			write_File (cache_Path (), marshal.dumps (
+				(version, states)))
+		except (IOError, OSError, ValueError):
+			pass
+
+	cv_states = states
+	return load_Controlled_Vocabs (table_names)
+
+
+#-LAZY ACCESS TO CONTROLLED VOCABULARIES------------------------------------
+
+class Lazy_CV_Dict:
+	# Concept:
+	#	IS: a dictionary of Controlled_Vocab objects, keyed by table
+	#		name, which loads each one on first access
+	#	HAS: the Controlled_Vocab objects loaded so far
+	#	DOES: looks up a Controlled_Vocab object by its table name,
+	#		loading it via load_Controlled_Vocabs() if needed
+	# Implementation:
+	#	Methods:
+	#		__init__ ()
+	#		__getitem__ (table name)
+	#		has_key (table name)
+	#		keys ()
+
+	def __init__ (self):
+		self.loaded = {}	# table name -> Controlled_Vocab object
+		return
+
+	def __getitem__ (self,
+		table_name	# string; name of the controlled vocabulary
+		):
+		# Purpose: get the Controlled_Vocab object for 'table_name'
+		# Returns: a Controlled_Vocab object
+		# Assumes: nothing
+		# Effects: loads the vocabulary, if not already loaded
+		# Throws: KeyError if 'table_name' is not in CV_TABLES;
+		#	propagates wtslib.sqlError if there is a problem in
+		#	executing the database queries
+
+		if not self.loaded.has_key (table_name):
+			if table_name not in CV_TABLES:
+				raise KeyError, table_name
+			self.loaded.update (load_Controlled_Vocabs (
+				[ table_name ]))
+		return self.loaded [table_name]
+
+	def has_key (self,
+		table_name	# string; name of the controlled vocabulary
+		):
+		return table_name in CV_TABLES
+
+	def keys (self):
+		return CV_TABLES[:]
+
+### End of Class: Lazy_CV_Dict ###
+
+class Lazy_Vocab:
+	# Concept:
+	#	IS: a stand-in for one Controlled_Vocab object in 'cv', for
+	#		use as a module-level global
+	#	HAS: the name of the controlled vocabulary table
+	#	DOES: passes each method call or lookup along to cv [table
+	#		name], so that the vocabulary is not loaded until the
+	#		stand-in is first used
+
+	def __init__ (self,
+		table_name	# string; name of the controlled vocabulary
+		):
+		self.table_name = table_name
+		return
+
+	def __getattr__ (self, name):
+		return getattr (cv [self.table_name], name)
+
+	def __getitem__ (self, item):
+		return cv [self.table_name][item]
+
+### End of Class: Lazy_Vocab ###
+
+def vocab (
+	table_name	# string; name of the controlled vocabulary table
+	):
+	# Purpose: get a stand-in for cv [table_name] which does not load the
+	#	vocabulary until it is used
+	# Returns: a Lazy_Vocab object
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Example: STAFF_CV = Controlled_Vocab.vocab ('CV_Staff')
+
+	return Lazy_Vocab (table_name)
+
+
 #-GLOBALLY AVAILABLE CONTROLLED VOCABULARY INFO-----------------------------
 
-# The dictionary "cv" will contain a mapping from each controlled vocabulary
+# The object "cv" will contain a mapping from each controlled vocabulary
 # table name to its associated Controlled_Vocab object.  This will be global
-# and can be accessed by other modules importing this one.
+# and can be accessed by other modules importing this one.  Nothing is loaded
+# until a vocabulary is first looked up.
 
-cv = get_Controlled_Vocabs ( [ 'CV_WTS_Area', 'CV_WTS_Type', 'CV_Staff', \
-	'CV_WTS_Size', 'CV_WTS_Status', 'CV_WTS_Priority', 'CV_WTS_Category' ] )
+cv = Lazy_CV_Dict ()
 
 
 #-SELF TESTING CODE---------------------------------------------------------
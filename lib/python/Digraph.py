@@ -9,6 +9,7 @@
 import ArcSet
 import Arc
 import Set
+import wtslib
 import copy
 
 import sys
@@ -18,6 +19,16 @@ import sys
 TRUE = 1
 FALSE = 0
 
+# engines for computing the transitive closure (see getTransitiveClosure):
+#	SCC_ENGINE = sparse and iterative; condenses strongly connected
+#		components (cycles), so it copes with any digraph
+#	DAG_ENGINE = the original depth-first algorithm; needs an acyclic
+#		digraph and a list as long as the highest node number
+
+SCC_ENGINE = 'scc'
+DAG_ENGINE = 'dag'
+DEFAULT_ENGINE = SCC_ENGINE
+
 # When discussing the transitive closure, there are really two notions to
 # resolve.  Consider the following Digraph with arcs:
 #	Arc (1,2), Arc (2,3), Arc (3,4), and Arc (4,5)
@@ -59,9 +70,11 @@ class Digraph:
 	#	a boolean flag lets us know when the current transitive
 	#	closure is out-of-date (due to the addition or deletion of an
 	#	Arc or node from the Digraph), and another boolean flag tells
-	#	us whether we have found a cycle in the Digraph or not.
+	#	us whether we have found a cycle in the Digraph or not.  It
+	#	also remembers which engine computes its transitive closure,
+	#	and the cycles found by the last computation.
 	# Methods:
-	#	__init__ (self, optional ArcSet)
+	#	__init__ (self, optional ArcSet, optional engine)
 	#	addArcs (self, ArcSet)
 	#	addArc (self, Arc)
 	#	addNodes (self, *nodes)
@@ -71,10 +84,14 @@ class Digraph:
 	#	getArcs (self)
 	#	getNodes (self)
 	#	getTransitiveClosure (self)
+	#	getCycles (self)
 
 	def __init__ (self,
-		arc_set = None	# optional ArcSet object which contains the
+		arc_set = None,	# optional ArcSet object which contains the
 				# initial set of Arcs for the Digraph
+		engine = None	# optional; SCC_ENGINE or DAG_ENGINE, to pick
+				# how we compute the transitive closure.
+				# Defaults to DEFAULT_ENGINE.
 		):
 		# Purpose: initialize this Digraph object to be empty and then,
 		#	if specified, add the given arc_set
@@ -89,6 +106,11 @@ class Digraph:
 		self.arcs = ArcSet.ArcSet ()	# set of Arcs in the Digraph
 		self.nodes = Set.Set ()		# set of nodes in the Digraph
 		self.hasCycle = FALSE		# no cycles found yet
+		self.cycles = []		# list of cycles (each a list
+						# of nodes) found so far
+		if engine is None:
+			engine = DEFAULT_ENGINE
+		self.engine = engine		# how to compute the closure
 
 		# now, if an initial ArcSet was specified, then add it to the
 		# Digraph
@@ -109,8 +131,10 @@ class Digraph:
 		#	closure is out of date)
 		# Throws: nothing
 
-		for arc in arc_set.getArcs ():
-			self.addArc (arc)
+		for (from_node, to_node) in arc_set.getPairs ():
+			self.arcs.addPair (from_node, to_node)
+			self.nodes.add (from_node, to_node)
+		self.changed = TRUE		# the Digraph has changed
 		return
 
 	def addArc (self,
@@ -224,12 +248,27 @@ class Digraph:
 		return self.nodes.values ()
 
 
+	def getCycles (self):
+		# Purpose: return the cycles in this Digraph
+		# Returns: a list of cycles, each of which is a sorted list of
+		#	the nodes in one strongly connected component with more
+		#	than one node (or a node with an Arc to itself)
+		# Assumes: nothing
+		# Effects: computes the transitive closure, if needed.  Also
+		#	sets self.hasCycle.
+		# Throws: nothing
+		# Notes: Cycles are only found by the SCC_ENGINE.
+
+		self.getTransitiveClosure ()
+		return self.cycles
+
 	def getTransitiveClosure (self):
 		# Purpose: return an ArcSet containing Arcs in the transitive
 		#	closure of this Digraph
 		# Returns: see Purpose
-		# Assumes: The Digraph is acyclic.  Otherwise, this method will
-		#	yield incorrect results.
+		# Assumes: If we are using the DAG_ENGINE, the Digraph is
+		#	acyclic.  Otherwise, this method will yield incorrect
+		#	results.  The SCC_ENGINE handles cycles.
 		# Effects: Since the transitive closure can be an expensive
 		#	operation, we don't want to compute it any more often
 		#	than we have to.  First, we check to see if the Digraph
@@ -251,6 +290,9 @@ class Digraph:
 		if self.changed == FALSE:
 			return self.closure
 
+		if self.engine == SCC_ENGINE:
+			return self.getSparseClosure ()
+
 		# Otherwise, we need to go about analyzing the nodes and arcs
 		# to construct a performance-optimized representation of this
 		# digraph...
@@ -310,9 +352,224 @@ class Digraph:
 		self.changed = FALSE		# no changes since recompute
 		return closure
 
+	def getSparseClosure (self):	### internal only ###
+		# Purpose: compute the transitive closure with sccClosure()
+		# Returns: an ArcSet containing Arcs in the transitive closure
+		#	of this Digraph
+		# Assumes: nothing
+		# Effects: stores the closure, and notes any cycles in
+		#	self.hasCycle and self.cycles
+		# Throws: nothing
+
+		# children [i] = [ nodes reached by an arc from node i ]
+
+		children = {}
+		for node in self.nodes.values ():
+			children [node] = []
+		for (aFrom, aTo) in self.arcs.getPairs ():
+			children [aFrom].append (aTo)
+
+		dict_closure, self.cycles = sccClosure (children)
+		self.hasCycle = (len (self.cycles) > 0)
+
+		closure = ArcSet.ArcSet ()
+		for aFrom in dict_closure.keys ():
+			closure.addPairsFrom (aFrom, dict_closure [aFrom])
+
+		self.closure = closure		# preserve it
+		self.changed = FALSE		# no changes since recompute
+		return closure
+
 
 # Supporting Functions: -------------------------------------------------
 
+def stronglyConnected (
+	children	# dictionary; maps each node in the digraph to a list
+			# of the nodes reached by an arc from it
+	):
+	# Purpose: find the strongly connected components of the given digraph
+	# Returns: a list of components, each a list of the nodes in it.  Each
+	#	component comes after all the components it reaches (so the
+	#	list is in reverse topological order).
+	# Assumes: every node reached by an arc is a key in "children"
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: We use Tarjan's algorithm, with an explicit stack rather
+	#	than recursion so long chains cannot hit the recursion limit.
+	#	It runs in time linear in the number of nodes and arcs.
+
+	index = {}		# node -> order in which we first saw it
+	low = {}		# node -> lowest index reachable from its subtree
+	on_stack = {}		# nodes in 'stack', for quick lookup
+	stack = []		# nodes not yet assigned to a component
+	components = []		# list of components found so far
+
+	for root in children.keys ():
+		if index.has_key (root):
+			continue
+
+		# each entry in 'work' is (node, index of next child to visit)
+
+		work = [ (root, 0) ]
+		while work:
+			node, i = work[-1]
+			if i == 0:
+				index [node] = low [node] = len (index)
+				stack.append (node)
+				on_stack [node] = 1
+
+			kids = children [node]
+			if i < len (kids):
+				work[-1] = (node, i + 1)
+				kid = kids[i]
+				if not index.has_key (kid):
+					work.append ( (kid, 0) )
+				elif on_stack.has_key (kid):
+					low [node] = min (low [node], index [kid])
+				continue
+
+			# we have visited all of node's children
+
+			work.pop ()
+			if work:
+				parent = work[-1][0]
+				low [parent] = min (low [parent], low [node])
+
+			if low [node] != index [node]:
+				continue
+
+			# node is the root of a component; pop its members
+
+			members = []
+			while 1:
+				member = stack.pop ()
+				del on_stack [member]
+				members.append (member)
+				if member == node:
+					break
+			components.append (members)
+	return components
+
+
+def isCycle (
+	children,	# dictionary; maps each node in the digraph to a list
+			# of the nodes reached by an arc from it
+	members		# list of nodes in one strongly connected component
+	):
+	# Purpose: determine whether a strongly connected component is a cycle
+	# Returns: boolean; TRUE if it has more than one node, or if its one
+	#	node has an arc to itself
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	if len (members) > 1:
+		return TRUE
+	return (members[0] in children [members[0]])
+
+
+def sccClosure (
+	children	# dictionary; maps each node in the digraph to a list
+			# of the nodes reached by an arc from it
+	):
+	# Purpose: build the full transitive closure for the given digraph,
+	#	which may contain cycles
+	# Returns: a tuple with two items: first, a dictionary which maps each
+	#	node to the set of nodes reachable from it (including itself);
+	#	and second, a list of the cycles found, each a sorted list of
+	#	nodes
+	# Assumes: every node reached by an arc is a key in "children"
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: stronglyConnected() gives each component after all the
+	#	components it reaches, so one pass can build each component's
+	#	reachable set from those of its children.  All nodes in a
+	#	component reach the same nodes, so they share one set.  Storage
+	#	is in proportion to the nodes and arcs present, not to the
+	#	highest node number.
+
+	closure = {}		# node -> set of nodes reachable from it
+	cycles = []		# list of cycles found
+
+	for members in stronglyConnected (children):
+		reach = set (members)
+		for member in members:
+			for kid in children [member]:
+				if closure.has_key (kid):
+					reach.update (closure [kid])
+		for member in members:
+			closure [member] = reach
+
+		if isCycle (children, members):
+			members.sort ()
+			cycles.append (members)
+	return closure, cycles
+
+
+def longestChains (
+	children,	# dictionary; maps each node in the digraph to a list
+			# of the nodes reached by an arc from it
+	count = 1	# integer; number of chains to return
+	):
+	# Purpose: find the longest chains of arcs in the given digraph
+	# Returns: a list of up to "count" chains, longest first.  Each chain
+	#	is a list of strongly connected components (each a sorted list
+	#	of nodes) which starts at a component with no incoming arcs and
+	#	follows arcs as far as possible.
+	# Assumes: every node reached by an arc is a key in "children"
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: The length of a chain is the number of nodes in it, where a
+	#	cycle counts all of its nodes.  We condense cycles into single
+	#	components, then find the longest path from each component in
+	#	one pass over them in reverse topological order.  This takes
+	#	time linear in the number of nodes and arcs.
+
+	components = stronglyConnected (children)
+
+	component_of = {}	# node -> index of its component
+	for i in range (0, len (components)):
+		for member in components[i]:
+			component_of [member] = i
+
+	length = {}		# component index -> length of its longest chain
+	next = {}		# component index -> next component on it
+	has_parent = {}		# component indexes with incoming arcs
+
+	for i in range (0, len (components)):
+		length [i] = len (components[i])
+		next [i] = None
+		for member in components[i]:
+			for kid in children [member]:
+				j = component_of [kid]
+				if j == i:
+					continue
+				has_parent [j] = 1
+				if length [j] + len (components[i]) > length [i]:
+					length [i] = length [j] + \
+						len (components[i])
+					next [i] = j
+
+	# rank the components with no incoming arcs by their chain lengths
+
+	starts = []
+	for i in range (0, len (components)):
+		if not has_parent.has_key (i):
+			starts.append ( (-length [i], min (components[i]), i) )
+	starts.sort ()
+
+	chains = []
+	for (ignore, ignore, i) in starts [:count]:
+		chain = []
+		while i is not None:
+			members = components[i][:]
+			members.sort ()
+			chain.append (members)
+			i = next [i]
+		chains.append (chain)
+	return chains
+
+
 def tc (
 	dag	# a digraph, represented as a list of lists, where:
 		#	dag[0] = [ nodes with no incoming arcs ]
@@ -472,3 +729,84 @@ def getClosure (
 #			self.closure.addArc (Arc.Arc (node, node))
 #		return
 
+#-SELF TESTING CODE---------------------------------------------------------
+
+def self_test ():
+	# Purpose: test the transitive closure engines of this module
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: builds several small Digraphs, computes their transitive
+	#	closures and cycles, and sends to stdout a line for each check
+	#	saying whether it matched the expected results
+	# Throws: nothing
+
+	check = wtslib.check_Result
+
+	def closurePairs (
+		arcs,		# list of (from node, to node) tuples
+		engine		# SCC_ENGINE or DAG_ENGINE
+		):
+		arc_set = ArcSet.ArcSet ()
+		for (aFrom, aTo) in arcs:
+			arc_set.addPair (aFrom, aTo)
+		closure = Digraph (arc_set, engine).getTransitiveClosure ()
+		pairs = closure.getPairs ()
+		pairs.sort ()
+		return pairs
+
+	# the example at the top of this module, plus a shortcut (2,4):
+	# every node reaches itself and each node after it
+
+	chain = [ (1,2), (2,3), (3,4), (4,5), (2,4) ]
+	expected = []
+	for i in range (1, 6):
+		for j in range (i, 6):
+			expected.append ( (i, j) )
+	check ('SCC engine, acyclic digraph',
+		closurePairs (chain, SCC_ENGINE), expected)
+	check ('DAG engine, acyclic digraph',
+		closurePairs (chain, DAG_ENGINE), expected)
+
+	# a cycle (1,2,3) leading out to 4, and a node (5) with an arc to
+	# itself.  All nodes in the cycle reach each other and 4.
+
+	cyclic = [ (1,2), (2,3), (3,1), (3,4), (5,5) ]
+	expected = []
+	for i in [ 1, 2, 3 ]:
+		for j in [ 1, 2, 3, 4 ]:
+			expected.append ( (i, j) )
+	expected = expected + [ (4,4), (5,5) ]
+	check ('SCC engine, digraph with cycles',
+		closurePairs (cyclic, SCC_ENGINE), expected)
+
+	arc_set = ArcSet.ArcSet ()
+	for (aFrom, aTo) in cyclic:
+		arc_set.addPair (aFrom, aTo)
+	check ('cycles found', Digraph (arc_set).getCycles (),
+		[ [1, 2, 3], [5] ])
+	check ('no cycles found in acyclic digraph',
+		Digraph (ArcSet.ArcSet ()).getCycles (), [])
+
+	# components come after the ones they reach, and a long chain must
+	# not hit the recursion limit
+
+	children = { 1 : [2], 2 : [3], 3 : [2, 4], 4 : [] }
+	components = stronglyConnected (children)
+	for component in components:
+		component.sort ()
+	check ('strongly connected components, in reverse topological order',
+		components, [ [4], [2, 3], [1] ])
+
+	length = sys.getrecursionlimit () * 2
+	children = {}
+	for i in range (0, length):
+		children [i] = [ i + 1 ]
+	children [length] = []
+	check ('strongly connected components of a long chain',
+		len (stronglyConnected (children)), length + 1)
+	check ('longest chain', len (longestChains (children) [0]), length + 1)
+	return
+
+
+if __name__ == '__main__':		# if executed from command line,
+	self_test()			# do a self test
@@ -6,12 +6,8 @@
 #		mathematical set, with the common operations associated with a
 #		set.  (union, intersection, difference, etc.)
 
-import copy
 import types
-
-IN_SET = 1	# global flag used to indicate that an item is in the Set.
-		# (Since our items are keys in a dictionary, IN_SET will be
-		# the dictionary value referenced by each.)
+import string
 
 class Set:
 	# Concept:
@@ -26,10 +22,15 @@ class Set:
 	#		testing for membership, equality, and superset and
 	#		subset relationships.
 	# Implementation:
-	#	The Set object stores its items as the keys in a dictionary for
-	#	quick lookups.  This also ensures that we have, at most, one
-	#	copy of each item in the Set.  Instance variables include:
-	#		elements - the above-mentioned dictionary of items
+	#	The Set object stores its items in a builtin set, so lookups
+	#	and the set operations run in C rather than in Python loops.
+	#	This also ensures that we have, at most, one copy of each item
+	#	in the Set.  Cloning is copy-on-write: the clone shares its
+	#	builtin set with the original until either one is changed.
+	#	Instance variables include:
+	#		elements - the above-mentioned builtin set of items
+	#		shared - boolean; might 'elements' be shared with
+	#			another Set?
 	# Methods:
 	#	__init__ (self, *val)	intersection (self, S)
 	#	__str__ (self)		union (self, S)
@@ -40,6 +41,7 @@ class Set:
 	#	empty (self)		clone (self)
 	#	containsAll (self, *val)
 	#	count (self)
+	#	own (self)		(internal use only)
 
 	def __init__ (self,
 		*val		# initial items to put in the Set
@@ -52,9 +54,8 @@ class Set:
 		#	any items from val to it.
 		# Throws: nothing
 
-		self.elements = {}
-		for item in val:
-			self.add (item)
+		self.elements = set (val)
+		self.shared = 0
 		return
 
 	def __str__ (self):
@@ -64,11 +65,7 @@ class Set:
 		# Effects: see Purpose
 		# Throws: nothing
 
-		s = ''					# string we're building
-		for item in self.elements.keys ():	# concatenate the string
-			s = s + ', ' + str (item)	# rep of each item to s
-		return '%s' % s[2:]			# skip the leading
-							# comma and space
+		return string.join (map (str, self.elements), ', ')
 
 	def add (self,
 		*val		# items to add to the Set
@@ -80,18 +77,37 @@ class Set:
 		# Effects: go through items in val, and add each to the Set.
 		# Throws: nothing
 
-		for item in val:
-			self.elements [item] = IN_SET
+		self.own ()
+		self.elements.update (val)
 		return
 
 	def clone (self):
 		# Purpose: return a Set which is an exact copy of self
 		# Returns: see Purpose
 		# Assumes: nothing
-		# Effects: see Purpose
+		# Effects: marks self and the copy as sharing their items, so
+		#	the copying is put off until one of them is changed
 		# Throws: nothing
+		# Notes: The items themselves are not copied, only the Set.
 
-		return copy.deepcopy (self)
+		result_set = Set ()
+		result_set.elements = self.elements
+		result_set.shared = self.shared = 1
+		return result_set
+
+	def own (self):
+		# Purpose: make sure self has its own builtin set of items
+		#	before we change it
+		# Returns: nothing
+		# Assumes: nothing
+		# Effects: copies self.elements if it may be shared with a
+		#	clone
+		# Throws: nothing
+
+		if self.shared:
+			self.elements = set (self.elements)
+			self.shared = 0
+		return
 
 	def contains (self,
 		val		# item to look for in the Set
@@ -105,7 +121,9 @@ class Set:
 		# Notes: This is for testing a single item, while containsAll
 		#	is useful for testing multiple items.
 
-		return self.elements.has_key (val)
+		if val in self.elements:
+			return 1
+		return 0
 
 	def containsAll (self,
 		*val		# items to look for in the Set
@@ -118,10 +136,9 @@ class Set:
 		# Effects: see Returns
 		# Throws: nothing
 
-		for item in val:			# test each item
-			if not self.elements.has_key (item):
-				return 0		# found one missing
-		return 1
+		if self.elements.issuperset (val):
+			return 1
+		return 0
 
 	def values (self):
 		# Purpose: return a list containing the items in this Set
@@ -130,7 +147,7 @@ class Set:
 		# Effects: see Purpose
 		# Throws: nothing
 
-		return self.elements.keys ()
+		return list (self.elements)
 
 	def remove (self,
 		*val		# items to remove from the Set
@@ -143,9 +160,8 @@ class Set:
 		#	ignore it.
 		# Throws: nothing
 
-		for item in val:
-			if self.elements.has_key (item):
-				del self.elements [item]
+		self.own ()
+		self.elements.difference_update (val)
 		return
 
 	def empty (self):
@@ -156,7 +172,9 @@ class Set:
 		# Effects: see Returns
 		# Throws: nothing
 
-		return (self.elements == {})
+		if len (self.elements) == 0:
+			return 1
+		return 0
 
 	def intersection (self,
 		S			# the Set to intersect with self
@@ -169,9 +187,7 @@ class Set:
 		# Throws: nothing
 
 		result_set = Set ()
-		for item in self.elements.keys ():
-			if S.contains (item):
-				result_set.add (item)
+		result_set.elements = self.elements & S.elements
 		return result_set
 
 	def union (self,
@@ -181,12 +197,16 @@ class Set:
 		# Returns: see Purpose
 		# Assumes: S is a Set
 		# Effects: builds a new Set object from items which are in
-		#	either S or self (or both), then returns it.
+		#	either S or self (or both), then returns it.  If either
+		#	is empty, the result is just a clone of the other.
 		# Throws: nothing
 
-		result_set = S.clone ()			# make a copy of S
-		for item in self.elements.keys ():	# then add the items
-			result_set.add (item)		# from self to it.
+		if S.empty ():
+			return self.clone ()
+		elif self.empty ():
+			return S.clone ()
+		result_set = Set ()
+		result_set.elements = self.elements | S.elements
 		return result_set
 
 	def difference (self,
@@ -200,9 +220,7 @@ class Set:
 		# Throws: nothing
 
 		result_set = Set ()
-		for item in self.elements.keys ():
-			if not S.contains (item):
-				result_set.add (item)
+		result_set.elements = self.elements - S.elements
 		return result_set
 
 	def subset (self,
@@ -213,17 +231,13 @@ class Set:
 		# Returns: boolean (0/1) to indicate if self is a subset of
 		#	S (1) or not (0)
 		# Assumes: S is a Set
-		# Effects: checks each item in self to see if it is also an
-		#	item of S, and remembers if we find one that is not
-		#	(thus indicating that self is not a subset of S)
+		# Effects: checks whether each item in self is also an item
+		#	of S
 		# Throws: nothing
 
-		is_a_subset = 1				# assume it is
-		for item in self.elements.keys ():
-			if not S.contains (item):
-				is_a_subset = 0		# it is not
-				break			# skip rest of loop
-		return is_a_subset
+		if self.elements.issubset (S.elements):
+			return 1
+		return 0
 
 	def superset (self,
 		S			# Set to test to see if self is a
@@ -234,10 +248,12 @@ class Set:
 		#	S (1) or not (0)
 		# Assumes: S is a Set
 		# Effects: looks to see if S is a subset of self.  If so, then
-		#	self is a superset of S.  (why rewrite the wheel?)
+		#	self is a superset of S.
 		# Throws: nothing
 
-		return S.subset (self)
+		if self.elements.issuperset (S.elements):
+			return 1
+		return 0
 
 	def equals (self,
 		S			# Set to test to see if it and self
@@ -247,13 +263,12 @@ class Set:
 		# Returns: boolean (0/1) to indicate if self and S contain (1)
 		#	all the same items, or not (0)
 		# Assumes: S is a Set
-		# Effects: looks to see if S is a subset of self, and if self
-		#	is a subset of S.  If this is true, then we are assured
-		#	that they contain the same items.  (why rewrite the
-		#	wheel?)
+		# Effects: compares the items in self and S
 		# Throws: nothing
 
-		return S.subset (self) and self.subset (S)
+		if self.elements == S.elements:
+			return 1
+		return 0
 
 	def count (self):
 		# Purpose: see how many items are in the set
@@ -262,4 +277,4 @@ class Set:
 		# Effects: nothing
 		# Throws: nothing
 
-		return len (self.values ())
+		return len (self.elements)
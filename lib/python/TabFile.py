@@ -47,6 +47,58 @@ def dictToString (
 	return s
 
 
+def fieldOrder (
+	dict		# one row of data, as a dictionary
+	):
+	# Purpose: get the order in which to write the fields of 'dict'
+	# Returns: a list of the keys of 'dict', sorted, but with any field
+	#	in FIRST_FIELD moved to the front (and renamed to use the first
+	#	item in FIRST_FIELD)
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	kys = dict.keys ()
+	kys.sort ()
+
+	# look through fields which should appear first in the output.  If
+	# they exist, move them to the front of the list of keys.
+
+	for item in FIRST_FIELD:
+		if item in kys:
+			kys.remove (item)
+			kys.insert (0, FIRST_FIELD[0])
+	return kys
+
+def headerLine (
+	kys		# list of fieldnames, as from fieldOrder()
+	):
+	# Purpose: build the header line for a tab-delimited file
+	# Returns: a string with the (tab-delimited) fieldnames and a line
+	#	feed
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	return string.join (kys, TAB) + LF
+
+def dataLine (
+	dict,		# one row of data, as a dictionary
+	kys		# list of fieldnames, as from fieldOrder()
+	):
+	# Purpose: build the data line for 'dict' in a tab-delimited file
+	# Returns: a string with the values of 'dict' for the fields in 'kys'
+	#	(tab-delimited), and a line feed
+	# Assumes: 'dict' has a value for each field in 'kys'
+	# Effects: nothing
+	# Throws: KeyError if 'dict' lacks one of the fields in 'kys'
+
+	values = []
+	for item in kys:
+		values.append (str (dict [item]))
+	return string.join (values, TAB) + LF
+
+
 class TabFile:
 	# Concept:
 	#	IS: an abstraction of a tab-delimited file
@@ -138,32 +190,10 @@ class TabFile:
 
 		s = ''
 		if len (self.data) > 0:
-			kys = self.data[0].keys ()
-			kys.sort ()
-
-			# look through fields which should appear first in the
-			# output.  If they exist, move them to the front of the
-			# list of keys.
-
-			for item in FIRST_FIELD:
-				if item in kys:
-					kys.remove (item)
-					kys.insert (0, FIRST_FIELD[0])
-
-			# build the header line, and add it to "s"
-
-			line = ''
-			for item in kys:
-				line = line + item + TAB
-			s = line [:-1] + LF
-
-			# now, build each data line and add them to "s"
-
+			kys = fieldOrder (self.data[0])
+			s = headerLine (kys)
 			for row in self.data:
-				line = ''
-				for item in kys:
-					line = line + str (row [item]) + TAB
-				s = s + line[:-1] + LF
+				s = s + dataLine (row, kys)
 		return s
 
 	def save (self,
@@ -252,3 +282,68 @@ class TabFile:
 					self.dataLines [dictToString(dict)] = \
 						original_line
 		return
+
+
+class TabWriter:
+	# Concept:
+	#	IS: a tab-delimited file which is written as its rows arrive,
+	#		rather than all at once
+	#	HAS: a file to write to, the order of the fields, a count of
+	#		the data lines written
+	#	DOES: writes a header line (and optional preamble) before the
+	#		first rows, then writes each batch of rows it is given
+	# Methods:
+	#	__init__ (file pointer, optional preamble)
+	#	write (list of data dictionaries)
+	#	getCount ()
+	# Notes: The format is the same as that of TabFile.__str__(), but the
+	#	fields are taken from the first row written, so each later
+	#	row must have the same keys.
+
+	def __init__ (self,
+		fp,			# file object to write to
+		preamble = ''		# string to write before the header
+		):
+		# Purpose: initialize a new TabWriter object
+		# Returns: nothing
+		# Assumes: "fp" is open for writing
+		# Effects: nothing; nothing is written until the first rows
+		# Throws: nothing
+
+		self.fp = fp
+		self.preamble = preamble
+		self.kys = None		# list of fieldnames, once known
+		self.count = 0		# number of data lines written
+		return
+
+	def write (self,
+		dataList	# list of dictionaries, each of which should
+		):		# have the same keys and represent a single row
+				# of data
+		# Purpose: write the rows in "dataList"
+		# Returns: nothing
+		# Assumes: nothing
+		# Effects: writes to self.fp (the preamble and header line, too,
+		#	if these are the first rows), and flushes it so the
+		#	reader gets these rows right away
+		# Throws: IOError if we cannot write to self.fp
+
+		if len (dataList) == 0:
+			return
+		if self.kys is None:
+			self.kys = fieldOrder (dataList[0])
+			self.fp.write (self.preamble + headerLine (self.kys))
+		for row in dataList:
+			self.fp.write (dataLine (row, self.kys))
+		self.count = self.count + len (dataList)
+		self.fp.flush ()
+		return
+
+	def getCount (self):
+		# Purpose: get the number of data lines written so far
+		# Returns: integer
+		# Assumes: nothing
+		# Effects: nothing
+		# Throws: nothing
+
+		return self.count
@@ -11,38 +11,83 @@
 # On Import:	We initialize a bunch of global variables
 # Classes:
 #	TrackRec
+#	Entry_Validator
 # Functions:
 #	blank (string)
+#	build_And_Run_Page (Clean_Query_Dict, page number, page size)
 #	build_And_Run_SQL (Clean_Query_Dict)
+#	build_Query_SQL (Clean_Query_Dict, optional page)
 #		consider_TR_Nr ()			/\
 #		consider_simpleText ()			||
-#		consider_date ()			||
-#		consider_single_valued_cv ()		||
-#		consider_multi_valued_cv ()	used only by build_And_Run_SQL
-#		consider_dependencies ()	to help build the query
-#		lookup_multi_valued_cv ()		||
-#		compile_multi_valued_cv ()		||
-#		compile_single_valued_cv ()		||
-#		sort_results ()				\/
+#		consider_date ()		used only by
+#		consider_single_valued_cv ()	build_Query_SQL to help
+#		consider_multi_valued_cv ()	build the query
+#		consider_dependencies ()		||
+#		consider_text_fields ()			||
+#		multi_valued_cv_columns ()		||
+#		text_search_columns ()			\/
 #	build_Query_Table (clean_Results)
+#	buildStatusIntervals ()
+#	buildTextIndexes ()
+#	cachedQuery (Clean_Query_Dict, page)
+#	closureEngine ()
+#	componentString (list of TR numbers)
+#	countQueryCache (outcome)
 #	directoryPath (dir)
 #	directoryURL (dir)
-#	expand_TR_Range (range, key)			- internal use only
+#	entryValidator ()
+#	errorMessages (list of errors)
 #	expand_TR (tr numbers, key)			- internal use only
 #	expandWTSMarkup(field)
+#	find_TR_Numbers (tr numbers, with ranges)
+#	format_Query_Dates (list of query results)
+#	finish_Query_Rows (list of rows, query plan)
+#		compile_single_valued_cv ()	used only by
+#		sort_results ()			finish_Query_Rows
+#	getRelatives (tr num, ancestors flag)
+#	getStatusCounts (row_type, date_range)
+#	getStatusDateCTEs (start, stop)
+#	getStatusHistoryCTEs (start, stop)
 #	getStatusTable (row_type, date_range)
 #	getText(TR,noteType)
-#	opposite (item)
+#	getTree (tr num, ancestors flag, maximum depth)
+#	graphReport (number of items to list)
+#	graphReportLines (report)
+#	hasStatusIntervals ()
+#	highlightSnippet (snippet)
+#	invalidateQueryCache ()
+#	load_many (list of tr numbers)
 #	parse_And_Merge (list of Query_Row_Dict, key name)
+#	parse_TR_Intervals (tr numbers)			- internal use only
+#	parse_TR_Range (range)				- internal use only
+#	queryCacheContents (results, page)
+#	queryCacheDir ()
+#	queryCacheGeneration ()
+#	queryCacheKey (Clean_Query_Dict, page)
+#	queryCacheStats ()
+#	queryCacheTTL ()
+#	queryPageSize ()
 #	queryTitle (query string)
 #	recompute_Closure ()
+#	recomputeTransitiveClosure (tr num, relationship type)
 #	remove (orig, del_item)
+#	run_Query (Clean_Query_Dict)
+#	run_Query_Page (Clean_Query_Dict, page number, page size)
 #	save_WTS_TrackRec (values, method)		- internal use only
 #	save_Standard_M2M (values, old_values, method)	- internal use only
 #	save_Text_Fields (values, old_values, method)	- internal use only
 #	save_Relationships (values, old_values, method)	- internal use only
 #	self_test ()
+#	sortEngine ()
+#	statusDateEngine ()
+#	statusIntervalQueries (tr num)
+#	stream_Query (Clean_Query_Dict, handler)
+#	textQuery (words)
+#	textSearchEngine ()
+#	textVector (column)
+#	unpack_Loaded_TR (row)				- internal use only
 #	sqlForRelativesOf (tr num, relationship type)
+#	sqlTransitiveClosure (tr num or None, relationship type)
 #	updateTransitiveClosure (tr num, relationship type)
 #	validate_Query_Form (Raw_Query_Dict)
 #	validate_TrackRec_Entry (Raw_TR_Dict)
@@ -50,6 +95,7 @@
 #	with_nice_names (input dict)		- internal use only
 '''
 
+import sys
 import types
 import string
 import HTMLgen
@@ -58,6 +104,8 @@ import ConfigurationWrapper
 import WTS_DB_Object
 import wtslib
 import copy
+import marshal
+import md5
 import os
 import time
 import regex
@@ -67,6 +115,7 @@ import Set
 import Arc
 import ArcSet
 import Template
+import WriteLock
 
 
 #-GLOBALS-------------------------------------------------------------------
@@ -257,7 +306,9 @@ NAME_TO_DB = {  'TR Nr' :               '_TR_key',
                 'Requested By' :        'requested_by',
                 'Status History' :      'status_history',
                 'Depends On' :          'depends_on',
-                'Modification Date' :   'modification_date' }
+                'Modification Date' :   'modification_date',
+                'Relevance' :           'text_rank',
+                'Matching Text' :       'text_snippet' }
 
 DB_TO_NAME = {  '_TR_key' :                     'TR Nr',
 		'_tr_key' : 			'TR Nr',
@@ -277,7 +328,9 @@ DB_TO_NAME = {  '_TR_key' :                     'TR Nr',
                 'requested_by' :                'Requested By',
                 'status_history' :              'Status History',
                 'modification_date' :           'Modification Date',
-                'depends_on' :                  'Depends On' }
+                'depends_on' :                  'Depends On',
+                'text_rank' :                   'Relevance',
+                'text_snippet' :                'Matching Text' }
 
 # mapping from nice field names (for the user, and used in the TrackRec
 # object) to the filename of their help files
@@ -407,7 +460,9 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 	#		verify_Current_Lock ()
 
 	def __init__ (self,
-		TR_Number = None	# integer tracking record number (key)
+		TR_Number = None,	# integer tracking record number (key)
+		loaded_row = None	# row from LOAD_SELECT for TR_Number,
+					# if it has already been retrieved
 		):
 		# Purpose: creates and initializes a new TrackRec object
 		# Returns: nothing
@@ -415,7 +470,8 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 		# Effects: see purpose.  If TR_Number is None, then we create
 		#	create a new (empty) tracking record.  If TR_Number is
 		#	non-None, then we load the specified one from the
-		#	database.
+		#	database (or from "loaded_row", if given; see
+		#	load_many()).
 		# Throws: propagates from self.load () -- 1. a wtslib.sqlError
 		#	if loading an existing tracking record and the SQL
 		#	statements fail for some reason.  2. a ValueError if
@@ -488,7 +544,10 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 
 		else:
 			self.key_value = TR_Number	# set the known key
-			self.load ()			# fills in self.data
+			if loaded_row is None:
+				self.load ()		# fills in self.data
+			else:
+				self.load_Row (loaded_row)
 
 		# self.backup will store an exact copy of the tracking record's
 		# "original" data -- the data that it was initialized with.
@@ -838,28 +897,6 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 		# dependencies in here...
 
 		if expanded:
-			# all descendants:
-
-			q1 = '''select tr._TR_key, tr.tr_title, tr._Status_key
-				from WTS_TrackRec tr, WTS_Relationship rel
-				where	(rel._TR_key = %s) and
-					(tr._TR_key = rel._Related_TR_key) and
-					(transitive_closure = 1) and
-					(relationship_type = %s)
-				order by tr._TR_key''' % \
-				(self.num (), DEPENDS_ON)
-			
-			# ancestors:
-
-			q2 = '''select tr._TR_key, tr.tr_title, tr._Status_key
-				from WTS_TrackRec tr, WTS_Relationship rel
-				where	(rel._Related_TR_key = %s) and
-					(tr._TR_key = rel._TR_key) and
-					(transitive_closure = 1) and
-					(relationship_type = %s)
-				order by tr._TR_key''' % \
-				(self.num (), DEPENDS_ON)
-
 			# get a quick reference to keyToName() method of the
 			# Status controlled vocabulary object:
 
@@ -869,9 +906,12 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 
 			cgi = 'tr.detail.cgi?TR_Nr=%s'
 
-			# retrieve all info from database:
+			# retrieve all descendants and ancestors from the
+			# database:
 
-			[descendants, ancestors] = wtslib.sql ([q1, q2])
+			descendants = getRelatives (string.atoi (self.num ()))
+			ancestors = getRelatives (string.atoi (self.num ()),
+				TRUE)
 
 			# now, build the tables for each set of dependency info:
 
@@ -1498,11 +1538,9 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 
                 global alreadyLocked
 
-		qry = '''select %s as locked_when,
-				_Locked_Staff_key
+		qry = '''select locked_when, _Locked_Staff_key
 			from WTS_TrackRec
-			where (_TR_key = %s)''' % (convertDate('locked_when'),
-				self.data['TR Nr'])
+			where (_TR_key = %s)''' % self.data['TR Nr']
 		result = wtslib.sql (qry)
 
 		# if it is already locked, then give up.
@@ -1511,7 +1549,8 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 			CV = Controlled_Vocab.cv ['CV_Staff'].key_dict ()
                         raise alreadyLocked, 'locked by %s on %s' % \
 				(str (CV [result[0]['_locked_staff_key']]),
-				result[0]['locked_when'])
+				wtslib.format_DateTime (
+					result[0]['locked_when']))
 
 		# otherwise, lock it.
 
@@ -1556,10 +1595,35 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 		#	TR # exists in the database.  2. wtslib.sqlError if an
 		#	error occurs in processing the SQL statements.
 
-		global PROJECT_DEFINITION, PROGRESS_NOTES
-
 		my_num = self.num ()		# get my tracking record number
 
+		# we need to go to the database and lookup current values for
+		# the tracking record.  This is a single prepared statement
+		# (see LOAD_SELECT) which returns one row, with the text
+		# fields in columns and the many-to-many fields (area, type,
+		# staff, requested by, depends on, status history) as arrays.
+		# (This is where the ValueError may be raised, if we didn't
+		# find the tracking record.)
+
+		[ row ] = wtslib.sqlPrepared ('loadTrackRec',
+			[ string.atoi (my_num) ])
+
+		self.load_Row (row)
+		return
+
+
+	def load_Row (self,
+		row		# row returned by LOAD_SELECT for this TR
+		):
+		# Purpose: fill in this tracking record from a row which was
+		#	already retrieved from the database
+		# Returns: nothing
+		# Assumes: "row" is for this tracking record's key
+		# Effects: clears all current tracking record information in
+		#	self.data (except the key value), and loads in values
+		#	for this tracking record from "row"
+		# Throws: nothing
+
 		# reset all the values to defaults
 
 		self.set_Defaults ()
@@ -1574,214 +1638,10 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 
 		self.set_Values ( { 'Project Definition' : None } )
 
-		# we need to go to the database and lookup current values for
-		# the tracking record.  Splitting this into multiple queries
-		# and then using Python to combine the information has reduced
-		# this operation from nearly a minute down to under 2 seconds.
-		# Rick said this could be due to bad results from sybase's
-		# query optimizer, which is only good for queries with 4-5
-		# tables at most.
-
-		# At a later date, we should simplify these queries.  As a
-		# result of other revisions, all the controlled vocabulary info
-		# that we need is already loaded in the Controlled_Vocab module.
-		# We can remove all the extra joins to the CV_WTS_* tables,
-		# just retrieve the keys, and then use Controlled_Vocab to
-		# fill in the corresponding values.  (again, to be done later)
-
-		queries =  [
-                        # 0. general tracking record info and simple controlled
-			#    vocabulary lookups
-                        '''
-                        select tr._TR_key, pri.priority_name,
-                                size.size_name, stat.status_name,
-                                staff1.staff_username status_staff_username,
-                                %s as attention_by,
-                                %s as status_set_date, tr.tr_title,
-                                tr.directory_variable,
-                                %s as modification_date
-			from WTS_TrackRec tr, CV_WTS_Priority pri,
-                                CV_WTS_Size size, CV_WTS_Status stat,
-                                CV_Staff staff1
-			where ((tr._Priority_key = pri._Priority_key) and
-                                (tr._Size_key = size._Size_key) and 
-                                (tr._Status_key = stat._Status_key) and
-                                (tr._Status_Staff_key = staff1._Staff_key) and
-                                (tr._TR_key = %s))''' % (
-					convertDate('tr.attention_by'),
-					convertDate('tr.status_set_date'),
-					convertDate('tr.modification_date'),
-					my_num),
-
-                        # 1. the text blocks:  Progress Notes and Project
-			#    Definition
-			'''
-                        select text_type, text_block
-                        from WTS_Text
-                        where (_TR_key = %s)''' % my_num,
-			
-                        # 2. status history of this tracking record
-			'''
-                        select sh._TR_key, stat.status_name,
-                                staff.staff_username,
-                                %s as set_date_txt
-			from WTS_Status_History sh, CV_WTS_Status stat,
-                               CV_Staff staff
-                        where ((sh._Staff_key = staff._Staff_key) and
-                                 (sh._Status_key = stat._Status_key) and
-                                 (sh._TR_key = %s))
-			order by sh.set_date desc''' % (
-				convertDate('sh.set_date'), my_num),
-
-                        # 3. dependencies of this tracking record
-			'''
-                        select _TR_key, _Related_TR_key
-                        from WTS_Relationship
-                        where ((relationship_type = %d) and
-                                (transitive_closure = 0) and
-                                (_TR_key = %s))''' % (DEPENDS_ON, my_num),
-
-                        # 4. areas of this tracking record
-			'''
-                        select _TR_key, area_name as area
-                        from WTS_Area MMarea, CV_WTS_Area CVarea
-                        where ((MMarea._Area_key = CVarea._Area_key)
-                                and (MMarea._TR_key = %s))
-			order by CVarea.area_order''' % my_num,
-			
-                        # 5. types of this tracking record
-			'''
-                        select _TR_key, type_name as type
-                        from WTS_Type MMtype, CV_WTS_Type CVtype
-                        where ((MMtype._Type_key = CVtype._Type_key) and
-                                (MMtype._TR_key = %s))
-			order by CVtype.type_order''' % my_num,
-			
-                        # 6. staff members assigned to this tracking record
-                        '''
-                        select _TR_key, staff_username as staff_list
-                        from WTS_Staff_Assignment MMstaff, CV_Staff CVstaff
-                        where ((MMstaff._Staff_key = CVstaff._Staff_key) and
-                                (MMstaff._TR_key = %s))
-			order by CVstaff.staff_grouping, CVstaff.staff_username
-			''' % my_num,
-			
-                        # 7. staff members who requested this tracking record
-                        '''
-                        select _TR_key, staff_username as requested_by
-                        from WTS_Requested_By MMreqby, CV_Staff CVstaff
-                        where ((MMreqby._Staff_key = CVstaff._Staff_key) and
-	                        (MMreqby._TR_key = %s))
-			order by CVstaff.staff_grouping, CVstaff.staff_username
-			''' % my_num
-			]
-
-		results = wtslib.sql (queries)
-
-                # results is now a list of lists of dictionaries.  It contains
-                # eight elements.  Each element represents the results of a
-                # SQL select statement and is a list of dictionaries, with one
-                # dictionary per row returned by the query.  Roughly, results
-                # items are:
-
-                # [0] = general TR info:    [ { _TR_key, _Priority_key,
-                #       (only one row)          _Size_key, _Status_key,
-                #                               _Staff_key, attention_by,
-                #                               status_set_date, tr_title,
-                #                               directory_variable,
-		#				modification_date }        ]
-                # [1] = text fields:        [ { text_type, text_block } ... ]
-                #       (0-3 rows)
-                # [2] = m-m status history: [ { _TR_key, _Status_key,
-                #                               _Staff_key, set_date_txt } ... ]
-                # [3] = m-m relationships:  [ { _TR_key,
-                #                               _Related_TR_key }       ... ]
-                # [4] = m-m area:           [ { _TR_key, _Area_key }    ... ]
-                # [5] = m-m type:           [ { _TR_key, _Type_key }    ... ]
-                # [6] = m-m staff:          [ { _TR_key, _Staff_key }   ... ]
-                # [7] = m-m requested by:   [ { _TR_key, _Staff_key }   ... ] 
-
-		# put a call in here to parse & merge for the main tracking
-                # record information (query 0).  There's only one tracking
-		# record returned, so just get it and put it in record.
-		# (This is where the ValueError may be raised, if we didn't
-		# find the tracking record.)
-
-		[ record ] = parse_And_Merge (results [0], '_tr_key')
-
-		# convert the dates to the standard WTS format.  Since these
-		# values are coming from the database, we know this is a valid
-		# conversion, just dump the errors in a bogus temporary
-		# variable named 'ignore_errors'
-
-		record ['status_set_date'], ignore_errors = \
-			wtslib.parse_DateTime ( \
-				str (record ['status_set_date']))
-		record ['attention_by'], ignore_errors = \
-			wtslib.parse_DateTime (str (record ['attention_by']))
-		record ['modification_date'], ignore_errors = \
-			wtslib.parse_DateTime ( \
-				str (record ['modification_date']))
-
-		# We need to update the Directory field in the record to
-		# reflect changes specified in the "Managing Project Directories
-		# with WTS" document:  We now store a URL to this directory,
-		# with the displayed text being the unix path for it.  (That's
-		# what directoryURL() returns)
-
-		if str (record ['directory_variable']) != 'None':
-			record ['directory_variable'] = directoryURL (
-				record ['directory_variable'])
-
-                # now, pick the big text fields out of query 1
-
-		record ['project_definition'] = getText (my_num,
-			PROJECT_DEFINITION)
-		record ['progress_notes'] = getText (my_num, PROGRESS_NOTES)
-
-                # now, get the status history info from query 2, starting with
-		# the current status...
-
-		temp = '%s - set by %s - effective %s, ' % \
-			(record ['status_name'],
-			record ['status_staff_username'],
-			record ['status_set_date'])
-
-		for row in results [2]:
-
-			# get the date in the standard WTS format and ignore
-			# any errors (there shouldn't be any since this is
-			# coming directly from the database)
-
-			date, ignore = wtslib.parse_DateTime (
-				row ['set_date_txt'])
-
-			temp = temp + row ['status_name'] + ' - set by ' + \
-				row ['staff_username'] + ' - effective ' + \
-				date + ', '
-		record ['status_history'] = temp [:-2]
-
-                # get the relationship info from query 3
-
-		record ['depends_on'] = Set.Set ()
-		for row in results [3]:
-			record ['depends_on'].add (row ['_related_tr_key'])
-
-                # go through the rest of the queries (4-7) and tack on any
-		# information
-
-		extra_queries = range (4, len (results))
-		for i in extra_queries:
-			temp = parse_And_Merge (results [i], '_tr_key')
-			if len (temp) > 0:
-				key_list = temp[0].keys ()
-				for k in key_list:
-					if k <> '_tr_key':
-						record [k] = temp [0][k]
-
 		# now, put the values returned in the proper places in self
 
-		self.set_Values (with_nice_names (record ))
+		self.set_Values (with_nice_names (unpack_Loaded_TR (row)))
+		return
 
 
 	def save (self,
@@ -1798,13 +1658,14 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 		# Effects: may update, add, and delete rows to database tables:
 		#	WTS_TrackRec, WTS_Relationship, WTS_Type, WTS_Area,
 		#	WTS_Staff_Assignment, WTS_Text, WTS_Requested_By,
-		#	WTS_Status_History.  New tracking records are handled
-		#	by using sql insert statements.  Existing tracking
-		#	records have their existing values updated by doing an
-		#	update query on WTS_TrackRec, and then inserting and
-		#	deleting rows in the other tables to handle fields with
-		#	many-to-many relationships as needed.  This should help
-		#	minimize the number of queries run.
+		#	WTS_Status_History, WTS_Status_Interval.  New tracking
+		#	records are handled by using sql insert statements.
+		#	Existing tracking records have their existing values
+		#	updated by doing an update query on WTS_TrackRec, and
+		#	then inserting and deleting rows in the other tables to
+		#	handle fields with many-to-many relationships as
+		#	needed.  This should help minimize the number of
+		#	queries run.
 		# Throws: 1. wtslib.sqlError if problems occur while running
 		#	the sql statements; 2. propagates (from
 		#	verify_Current_Lock ()) TrackRec.notLocked if the
@@ -1992,20 +1853,46 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 		queries = queries + save_Text_Fields (values, backup, method)
 		queries = queries + save_Relationships (values, backup, method)
 
-		# execute the queries...
+		# if the Status or its date changed, then the TR's rows in the
+		# table of Status intervals need to follow suit
 
-		result = wtslib.sql (queries)
+		if (statusDateEngine () == 'intervals') and \
+			((method == TR_NEW) or
+			(values ['status_name'] <> backup ['status_name']) or
+			(values ['status_set_date'] <> \
+				backup ['status_set_date'])):
+			queries = queries + statusIntervalQueries (
+				string.atoi (self.num ()))
+
+		# execute the queries as a single transaction, along with
+		# the transitive closure update (only needed if the "Depends
+		# On" field has changed).  If anything fails, the whole save
+		# is rolled back, rather than leaving a half-written TR.
+
+		wtslib.beginTransaction ()
+		try:
+			result = wtslib.sql (queries, batch = 1)
+
+			if not backup ['depends_on'].equals (
+					values ['depends_on']):
+				if closureEngine () == 'sql':
+					sqlTransitiveClosure (
+						string.atoi (self.num ()),
+						DEPENDS_ON)
+				else:
+					updateTransitiveClosure (
+						string.atoi (self.num ()),
+						DEPENDS_ON)
+		except:
+			exc_type, exc_value, exc_traceback = sys.exc_info ()
+			if wtslib.transaction is not None:
+				wtslib.rollbackTransaction ()
+			raise exc_type, exc_value, exc_traceback
+		wtslib.commitTransaction ()
 
-		# and, update the transitive closure (only if the "Depends On"
-		# field has changed).  Give the TR number, the constant for the
-		# "depends on" relationship, the old value of the "Depends On"
-		# field, and the new value of the field to the new
-		# updateTransitiveClosure function.
+		# any query results we have cached may no longer be right
 
-		if not backup ['depends_on'].equals (values ['depends_on']):
-			updateTransitiveClosure (
-				string.atoi (self.num ()),	# TR number
-				DEPENDS_ON)
+		invalidateQueryCache ()
 
 		# We also need to update the .htaccess mappings in the project
 		# directories, if we changed this project's title:
@@ -2169,12 +2056,12 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 
 		# get the current locking information from the database
 
-		qry = '''select %s as locked_when,
+		qry = '''select tr.locked_when,
 				cv.staff_username staff_username
 			from	WTS_TrackRec tr, CV_Staff cv
 			where	(tr._TR_key = %s) and
-				(tr._Locked_Staff_key = cv._Staff_key)''' % (
-				convertDate('tr.locked_when'), self.num() )
+				(tr._Locked_Staff_key = cv._Staff_key)''' % \
+				self.num ()
 		result = wtslib.sql (qry)
 
 		# if it not locked, then raise the notLocked exception
@@ -2189,7 +2076,8 @@ class TrackRec (WTS_DB_Object.WTS_DB_Object):
 			s = 'no valid lock on TR %s.  ' % self.num ()
 			s = s + 'It was locked by %s on %s.' % \
 				(result [0]['staff_username'],
-				result [0]['locked_when'])
+				wtslib.format_DateTime (
+					result [0]['locked_when']))
 			raise notLocked, s
 
 		return		# otherwise, it is locked by the current user
@@ -2209,18 +2097,39 @@ def build_And_Run_SQL (
 	#	each of which corresponds to a single tracking record.  Recall
 	#	that a query returns all tracking records that meet the
 	#	constraints of the user's query.
+	# Assumes: see build_Query_SQL()
+	# Effects: see build_Query_SQL() and finish_Query_Rows()
+	# Throws: wtslib.sqlError if an error occurs while running the SQL
+	#	statement
+
+	plan = build_Query_SQL (clean_dict)
+	return finish_Query_Rows (wtslib.sql (plan ['sql']), plan)
+
+def build_Query_SQL (
+	clean_dict,	# a validated dictionary of fieldname -> desired values
+			# (from the tracking record Query Form) to use in
+			# generating and running queries
+	page = None	# tuple (page number, rows per page) to get only one
+			# page of the results, or None for all of them
+	):
+	# Purpose: builds the SQL query as specified by the user on the
+	#	tracking record Query Form
+	# Returns: a dictionary which describes the query, with keys:
+	#	'sql' (string; the SQL select statement), 'python_sort'
+	#	(boolean; must the rows be sorted in Python?), 'sorting',
+	#	'ordering' (see below), and 'display_map' (dictionary; maps
+	#	from each database fieldname to be displayed to its object
+	#	attribute name).  This is then passed to finish_Query_Rows()
+	#	with the rows returned by the query.
 	# Assumes: 1. db's sql routines have been initialized.
 	#	2. clean_dict has no bad values -- it has been validated by
 	#	TrackRec.validate_Query_Form.  3. proper values for Display,
 	#	Primary, Secondary, Tertiary, Primary Order, Secondary Order,
 	#	and Tertiary Order are defined in clean_dict.
-	# Effects: Builds queries to retrieve tracking record information from
+	# Effects: Builds a query to retrieve tracking record information from
 	#	the database, using the query constraints specified in
-	#	clean_dict.  Combines the results of these queries to generate
-	#	the list of dictionaries (each of which contains the data for a
-	#	single tracking record) returned.
-	# Throws: wtslib.sqlError if an error occurs while running the SQL
-	#	statements
+	#	clean_dict.
+	# Throws: nothing
 	# Notes: Each dictionary in the list returned will have the same keys.
 	#	The keys, however, vary depending on the clean_dict which was
 	#	passed in.  This is to accomodate the fact that, on the query
@@ -2257,18 +2166,24 @@ def build_And_Run_SQL (
 	#	sort by the datetime value while returning a properly formatted
 	#	string value.  For varchar fields, we just sort alphabetically.
 	#	All these can be done in the database (which we expect will
-	#	provide a performance benefit).  If, however, we need to sort
-	#	by one or more of the multi-valued controlled vocabulary fields,
-	#	we need to use Python to assemble each value from the many-to-
-	#	many relationships in the database.  This means that we've
-	#	already brought the data (unordered) out of the database.  So,
-	#	in that case, we just sort it in Python.
+	#	provide a performance benefit).  The multi-valued controlled
+	#	vocabulary fields sort by the string of their term names.  (If
+	#	the SORT_ENGINE config parameter is 'python', we instead bring
+	#	the data out of the database unordered and sort it in Python.)
 	#
-	#	As a final note, the "Directory" field requires special
-	#	handling.  The database stores only a relative directory.  We
-	#	really want to return a URL to that directory.  So, as a final
-	#	data cleanup, we replace values in the Directory field (if there
-	#	is one) with the appropriate URL.
+	#	All of this goes into a single SQL statement, using a WITH
+	#	clause for the matching tracking records (and those related to
+	#	them), with a subquery to assemble the value of each multi-
+	#	valued controlled vocabulary field we need.  So, we create no
+	#	temporary tables.
+	#
+	#	The tracking record number is always the last level of the
+	#	"order by", so that the order is the same each time we run the
+	#	query.  This lets us ask for one "page" of the results at a
+	#	time, with "limit" and "offset".  The page's rows then include
+	#	a "total_rows" column with the number of rows in all pages.
+	#	(If we sort in Python, we cannot page in the database, so the
+	#	query returns all the rows.)
 
 	global NAME_TO_DB
 
@@ -2373,19 +2288,18 @@ def build_And_Run_SQL (
 		single_cv_fields.append ( ('Status', 'tr._Status_key',
 			'CV_WTS_Status cst', 'cst._Status_key',
 			'cst.status_order') )
-		queries = []
-		tbl = ''
+		ctes = []
 		tbl_abbrev = 'tr'
 	else:
 		[ startDate, stopDate ] = string.split (
 			clean_dict ['Status Date'], '..')
-		tbl, queries = getSqlForTempStatusTable (startDate, stopDate)
+		ctes = getStatusDateCTEs (startDate, stopDate)
 		tbl_abbrev = 'hs'
 		single_cv_fields.append ( ('Status',
 			'%s._Status_key' % tbl_abbrev,
 			'CV_WTS_Status cst', 'cst._Status_key',
 			'cst.status_order') )
-		frm.append ('%s %s' % (tbl, tbl_abbrev))
+		frm.append ('%s %s' % (STATUS_DATES, tbl_abbrev))
 		joins.append ('(%s._TR_key = tr._TR_key)' % tbl_abbrev)
 
 
@@ -2402,104 +2316,77 @@ def build_And_Run_SQL (
 	# take the three date fields into consideration when building the query
 
 	date_fields = [		# temporary variable to describe date fields
-		('Needs Attention By', 'tr.attention_by',
-			'sortable_attention_by'),
-		('Status Date', '%s.status_set_date' % tbl_abbrev,
-			'sortable_status_set_date'),
-		('Modification Date', 'tr.modification_date',
-			'sortable_modification_date') ]
-
-	for (name, fieldname, sortable_fieldname) in date_fields:
-		consider_date (name, fieldname, sortable_fieldname, to_display,
-			select, clean_dict, clean_keys, where, sorting, order,
+		('Needs Attention By', 'tr.attention_by'),
+		('Status Date', '%s.status_set_date' % tbl_abbrev),
+		('Modification Date', 'tr.modification_date') ]
+
+	for (name, fieldname) in date_fields:
+		consider_date (name, fieldname, to_display, select,
+			clean_dict, clean_keys, where, sorting, order,
 			ordering)
 
 	# *** Multi-valued Controlled Vocabularies ***
 
-	# For multi-valued controlled vocabulary fields, we can only use them
-	# to help define our search criteria at this point.  (In other words,
-	# we look to see if we need to include any info from them in the
-	# "where" clause of a sql select statement -- we do not actually 
-	# retrieve values for those fields yet.)
-
-	python_sort = 0		# boolean (0/1) - assume that we don't need to
-				# do the sorting in python, but rather that we
-				# can do it in the database.  If at least one
-				# multi-valued field is needed for sorting,
-				# then we can't do it in the database.
-	display_multi = 0	# boolean (0/1) - assume that we don't need to
-				# display any of these multi-valued fields.  If
-				# we need to display even one of these fields,
-				# then we need to set this boolean for use later
-				# on.
-	temp_sort = 0		# temporary variable - boolean to indicate
-				# whether the multi-valued controlled vocab in
-				# this iteration of the loop requires us to
-				# sort the results using Python.
-	temp_display = 0	# temporary variable - boolean to indicate
-				# whether the multi-valued controlled vocab in
-				# this iteration of the loop needs to be
-				# displayed in the results.
-
-	multi_cv = [		# temporary variable for controlled vocab info
-		('Area', 'WTS_Area', 'ar', '_Area_key'),
-		('Type', 'WTS_Type', 'ty', '_Type_key'),
-		('Requested By', 'WTS_Requested_By', 'rq', '_Staff_key'), 
-		('Staff', 'WTS_Staff_Assignment', 'st', '_Staff_key') ]
+	# For multi-valued controlled vocabulary fields, we only use them to
+	# help define our search criteria and sorting at this point.  (In
+	# other words, we look to see if we need to include any info from
+	# them in the "where" clause of a sql select statement -- we do not
+	# actually retrieve values for those fields until the end, in
+	# multi_valued_cv_columns().)
+
+	# boolean (0/1) - do the sorting in python, rather than in the
+	# database?  (The database is preferred, and is the default.)
+
+	python_sort = (sortEngine () == 'python')
+
+	multi_cv = [		# temporary variable for controlled vocab info:
+				# name, mm_table, abbrev, fieldname, CV table,
+				# and the field in it with each term's name
+		('Area', 'WTS_Area', 'ar', '_Area_key', 'CV_WTS_Area',
+			'area_name'),
+		('Type', 'WTS_Type', 'ty', '_Type_key', 'CV_WTS_Type',
+			'type_name'),
+		('Requested By', 'WTS_Requested_By', 'rq', '_Staff_key',
+			'CV_Staff', 'staff_username'),
+		('Staff', 'WTS_Staff_Assignment', 'st', '_Staff_key',
+			'CV_Staff', 'staff_username') ]
 
 	# go through and check each multi-valued controlled vocabulary field to
-	# see if it is needed for sorting or display
+	# see if it is needed for selection or sorting
 
-	for (name, mm_table, abbrev, fieldname) in multi_cv:
-		temp_sort, temp_display = consider_multi_valued_cv (name,
-			mm_table, abbrev, fieldname, to_display, clean_dict,
-			clean_keys, where, joins, sorting, frm)
-		python_sort = python_sort or temp_sort
-		display_multi = display_multi or temp_display
+	for (name, mm_table, abbrev, fieldname, cv_table, cv_name) in multi_cv:
+		consider_multi_valued_cv (name, mm_table, abbrev, fieldname,
+			clean_dict, clean_keys, where, joins, sorting, order,
+			ordering, frm)
 
 	# *** Big Text fields (define selection criteria only) ***
 
-	# big text fields are not used for sorting or display on the query
-	# results form.  They are only used in defining selection criteria.
+	# big text fields are not displayed on the query results form.  They
+	# are used in defining selection criteria, and (for a full-text
+	# search) in ranking the results by relevance.
 
-	if 'Text Fields' in clean_keys:
-		frm.append ('WTS_Text tx')	# put new table in From list
+	consider_text_fields (clean_dict, clean_keys, where, joins, sorting,
+		order, ordering, frm)
 
-		# now, add clauses to the "joins" list that link the main
-		# tracking record (in tr) to its big text fields (in tx), and
-		# add to "where" to restrict the selection to only those
-		# tracking records which have the entered value in one of its
-		# text fields.
-
-		joins.append ('tr._TR_key = tx._TR_key')
-		where.append ("tx.text_block ilike '%s%s%s'" % \
-			("%", clean_dict ['Text Fields'], "%"))
-
-	# at this point, we have enough information to generate and run the
-	# first query, which:
+	# at this point, we have enough information to build the query which
+	# finds the tracking records matching the user's criteria:
 	#	selects based on basic info in WTS_TrackRec
 	#	returns info from fields in WTS_TrackRec
 	#	selects based on many-to-many relationships
 	#	selects based on Text data (project definition, progress notes)
-	# and since all selected fields (to be returned by the query) are from
-	# WTS_TrackRec, each row returned should be one tracking record.
-
-	# we're going to be working a lot with a temporary table in the
-	# database.  Let's build and remember its name in temp_table:
-
-	temp_table = 'TMP_Query_%s' % os.environ ['REMOTE_USER']
-
-	# now, build the initial query which selects all the fields we have
-	# noted so far (select) from the various tables we have noted (frm),
-	# and puts that information in the specified temp_table
-
-	qry = 'select %s into temporary table %s from %s' % \
-		(wtslib.list_To_String (select), temp_table,
+	# We do not run it on its own, but name it "matches" in the WITH
+	# clause of the single statement we build, so that the statements
+	# for related tracking records can refer to it.  (Building all this
+	# in one statement, rather than in temporary tables, means we create
+	# and drop nothing in the database, and that two queries run at the
+	# same time by one user cannot collide.)
+
+	qry = 'select %s from %s' % (wtslib.list_To_String (select),
 		wtslib.list_To_String (frm))
 
-	# now, we need to complete the initial query by AND-ing all the clauses
-	# in "where" together with those in "joins", and putting them in a
-	# WHERE clause at the end of the SQL select statement:
+	# now, we need to complete the query by AND-ing all the clauses in
+	# "where" together with those in "joins", and putting them in a WHERE
+	# clause at the end of the SQL select statement:
 
 	if len (where + joins) > 0:	# if there were any restrictions/joins
 		qry = qry + ' where '
@@ -2508,30 +2395,34 @@ def build_And_Run_SQL (
 
 		qry = qry [:-5]			# trim final ' and ' at the end
 
-	queries.append (qry)
+	ctes.append ('matches as (%s)' % qry)
 
 	# now, we need to handle the "depends on" relationships if either
-	# related checkbox ('X Depends On' or 'Depends on X') is checked.  If
-	# either is checked, several queries are generated to add more tracking
-	# record information to temp_table; we need to append these queries to
-	# the list of queries.
-
-	queries = queries + consider_dependencies (temp_table, select, frm,
-				joins,
-				'X Depends On' in clean_keys,	# 0/1
-				'Depends On X' in clean_keys)	# 0/1
-
-	# now, go and pull the results out of the temp table (with sorting,
-	# if we can do it in the database).  The temp table should contain the
-	# basic information (all that found in WTS_TrackRec) for all tracking
-	# records which meet the query criteria.  It does not contain any of
-	# the data from the many-to-many relationships.
-
-	main_query_position = len (queries)	# remember the position of the
-						# query which is used to get
-						# the information from the
-						# database (the one we're about
-						# to add)
+	# related checkbox ('X Depends On' or 'Depends on X') is checked.  The
+	# tracking records which match (from the M2M joins, more than once)
+	# and those related to them are combined with "union", which also
+	# removes any duplicate rows.
+
+	found = [ 'select distinct * from matches' ] + \
+		consider_dependencies (select, frm, joins,
+			'X Depends On' in clean_keys,	# 0/1
+			'Depends On X' in clean_keys)	# 0/1
+	ctes.append ('found as (%s)' % string.join (found, ' union '))
+
+	# the multi-valued controlled vocabulary fields we need to display or
+	# sort by are each assembled into a string (of the names, sorted and
+	# comma-separated) by a subquery for each tracking record found
+
+	columns = [ 'res.*' ] + multi_valued_cv_columns (multi_cv, to_display,
+		sorting)
+	text_columns = text_search_columns (clean_dict, clean_keys)
+	columns = columns + text_columns
+	if (page is not None) and not python_sort:
+		columns.append ('count (*) over () as total_rows')
+
+	qry = 'with %s select %s from found res' % (string.join (ctes, ', '),
+		string.join (columns, ', '))
+
 	if not python_sort:
 
 		# if we don't have to sort in Python, then we can do the
@@ -2542,90 +2433,74 @@ def build_And_Run_SQL (
 						# ordering the records (and
 						# would cause problems in the
 						# query generation.
-		queries.append ('''
-			select *
-			from %s
-			order by %s''' % \
-				(temp_table, wtslib.list_To_String (order)))
-	else:
-		# otherwise, we'll just extract the data and sort it later
-		# in Python.
-
-		queries.append ('select * from %s' % temp_table)
-
-	# at this point, we have retrieved the basic information for the
-	# tracking records to be displayed.  We still have another main
-	# concern:  multi-valued controlled vocabulary fields.  We may just
-	# need to retrieve them for display, or we may need to use them in
-	# the sorting process.  (We may not need to do either)
-
-	queried_cv = {}	# dictionary which will use as keys the names of multi-
-			# valued controlled vocabulary fields which we need to
-			# look up.  Each key has as its value the index into
-			# queries (same as the index into results a little
-			# farther down) where we look up the values for that
-			# field.
-
-	if (python_sort or display_multi):
-		lookup_multi_valued_cv (temp_table, multi_cv, to_display,
-			sorting, queries, queried_cv)
-
-	# finally, we have built SQL statements to put all the data in
-	# temp_table.  We have built SQL statements to extract that data.  Now,
-	# add the last SQL statement to clean up after ourselves - drop the
-	# temp tables.
-
-	for t in [ temp_table, tbl ]:
-		if t != '':
-			queries.append ('drop table %s' % t)
-
-	# finally, run all the queries and get the results
-
-	results = wtslib.sql (queries)
-
-	# results has an extremely variable format, totally depending on the
-	# options chosen by the user on the tracking record query form.  It is
-	# a list of lists of dictionaries, as is typical when multiple sets
-	# of SQL results come back from wtslib.sql or db.sql.  Here's a
-	# very general overview of its format:
-
-	# results [0] - 	results of query to select basic tracking record
-	#			info from WTS_TrackRec for those matching the
-	#			basic (non-dependency) query criteria.  Its
-	#			results were put into temp_table, so it returns
-	#			[].
-	# results [1..main_query_position - 1] - up to four queries to handle
-	#			dependencies among tracking records if the user
-	#			selected "Depends On X" or "X Depends On" at the
-	#			query form.  These queries add info to
-	#			temp_table and so should each return [].
-	# results [main_query_position] - this result is a list of dictionaries,
-	#			each of which is a row from temp_table (which
-	#			is the basic data for the tracking records
-	#			selected).  If we were able to do sorting in
-	#			the database, then the dictionaries in this
-	#			list are in the proper order.  The variable
-	#			main_query_position will be between 1 and 5,
-	#			depending on how many queries were used above
-	#			for dependencies.  Each dictionary has the same
-	#			set of keys; however, that set will vary
-	#			depending on which options for display and
-	#			sorting the user selected on the query form.
-	# results [main_query_position + 1..] -	up to four entries remain in
-	#			results, depending on how many of the multi-
-	#			valued controlled vocabulary fields were
-	#			selected for display or sorting.  Each of these
-	#			results will be a list of dictionaries.  Each
-	#			dictionary will contain a tracking record key
-	#			(_TR_key) and a controlled vocab index (_*_key).
-	#			A given tracking record key may occur in
-	#			multiple dictionaries, as each will contain only
-	#			one c.v. value.  Each of these results is
-	#			indexed in queried_cv [attribute name].  So, if
-	#			we asked to display Area, the data retrieved for
-	#			it would be at:  results [queried_cv ['Area']].
-	# There could be up to two additional entries which are empty sets of
-	# results.  These are from dropping temp tables as needed.
+
+		# break any ties by tracking record number, so that the order
+		# (and so each page) is the same from one run to the next
+
+		if 'TR Nr' not in sorting:
+			order.append ('_tr_key')
+		qry = qry + ' order by %s' % wtslib.list_To_String (order)
+
+		if page is not None:
+			(page_number, page_size) = page
+			qry = qry + ' limit %d offset %d' % (page_size,
+				(page_number - 1) * page_size)
+
+	# fields we need to display are renamed to the corresponding object
+	# attribute name (which is more easily readable); others are dropped.
+
+	global DB_TO_NAME		# we need to convert the key names from
+					# their database fieldnames to the
+					# object attribute names for the user.
+
+	display_map = {}
+	for field in keys_to_display:
+		if DB_TO_NAME.has_key (field):
+			display_map [field] = DB_TO_NAME [field]
+
+	# the relevance and matching text of a full-text search are always
+	# shown
+
+	if text_columns:
+		for field in [ 'text_rank', 'text_snippet' ]:
+			display_map [field] = DB_TO_NAME [field]
+
+	return { 'sql' : qry, 'python_sort' : python_sort,
+		'sorting' : sorting, 'ordering' : ordering,
+		'display_map' : display_map }
+
+def finish_Query_Rows (
+	results,	# list of rows returned by the query from
+			# build_Query_SQL()
+	plan		# dictionary, as returned by build_Query_SQL()
+	):
+	# Purpose: turn the rows returned by a query on the tracking record
+	#	Query Form into the results we show the user
+	# Returns: a list of dictionaries, each of which corresponds to a
+	#	single tracking record, in the order requested
+	# Assumes: nothing
+	# Effects: looks up the names of single-valued controlled vocabulary
+	#	terms, sorts the rows (if we must sort in Python), keeps only
+	#	the fields to display (renamed to their object attribute
+	#	names), and converts the Directory field to a URL
+	# Throws: nothing
+	# Notes: For a query which streams its rows through a cursor, we call
+	#	this once for each batch of rows, so it must not depend on
+	#	seeing them all.  (If we sort in Python, the rows are not
+	#	streamed.)
+	#
+	#	The "Directory" field requires special handling.  The database
+	#	stores only a relative directory.  We really want to return a
+	#	URL to that directory.  So, as a final data cleanup, we replace
+	#	values in the Directory field (if there is one) with the
+	#	appropriate URL.
+
+	# "results" is a list of dictionaries, each of which has the data
+	# for one tracking record.  Each dictionary has the same set of keys;
+	# however, that set will vary depending on which options for display
+	# and sorting the user selected on the query form.  If we were able
+	# to do sorting in the database, then the dictionaries in this list
+	# are in the proper order.
 
 	# Since list traversal is very slow, let's build a dictionary keyed
 	# by tracking record numbers which refer to the actual dictionaries of
@@ -2633,26 +2508,12 @@ def build_And_Run_SQL (
 
 	track_recs = {}		# dictionary of [ tr # ] ==> { tr info }
 
-	# the main query has one dictionary of basic information for each
-	# tracking record which fits the query criteria.  Use its (mandatory)
-	# _TR_key field as its key in track_recs.
-
-	for row in results [ main_query_position ]:
-		if row.has_key('_tr_key'):
-			track_recs [ row [ '_tr_key' ] ] = row
-		else:
-			track_recs [ row [ '_tr_key' ] ] = row
+	for row in results:
+		track_recs [ row [ '_tr_key' ] ] = row
 
 	tr_numbers = track_recs.keys ()		# get all tracking record
 						# numbers returned in query
 
-	# Now we need to merge the many-to-many relationships returned with the
-	# basic tracking record info already returned
-
-	# first, add the entries from the m-m controlled vocabs
-
-	compile_multi_valued_cv (track_recs, tr_numbers, queried_cv, results)
-	
 	# now do single-valued controlled-vocabulary lookups where necessary.
 
 	compile_single_valued_cv (track_recs, tr_numbers)
@@ -2665,48 +2526,40 @@ def build_And_Run_SQL (
 				# the data for a single tracking record) in the
 				# order requested by the user on the query form
 
-	if not python_sort:	# if we don't need to do the sorting in python,
-				# then we already did it in the database.  We
-				# have done all our updates using track_recs,
-				# which is a dictionary of references to mutable
-				# objects (one dictionary for each tracking
-				# record) in the main query results.  So, the
-				# results for the main query are already sorted
-				# and can be used as our final_results.
+	# if we don't need to do the sorting in python, then we already did it
+	# in the database.  We have done all our updates using track_recs,
+	# which is a dictionary of references to mutable objects (one
+	# dictionary for each tracking record) in the main query results.
+	# So, the results for the main query are already sorted and can be
+	# used as our final_results.
+
+	if not plan ['python_sort']:
 
-		final_results = results [ main_query_position ]
+		final_results = results
 
 	else:
 		# pass relevant information in to the sort_results function
 		# which will produce the sorted list in final_results
 
-		final_results = sort_results (track_recs, tr_numbers, sorting,
-			ordering)
+		final_results = sort_results (track_recs, tr_numbers,
+			plan ['sorting'], plan ['ordering'])
 
 	# now, strip out unnecessary fields (some were only used to aid in
 	# sorting the results, and we only want to return the fields which the
 	# user asked to display.
 
-	global DB_TO_NAME		# we need to convert the key names from
-					# their database fieldnames to the
-					# object attribute names for the user.
-	for row in final_results:
-
-		# for each tracking record, look at each field...
+	# fields we need to display are renamed to the corresponding object
+	# attribute name (which is more easily readable); others are dropped.
+	# Rows from wtslib.sql share their column layout, so this renames
+	# the layout once rather than rebuilding every row.
 
-		for field in row.keys():
+	final_results = wtslib.renameColumns (final_results,
+		plan ['display_map'])
 
-			# if we need to display this field, then add a new
-			# entry with the same value keyed by the corresponding
-			# object attribute name (which is more easily readable)
-
-			if field in keys_to_display:
-				row [ DB_TO_NAME [field]] = row [field]
-
-			del row [field]		# then delete the old field
+	for row in final_results:
 
-		# and, if there is a Directory field, then replace its value
-		# with the appropriate URL
+		# if there is a Directory field, then replace its value with
+		# the appropriate URL
 
 		if row.has_key ('Directory'):
 			if str (row ['Directory']) != 'None':
@@ -2715,7 +2568,7 @@ def build_And_Run_SQL (
 
 	return final_results
 
-# --- begin helper functions for build_And_Run_SQL --- #
+# --- begin helper functions for build_Query_SQL --- #
 
 def consider_TR_Nr (
 	clean_dict,	# validated dictionary of fieldname -> desired value
@@ -2831,20 +2684,108 @@ def consider_simpleText (
 
 def convertDate (fieldname):
 	# returns a string which can be inserted into the 'select' portion of
-	# a query to convert the value for the named datetime field to be a 
-	# string when it comes out of the database
-
-	return "to_char(%s, 'MM/DD/YYYY HH:MI')" % fieldname
+	# a query to convert the value for the named datetime field to be a
+	# string in the standard WTS format (as from wtslib.format_DateTime).
+	# Only needed where the date must be a string within the query, as
+	# for the Status History in LOAD_SELECT; otherwise, select the date
+	# itself and format it when it is shown.
+
+	return "to_char(%s, 'MM/DD/YYYY HH12:MI AM')" % fieldname
+
+#-Prepared Statements-------------------------------------------------------
+
+# This is the query for loading a tracking record in a single round trip.
+# Each many-to-many field comes back as an array, in display order.  Each
+# status history entry is one string, with status, staff, and date separated
+# by tabs; these are unpacked by unpack_Loaded_TR().  The '%s' is filled in
+# with the condition for selecting tracking records.
+
+LOAD_SELECT = '''
+	select tr._TR_key, pri.priority_name,
+		size.size_name, stat.status_name,
+		staff1.staff_username status_staff_username,
+		tr.attention_by,
+		tr.status_set_date, tr.tr_title,
+		tr.directory_variable,
+		tr.modification_date,
+		(select tx.text_block from WTS_Text tx
+			where (tx._TR_key = tr._TR_key)
+				and (tx.text_type = %d)) as project_definition,
+		(select tx.text_block from WTS_Text tx
+			where (tx._TR_key = tr._TR_key)
+				and (tx.text_type = %d)) as progress_notes,
+		array (select shstat.status_name || E'\\t' ||
+				shstaff.staff_username || E'\\t' || %s
+			from WTS_Status_History sh, CV_WTS_Status shstat,
+				CV_Staff shstaff
+			where (sh._TR_key = tr._TR_key)
+				and (sh._Staff_key = shstaff._Staff_key)
+				and (sh._Status_key = shstat._Status_key)
+			order by sh.set_date desc) as status_history,
+		array (select rel._Related_TR_key
+			from WTS_Relationship rel
+			where (rel._TR_key = tr._TR_key)
+				and (rel.relationship_type = %d)
+				and (rel.transitive_closure = 0)) as depends_on,
+		array (select CVarea.area_name
+			from WTS_Area MMarea, CV_WTS_Area CVarea
+			where (MMarea._TR_key = tr._TR_key)
+				and (MMarea._Area_key = CVarea._Area_key)
+			order by CVarea.area_order) as area,
+		array (select CVtype.type_name
+			from WTS_Type MMtype, CV_WTS_Type CVtype
+			where (MMtype._TR_key = tr._TR_key)
+				and (MMtype._Type_key = CVtype._Type_key)
+			order by CVtype.type_order) as type,
+		array (select CVstaff.staff_username
+			from WTS_Staff_Assignment MMstaff, CV_Staff CVstaff
+			where (MMstaff._TR_key = tr._TR_key)
+				and (MMstaff._Staff_key = CVstaff._Staff_key)
+			order by CVstaff.staff_grouping,
+				CVstaff.staff_username) as staff_list,
+		array (select CVstaff.staff_username
+			from WTS_Requested_By MMreqby, CV_Staff CVstaff
+			where (MMreqby._TR_key = tr._TR_key)
+				and (MMreqby._Staff_key = CVstaff._Staff_key)
+			order by CVstaff.staff_grouping,
+				CVstaff.staff_username) as requested_by
+	from WTS_TrackRec tr, CV_WTS_Priority pri,
+		CV_WTS_Size size, CV_WTS_Status stat,
+		CV_Staff staff1
+	where ((tr._Priority_key = pri._Priority_key) and
+		(tr._Size_key = size._Size_key) and 
+		(tr._Status_key = stat._Status_key) and
+		(tr._Status_Staff_key = staff1._Staff_key) and
+		%%s)''' % (
+			PROJECT_DEFINITION, PROGRESS_NOTES,
+			convertDate('sh.set_date'), DEPENDS_ON)
+
+wtslib.definePrepared ('loadTrackRec', [ 'int' ],
+	LOAD_SELECT % '(tr._TR_key = $1)')
+wtslib.definePrepared ('loadTrackRecs', [ 'int[]' ],
+	LOAD_SELECT % '(tr._TR_key = any ($1))')
+
+# retrieving one of the large text fields (see getText)
+
+wtslib.definePrepared ('getText', [ 'int', 'int' ], '''
+	select text_block
+	from WTS_Text
+	where (_TR_key = $1) and (text_type = $2)''')
+
+# saving the large text fields (see save_Text_Fields).  These take bind
+# parameters (text block, TR key, text type) rather than being prepared, as
+# each is run at most twice per save.
+
+INSERT_TEXT = '''insert into WTS_Text (text_block, _TR_key, text_type)
+	values (%s, %s, %s)'''
+UPDATE_TEXT = '''update WTS_Text set text_block = %s
+	where ((_TR_key = %s) and (text_type = %s))'''
 
 def consider_date (
 	name,		# name of the date field (in object attribute (user-
 			# readable) form) to examine, e.g.- "Needs Attention By"
 	fieldname,	# name of the corresponding field in the database,
 			# including a two-letter abbreviation for the table name
-	sort_fieldname,	# name of the new fieldname to create for sorting
-			# purposes.  (the regular fieldname will be converted
-			# from a datetime to a string, which isn't easily
-			# sortable).
 	to_display,	# list of names of object attributes to display
 	select,		# list of fieldnames to select from the database
 	clean_dict,	# validated dictionary of fieldname -> desired value
@@ -2874,13 +2815,15 @@ def consider_date (
 	#	suitable for inclusion in the "order by" part of a SQL select
 	#	statement.
 	# Throws: nothing
+	# Notes: The date comes back from the database as a datetime value,
+	#	which sorts properly as it is, and is only converted to a
+	#	string when it is shown (see build_Query_Table()).
 
-	# if we need to display this one, then convert it to a string and
-	# use the same fieldname (though without the leading table abbreviation)
+	# if we need to display or sort by this one, then select it, using the
+	# same fieldname (though without the leading table abbreviation)
 
-	if name in to_display:
-		select.append ('%s as %s' % \
-			(convertDate(fieldname), fieldname[3:]))
+	if (name in to_display) or (name in sorting):
+		select.append ('%s as %s' % (fieldname, fieldname[3:]))
 
 	# now, if this date field was specified in the dictionary of inputs
 	# from the user, then we know we need to add clauses to where for it.
@@ -2909,8 +2852,7 @@ def consider_date (
 
 	for i in [ 0, 1, 2 ]:
 		if sorting [i] == name:
-			select.append (fieldname + ' ' + sort_fieldname)
-			order [i] = sort_fieldname + ' ' + ordering [i]
+			order [i] = fieldname [3:] + ' ' + ordering [i]
 	return
 
 def consider_single_valued_cv (
@@ -2994,6 +2936,8 @@ def consider_single_valued_cv (
 
 	for i in [ 0, 1, 2 ]:
 		if sorting [i] == name:
+			if main_fieldname not in select:
+				select.append (main_fieldname)
 			frm.append (table_abbrev)
 			select.append (order_fieldname)
 			joins.append ('%s = %s' % (main_fieldname,
@@ -3004,13 +2948,12 @@ def consider_single_valued_cv (
 def consider_multi_valued_cv (
 	name,		# name of the multi-valued controlled vocabulary field
 			# (in object attribute (user-readable) form) to examine
-	mm_tablename,	# name of the table containing the many-to-many 
+	mm_tablename,	# name of the table containing the many-to-many
 			# relationship data for this tracking record field
 	table_abbrev,	# two-letter abbreviation for mm_tablename
 	fieldname,	# name of the field in the table referred to by
 			# mm_tablename which corresponds to the controlled
 			# vocabulary
-	to_display,	# list of names of object attributes to display
 	clean_dict,	# validated dictionary of fieldname -> desired value
 			# pairs to use in generating and running queries.
 	clean_keys,	# list of keys in clean_dict
@@ -3020,6 +2963,12 @@ def consider_multi_valued_cv (
 			# in the "where" part of a SQL select statement
 	sorting,	# tuple containing three strings, each the name of a
 			# field to use in sorting the results.
+	order,		# three-item list containing string clauses on how to
+			# sort the results.  (for the "order by" part of a
+			# SQL select statement)
+	ordering,	# three-item tuple containing a string identifying how
+			# each level of sorting should be conducted:
+			# ('asc' = ascending order, 'desc' = descending order)
 	frm		# list of tables and their abbreviations used in the
 			# query (essentially the contents of the "from" section
 			# of a SQL select statement)
@@ -3027,23 +2976,19 @@ def consider_multi_valued_cv (
 	# Purpose: to alter the "where" list of clauses to ensure that any
 	#	tables needed for the many-to-many controlled vocabulary
 	#	fields are included, and alter the "joins" list to ensure that
-	#	they have been joined.  also to determine whether sorting may be
-	#	done in the database and whether we need to display any of
-	#	these multi-valued fields.
-	#	results based partly on the specified object attribute (name)
-	# Returns: a tuple of booleans (0/1) which has two items:
-	#	(need to sort this field, need to display this field)
+	#	they have been joined.  also to alter "order" if we need to
+	#	sort the results by the specified object attribute (name)
+	# Returns: nothing
 	# Assumes: parameters are formatted as described above
 	# Effects: Alters "where" and "joins" if we need to select the query
 	#	results based on the specified object attribute (a multi-valued
 	#	controlled vocabulary field) (appends strings of clauses
 	#	suitable for inclusion in the "where" part of a SQL select
-	#	statement).  Determines if this field is okay to sort in the
-	#	database and whether it needs to be displayed.
+	#	statement).  Alters "order" if we need to sort by it.
 	# Throws: nothing
-					# assume:
-	need_to_sort = 0		# we don't need to sort by this field
-	need_to_display = 0		# we don't need to display this field
+	# Notes: We sort by the string of the field's term names built by
+	#	multi_valued_cv_columns(), using the "C" collation so it sorts
+	#	just as Python would sort the strings.
 
 	# if the user specified a restriction for this field it will be in the
 	# list of keys for the clean_dict.  In this case, we need to add the
@@ -3069,291 +3014,247 @@ def consider_multi_valued_cv (
 			where.append ('%s.%s in %s' % (table_abbrev, fieldname,
 				clean_dict [name] ))
 
+	# there are up to three levels of sorting.  Go through each, and see if
+	# it is based on the specified object attribute.  We sort by the alias
+	# of the column from multi_valued_cv_columns(); Postgres only allows an
+	# output alias in the "order by" as a bare name, so the "C" collation
+	# is applied to the column itself.
 
-	if name in to_display:
-		need_to_display = 1	# we do need to display this field
-	if name in sorting:
-		need_to_sort = 1	# we do need to sort this field
-
-	return (need_to_sort, need_to_display)
+	for i in [ 0, 1, 2 ]:
+		if sorting [i] == name:
+			order [i] = '%s %s' % (
+				string.lower (NAME_TO_DB [name]), ordering [i])
+	return
 
 
 
 def consider_dependencies (
-	temp_table,	# name of the temporary table into which to put tracking
-			# record information.
-	select,		# list of fields to select and add to temp_table
+	select,		# list of fields selected for each tracking record
 	frm,		# list of table names to select values from
 	joins,		# list of string clauses which are used to join tables
 			# in the "where" part of a SQL select statement
 	x_depends_on,	# boolean (0/1) - true if we should include tracking
-			# records depended on by those already in temp_table.
+			# records depended on by those in "matches".
 	depends_on_x	# boolean (0/1) - true if we should include tracking
-			# records which depend on thsoe already in temp_table.
+			# records which depend on those in "matches".
 			#	'X Depends On' in clean_keys,	# 0/1
 			#	'Depends On X' in clean_keys)	# 0/1
 	):
-	# Purpose: to build and return SQL statements which add information to
-	#	temp_table for tracking records related (via dependency) to
-	#	those already in temp_table, if so requested.
+	# Purpose: to build and return SQL select statements which get the
+	#	information in "select" for tracking records related (via
+	#	dependency) to those in "matches", if so requested.
 	# Returns: a list of strings (possibly an empty list), each of which is
-	#	a SQL statement needed to add the appropriate information to
-	#	temp_table
-	# Assumes: that the relationship_type field in WTS_Relationship should
-	#	be DEPENDS_ON to indicate a "depends on" type relationship.
-	# Effects: Generates and returns a list of SQL statements which will
-	#	add information to temp_table according to the settings of
-	#	x_depends_on and depends_on_x.  (see parameter comments above)
+	#	a SQL select statement returning the same columns as "select"
+	# Assumes: 1. that the relationship_type field in WTS_Relationship
+	#	should be DEPENDS_ON to indicate a "depends on" type
+	#	relationship; 2. that the statements will be run in a query
+	#	with a "matches" item in its WITH clause, which has the
+	#	tracking records matching the user's criteria; 3. that
+	#	'tr._TR_key' is the first item in "select"
+	# Effects: Generates and returns a list of SQL statements according to
+	#	the settings of x_depends_on and depends_on_x.  (see parameter
+	#	comments above)
 	# Throws: nothing
 
 	dependency_queries = []		# start with no queries for dependency-
 					# related information
 
-	if not (x_depends_on or depends_on_x):	# if we don't need to add any
-		return dependency_queries	# dependency-related info, then
-						# just bail out.
-
-	# let's generate a couple more names for temporary tables, to help
-	# handle any dependency information.  We just arbitrarily put a 1 or 2
-	# into the string to make it a unique name.  (Previously, I had tried
-	# adding a 1 or 2 at the end, but the names were not considered unique.
-	# I suspect that sybase only compares the first X characters.)
+	# the columns other than the TR number, and the joins to any other
+	# tables they come from
 
-	temp_table_1 = temp_table [0:4] + '1' + temp_table [4:]
-	temp_table_2 = temp_table [0:4] + '2' + temp_table [4:]
+	others = wtslib.list_To_String (remove (select, 'tr._TR_key'))
+	if others:
+		others = ', ' + others
+	join_clauses = ''
+	for clause in joins:
+		join_clauses = join_clauses + ' and (%s)' % clause
 
-	# those depended on by X...  (put them in temp_table_1 to avoid any
-	# interference they might cause if both boxes are checked)
+	# those depended on by X...
 
 	if x_depends_on:
 
-		# we need to add the basic tracking record information for all
-		# those depended on by ones already in temp_table (including
-		# the full transitive closure).
+		# we need the basic tracking record information for all
+		# those depended on by ones in "matches" (including the full
+		# transitive closure).
 
-		dep_qry_1 = '''
-			select rel._Related_TR_key _TR_key, %s
-			into %s
+		dependency_queries.append ('''
+			select rel._Related_TR_key as _TR_key%s
 			from WTS_Relationship rel, %s
 			where ((rel._Related_TR_key = tr._TR_key) and
 				(rel.transitive_closure = 1) and
 				(rel.relationship_type = %d) and
-				(rel._TR_key in (select _TR_key from %s)))''' \
-			% (wtslib.list_To_String (remove(select, 'tr._TR_key')),
-				temp_table_1, wtslib.list_To_String (frm),
-				DEPENDS_ON, temp_table)
-
-		# if we need to link any of the tables in "frm", do so:
-
-		if len (joins) > 0:
-			for clause in joins:
-				dep_qry_1 = dep_qry_1 + ' and (%s)' % clause
-
-		dependency_queries.append (dep_qry_1)
-
-		# now move all those entries from temp_table_1 to temp_table,
-		# and drop temp_table_1
+				(rel._TR_key in (select _TR_key from matches)))%s''' \
+			% (others, wtslib.list_To_String (frm), DEPENDS_ON,
+				join_clauses))
 
-		dependency_queries.append ('insert into %s select * from %s' % \
-			(temp_table, temp_table_1))
-		dependency_queries.append ('drop table %s' % temp_table_1)
-
-	# those depending on X...  (put them in temp_table_2 to avoid any
-	# interference they might cause if both boxes are checked)
+	# those depending on X...
 
 	if depends_on_x:
 
-		# we need to add the basic tracking record information for all
-		# those which depend on ones already in temp_table (including
-		# the full transitive closure).
+		# we need the basic tracking record information for all
+		# those which depend on ones in "matches" (including the full
+		# transitive closure).
 
-		dep_qry_2 = '''
-			select rel._TR_key, %s
-			into %s
+		dependency_queries.append ('''
+			select rel._TR_key%s
 			from WTS_Relationship rel, %s
 			where ((rel._TR_key = tr._TR_key) and
 				(rel.transitive_closure = 1) and
 				(rel.relationship_type = %d) and
 				(rel._Related_TR_key in
-					(select _TR_key from %s)))''' % \
-			(wtslib.list_To_String (remove (select, 'tr._TR_key')),
-			temp_table_2, wtslib.list_To_String (frm), DEPENDS_ON,
-			temp_table)
-
-		# if we need to link any of the tables in "frm", do so:
-
-		if len (joins) > 0:
-			for clause in joins:
-				dep_qry_2 = dep_qry_2 + ' and (%s)' % clause
-
-		dependency_queries.append (dep_qry_2)
-
-		# move the entries from temp_table_2 to the main temp_table,
-		# and drop temp_table_2
-
-		dependency_queries.append ('insert into %s select * from %s' % \
-			(temp_table, temp_table_2))
-		dependency_queries.append ('drop table %s' % temp_table_2)
+					(select _TR_key from matches)))%s''' \
+			% (others, wtslib.list_To_String (frm), DEPENDS_ON,
+				join_clauses))
 
 	return dependency_queries
 
-def lookup_multi_valued_cv (
-	temp_table,	# name of the temporary table into which we put tracking
-			# record information.
+def multi_valued_cv_columns (
 	multi_cv,	# defined above in build_And_Run_SQL - a list of tuples
 			# with info about multi-valued controlled vocabulary
-			# fields: name, mm_table, abbrev, fieldname
+			# fields: name, mm_table, abbrev, fieldname, CV table,
+			# name field in CV table
 	to_display,	# list of names of object attributes to display
-	sorting,	# tuple containing three strings, each the name of a
+	sorting		# tuple containing three strings, each the name of a
 			# field to use in sorting the results.
-	queries,	# list of strings, each of which is a SQL statement
-			# used in querying tracking records.
-	queried_cv	# defined above in build_And_Run_SQL - a dictionary
-			# which maps controlled vocabulary names to the index
-			# (into queries) of the query used to retrieve its
-			# information.
 	):
-	# Purpose: to generate queries which look up the values for the
-	#	multi-valued controlled vocabulary fields of the tracking
-	#	records in temp_table.
-	# Returns: nothing
-	# Assumes: nothing
-	# Effects: goes through the list of fields to_display and those listed
-	#	in sorting to determine which multi-valued controlled
-	#	vocabulary fields we need to load.  It then adds the necessary
-	#	SQL statements to queries, and updates queried_cv so that each
-	#	controlled vocabulary name is a key which refers to the index
-	#	(into queries) of the statement used to retrieve the values.
+	# Purpose: to generate the select-list items which look up the values
+	#	for the multi-valued controlled vocabulary fields of each
+	#	tracking record found
+	# Returns: a list of strings, each a SQL expression with an alias (the
+	#	field's database name, from NAME_TO_DB) for one field we need
+	#	to display or sort by
+	# Assumes: the expressions will be selected from the "found" item of
+	#	the WITH clause, abbreviated "res"
+	# Effects: nothing
 	# Throws: nothing
+	# Notes: Each expression gives the names of the field's terms for one
+	#	tracking record, sorted and separated by ', ' (as by
+	#	wtslib.list_To_String), or '' if it has none.  The "C"
+	#	collation sorts them (and the strings, when we sort by the
+	#	field) as Python would.
 
-	# step through all possible multi-valued controlled vocabulary fields
-	# and generate queries to look up the values for those we need to
-	# either display or sort by:
+	global NAME_TO_DB
 
-	for (name, mm_table, abbrev, fieldname) in multi_cv:
+	columns = []
+	for (name, mm_table, abbrev, fieldname, cv_table, cv_name) in multi_cv:
 		if (name in to_display) or (name in sorting):
-
-				# remember which query number is used for this
-				# c.v., then generate the query to get this
-				# field's information for all tracking records
-				# in the temp_table
-
-				queried_cv [name] = len (queries)
-				queries.append ('''
-					select _TR_key, %s
-					from %s
-					where _TR_key in (select _TR_key
-						from %s)''' % \
-					(fieldname, mm_table, temp_table))
-	return
-
-def compile_multi_valued_cv (
-	track_recs,	# dictionary of dictionaries, each of which contains
-			# the basic data for one tracking record.
-	tr_numbers,	# list of tracking record numbers in track_recs
-	queried_cv,	# dictionary where multi-valued controlled vocabulary
-			# field names are mapped to an integer which is the
-			# index into results where we may find the corresponding
-			# information.
-	results		# list of lists of dictionaries - see build_And_Run_SQL
-			# for a more complete explanation.
+			columns.append ('''coalesce ((
+				select string_agg (cv.%s, ', '
+					order by cv.%s collate "C")
+				from %s mm, %s cv
+				where (mm._TR_key = res._TR_key) and
+					(mm.%s = cv.%s)), '') collate "C"
+				as %s''' % \
+				(cv_name, cv_name, mm_table, cv_table,
+				fieldname, fieldname,
+				string.lower (NAME_TO_DB [name])))
+	return columns
+
+def consider_text_fields (
+	clean_dict,	# validated dictionary of fieldname -> desired value
+			# pairs to use in generating and running queries.
+	clean_keys,	# list of keys in clean_dict
+	where,		# list of string clauses for the "where" part of a
+			# SQL select statement.
+	joins,		# list of string clauses which are used to join tables
+			# in the "where" part of a SQL select statement
+	sorting,	# tuple containing three strings, each the name of a
+			# field to use in sorting the results.
+	order,		# three-item list containing string clauses on how to
+			# sort the results.  (for the "order by" part of a
+			# SQL select statement)
+	ordering,	# three-item tuple containing a string identifying how
+			# each level of sorting should be conducted:
+			# ('asc' = ascending order, 'desc' = descending order)
+	frm		# list of tables and their abbreviations used in the
+			# query (essentially the contents of the "from" section
+			# of a SQL select statement)
 	):
-	# Purpose: to add information retrieved for the various multi-valued
-	#	controlled vocabulary fields to the tracking record data in
-	#	track_recs.
+	# Purpose: to alter "frm", "joins", and "where" to select only those
+	#	tracking records with the given value in one of their big text
+	#	fields (Project Definition, Progress Notes), and "order" to
+	#	sort by relevance if asked to
 	# Returns: nothing
 	# Assumes: nothing
-	# Effects: uses queried_cv to find out what multi-valued controlled
-	#	vocabulary fields we retrieved and where in results they are
-	#	located.  We then compile the information and add it to the
-	#	tracking record data in track_recs
+	# Effects: see Purpose
 	# Throws: nothing
+	# Notes: With the default 'fulltext' TEXT_SEARCH, we look for the
+	#	words entered (in any order, and in any form with the same
+	#	stem) using the full-text index on WTS_Text.  With 'substring',
+	#	we look for the exact string entered, as WTS always used to.
+	#	Only a full-text search can be sorted by Relevance.
 
-	global NAME_TO_DB
-
-	# set up a dictionary of useful information for the four multi-valued
-	# controlled vocabularies.  Format:
-	#	vocab name --> (key name, dictionary of key --> text name,
-	#			text value field name, ordering field name)
-
-	CV = Controlled_Vocab.cv	# get a quick reference to the
-					# controlled vocabulary info that is
-					# already loaded in the
-					# Controlled_Vocab module
-	cv_info = {
-		'Area' : ('_area_key', CV ['CV_WTS_Area'].key_dict (),
-			'area_name', 'area_order'),
-		'Type' : ('_type_key', CV ['CV_WTS_Type'].key_dict (),
-			'type_name', 'type_order'),
-		'Staff' : ('_staff_key', CV ['CV_Staff'].key_dict (),
-			'staff_username', 'staff_username'),
-		'Requested By' : ('_staff_key', CV ['CV_Staff'].key_dict (),
-			'staff_username', 'staff_username')
-		}
-
-	queried_cv_keys = queried_cv.keys ()	# list of names of queried
-						# multi-valued controlled
-						# vocabulary fields
-
-	# We need to collect the name values for each cv into a list, and put
-	# the list in the proper tracking record entry
-
-	# step through the names of the fields we looked up
-
-	for key in queried_cv_keys:
-		db_key = NAME_TO_DB [key]	# the keys in each tracking
-						# record's dictionary are in
-						# their database fieldname form,
-						# so convert the object
-						# attribute name to that form.
-
-		# go to the set of results for this particular multi-valued
-		# controlled vocabulary field, and step through each row
-		# (dictionary) contained therein.
-
-		trKey = '_tr_key'
-
-		if not cv_info.has_key(key):
-			key = key.lower()
-
-		for row in results [queried_cv [key]]:
-
-			# if we have already begun a list for this field...
-
-                        if track_recs [row [trKey]].has_key (db_key):
-
-				# then just append the new value to it
-
-				track_recs [row [trKey]][db_key].append ( \
-					cv_info[key][1][row [cv_info [key][0]]])
-                        else:
-				# begin a new list of values for this field
-
-				track_recs [row [trKey]][db_key] = [ \
-					cv_info [key][1][row [cv_info \
-					[key][0]]] ]
+	if 'Text Fields' not in clean_keys:
+		return
 
-		# We have now finished compiling all the information.  Now we
-		# need to go through each tracking record and alphabetically
-		# sort the values for each multi-valued controlled vocabulary
-		# field and convert the list to a string.
+	frm.append ('WTS_Text tx')	# put new table in From list
 
-		for tr in tr_numbers:
-                        if track_recs [tr].has_key (db_key):
-				track_recs [tr][db_key].sort ()
-                        else:
+	# now, add clauses to the "joins" list that link the main tracking
+	# record (in tr) to its big text fields (in tx), and add to "where"
+	# to restrict the selection to only those tracking records which have
+	# the entered value in one of its text fields.
 
-				# this tracking record had no entries for
-				# this multi-valued controlled vocabulary field
+	joins.append ('tr._TR_key = tx._TR_key')
 
-				track_recs [tr][db_key] = []	# no data
+	if textSearchEngine () == 'substring':
+		where.append ("tx.text_block ilike '%s%s%s'" % \
+			("%", clean_dict ['Text Fields'], "%"))
+		return
 
-			# now, convert the list of CV values to a string
+	where.append ('%s @@ %s' % (textVector ('tx.text_block'),
+		textQuery (clean_dict ['Text Fields'])))
 
-			track_recs [tr][db_key] = wtslib.list_To_String ( \
-				track_recs [tr][db_key] )
+	for i in [ 0, 1, 2 ]:
+		if sorting [i] == 'Relevance':
+			order [i] = 'text_rank ' + ordering [i]
 	return
 
+def text_search_columns (
+	clean_dict,	# validated dictionary of fieldname -> desired value
+			# pairs to use in generating and running queries.
+	clean_keys	# list of keys in clean_dict
+	):
+	# Purpose: to generate the select-list items which rank each tracking
+	#	record found by a full-text search, and show the text which
+	#	matched
+	# Returns: a list of strings, each a SQL expression with an alias;
+	#	empty unless this is a full-text search
+	# Assumes: the expressions will be selected from the "found" item of
+	#	the WITH clause, abbreviated "res", and that the WITH clause
+	#	has a "matches" item with the tracking records which matched
+	#	the search itself
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: "text_rank" is the best rank of any of the tracking record's
+	#	text fields (rounded to three places), and "text_snippet" has
+	#	up to two fragments of each matching one, with the matching
+	#	words marked as for highlightSnippet().  Both are empty for
+	#	tracking records which were only included as dependencies.
+
+	if ('Text Fields' not in clean_keys) or \
+			(textSearchEngine () == 'substring'):
+		return []
+
+	vector = textVector ('t.text_block')
+	query = textQuery (clean_dict ['Text Fields'])
+	return [ '''coalesce ((
+			select round (max (ts_rank (%s, %s))::numeric, 3)
+			from WTS_Text t
+			where (t._TR_key = res._TR_key) and (%s @@ %s)
+				and (res._TR_key in
+					(select _TR_key from matches))), 0)
+			as text_rank''' % (vector, query, vector, query),
+		'''coalesce ((
+			select string_agg (regexp_replace (ts_headline ('%s',
+				t.text_block, %s, '%s'), '[[:space:]]+', ' ',
+				'g'), ' ... ' order by t.text_type)
+			from WTS_Text t
+			where (t._TR_key = res._TR_key) and (%s @@ %s)
+				and (res._TR_key in
+					(select _TR_key from matches))), '')
+			as text_snippet''' % (TEXT_SEARCH_CONFIG, query,
+			TEXT_SNIPPET_OPTIONS, vector, query) ]
+
 def compile_single_valued_cv (
 	track_recs,	# dictionary of dictionaries, each of which contains
 			# the basic data for one tracking record.
@@ -3422,89 +3323,62 @@ def sort_results (
 	#	"ordering".
 	# Returns: list of dictionaries, each of which is the data for a
 	#	tracking record, in proper sorted order
-	# Assumes: nothing
+	# Assumes: each tracking record has a value for each field in
+	#	"sorting" (in database fieldname form, as in NAME_TO_DB)
 	# Effects: see Purpose.
 	# Throws: nothing
+	# Notes: This is only used if the SORT_ENGINE config parameter is
+	#	'python'; normally the database sorts the results.  Python's
+	#	sort is stable, so we sort once for each level, starting with
+	#	the last; each sort is O(n log n).  Single-valued controlled
+	#	vocabularies sort by their order in the vocabulary, so for
+	#	each of those we build a dictionary of term name -> rank once,
+	#	rather than searching the vocabulary for every row.
 
 	global NAME_TO_DB
 
-	# list_to_sort is a list of tuples that we build to be sorted
-	# by python.  Each tuple is for one tracking record, and
-	# contains:
-	#	 ( [sort values], { tracking record info } )
-
-	list_to_sort = []
+	final_results = []
 	for tr in tr_numbers:
+		final_results.append (track_recs [tr])
 
-		# for each tracking record, we need to build a tuple with its
-		# "sort values".  These are the values for each field specified
-		# as a sort field on the query form. 
-
-		sort_values = []	# up to three values to be used in
-					# sorting the results.
-		for i in [ 0, 1, 2 ]:		# <= 3 sort levels
-
-			# if there is a defined field for this sorting level,
-			# then use it.  Note that we test for a text 'None',
-			# since that is how it is passed in from the query form
-			# if we don't need that level of sorting.
-
-			if sorting [i] <> 'None':
-
-				# get the actual value of this field
-
-				value = track_recs [tr][NAME_TO_DB[sorting [i]].lower()]
-
-				# now, since we're sorting by this field, we
-				# need to handle single-valued controlled
-				# vocabularies differently.  (They need to be
-				# sorted as specified in their *_order field.)
-
-				if sorting [i] in ['Priority','Status','Size']:
-					name = 'CV_WTS_%s' % sorting[i]
-					vocab_values = Controlled_Vocab.cv \
-						[name].pickList (showAll = 1)
-					value = vocab_values.index (value)
-
-				# if we're looking at this field for ascending
-				# order, then just use the actual value in
-				# sorting the results.
+	for i in [ 2, 1, 0 ]:		# <= 3 sort levels, last first
 
-				if ordering [i] == 'asc':
-					sort_values.append (value)
-				else:
-
-				# otherwise, we need to sort this field in
-				# descending order.  use the opposite function
-				# (defined in this module) to get the 'opposite'
-				# value, which will sort in reverse order.
-
-					sort_values.append (opposite (value))
-
-		# now, add the above-described tuple to the list of items to
-		# be sorted.
+		# Note that we test for a text 'None', since that is how it is
+		# passed in from the query form if we don't need that level of
+		# sorting.
 
-		list_to_sort.append ((sort_values, track_recs [tr]))
+		if sorting [i] == 'None':
+			continue
 
-	# python will sort based on the first item of each list element.  These
-	# items are the sort_values that we defined for each list element.
-	# Hence, we have correct sorting.
+		field = NAME_TO_DB [sorting [i]].lower()
 
-	list_to_sort.sort ()
+		# Relevance is only there for a full-text search
 
-	# then, put the actual tracking record data, in order, into the list
-	# for final_results.
+		if final_results and not final_results [0].has_key (field):
+			continue
 
-	final_results = []		# ensure we start with an empty list
+		if sorting [i] in [ 'Priority', 'Status', 'Size' ]:
+			rank = {}
+			names = Controlled_Vocab.cv ['CV_WTS_%s' % \
+				sorting [i]].pickList (showAll = 1)
+			for j in range (0, len (names)):
+				rank [names [j]] = j
+			sort_key = lambda row, field = field, rank = rank: \
+				rank.get (row [field], -1)
+		else:
+			sort_key = lambda row, field = field: row [field]
 
-	for (sort_values, track_rec_data) in list_to_sort:
-		final_results.append (track_rec_data)
+		final_results.sort (key = sort_key,
+			reverse = (ordering [i] == 'desc'))
 
 	return final_results
 
 # --- end of helper functions for build_And_Run_SQL --- #
 
 
+QUERY_RESULT_DATES = [ 'Needs Attention By', 'Modification Date', \
+	'Status Date' ]		# the date fields in query results
+
 def build_Query_Table (
 	clean_results	# a list of dictionaries, each of which represents a
 			# single tracking record, as from build_And_Run_SQL.
@@ -3530,8 +3404,7 @@ def build_Query_Table (
 	# take note of the date fields, which will need to be converted to the
 	# standard WTS format before output
 
-	date_fields = [ 'Needs Attention By', 'Modification Date', \
-		'Status Date' ]
+	date_fields = QUERY_RESULT_DATES
 
 	# for now, we define the ordering of the columns.  In the future, we
 	# may choose to let the user define this in some way.
@@ -3539,7 +3412,7 @@ def build_Query_Table (
 	column_order = [ 'TR Nr', 'Title', 'Area', 'Type', \
 		'Needs Attention By', 'Priority', 'Requested By', 'Status', \
 		'Status Date', 'Size', 'Staff', 'Directory', \
-		'Modification Date' ]
+		'Modification Date', 'Relevance', 'Matching Text' ]
 
 	# now, get an ordered list of the columns we actually have
 
@@ -3566,7 +3439,11 @@ def build_Query_Table (
 			helpCol = 'TR_Nr'
 		else:
 			helpCol = col
-		row.append (HTMLgen.TH (HTMLgen.Href (HELP_URL % helpCol, col)))
+		if col in [ 'Relevance', 'Matching Text' ]:
+			row.append (HTMLgen.TH (col))	# no help file
+		else:
+			row.append (HTMLgen.TH (HTMLgen.Href (
+				HELP_URL % helpCol, col)))
 	tbl.append (row)
 
 	# now, add one row for each tracking record in the clean results
@@ -3588,21 +3465,19 @@ def build_Query_Table (
 					str (tr [col]), tr [col]) ))
 			else:
 				out_value = ''
-				if col not in date_fields:
+				if col == 'Matching Text':
+					out_value = highlightSnippet (
+						str (tr [col]))
+				elif col not in date_fields:
 					out_value = tr [col]
 				else:
-					# this is a date value, so make sure it
-					# is properly formatted.  Since it came
-					# from the database, the only errors
-					# which could occur arise from a null
-					# value -- we can screen these out
-					# beforehand.  (null values are okay
-					# for some date fields)
-
-					if tr [col] is not None:
-						out_value, ignore_errors = \
-							wtslib.parse_DateTime \
-							(tr [col])
+					# this is a date value, as it came
+					# from the database, so format it.
+					# (null values are okay for some date
+					# fields, and become '')
+
+					out_value = wtslib.format_DateTime (
+						tr [col])
 
 				if out_value == '':
 					# this field is empty, so just
@@ -3617,9 +3492,9 @@ def build_Query_Table (
 
 
 def parse_And_Merge (
-	results,	# list of dictionaries, each of which is a row returned
-			# by a SQL statement (as from db.sql using the
-			# 'auto' mechanism).
+	results,	# list of dictionaries (or wtslib.Row objects), each of
+			# which is a row returned by a SQL statement (as from
+			# wtslib.sql).
 	key_name	# name of the key in the dictionaries in results which
 			# is considered a unique identifier for individual
 			# conceptual records in "results"
@@ -3687,10 +3562,8 @@ def parse_And_Merge (
 		# now go through each field in this row, and see if we need
 		# to add its value to the unified record.
 
-		unified_keys = unified.keys ()	# keys currently in the unified
-						# record...
 		for k in row.keys ():
-			if k not in unified_keys:
+			if not unified.has_key (k):
 				unified [k] = row [k]	# define new key & value
 			elif unified [k] == None:
 				unified [k] = row [k]	# define new key & value
@@ -3746,6 +3619,34 @@ def parse_And_Merge (
 	return list
 
 
+# The fixed tables used by validate_Query_Form():
+
+# a dictionary which maps from names with underscores to names with spaces.
+# This is to allow for GET submissions, which don't allow spaces in the URL.
+
+QUERY_NAME_MAPPING = {
+	'TR'		:	'TR Nr',
+	'TR_Nr'		:	'TR Nr',
+	'Status_Date'	:	'Status Date',
+	'Needs_Attention_By' :	'Needs Attention By',
+	'Requested_By'	:	'Requested By',
+	'Modification_Date' :	'Modification Date' }
+
+# the controlled vocabulary fields and tables:
+
+QUERY_CVS = [ ('Priority', 'CV_WTS_Priority'), \
+	('Size', 'CV_WTS_Size'), ('Status', 'CV_WTS_Status'), \
+	('Area', 'CV_WTS_Area'), ('Type', 'CV_WTS_Type'), \
+	('Staff', 'CV_Staff'),
+	('Requested By', 'CV_Staff'), ('Requested_By', 'CV_Staff'),
+	('Status Staff', 'CV_Staff') ]
+
+# the date fields, each a range of dates:
+
+QUERY_DATES = [ 'Status Date', 'Needs Attention By', \
+	'Modification Date', 'Status_Date', 'Needs_Attention_By', \
+	'Modification_Date' ]
+
 def validate_Query_Form (
 	raw_dict	# a dictionary of (user-format) fieldname --> field
 			# value pairs from a query form.
@@ -3777,8 +3678,9 @@ def validate_Query_Form (
 	#		'Size' : 'small, medium',
 	#		'Modification Date' : 'January 2, 1998..June 1, 1999' }
 	#	results in:
-	#		{ 'TR Nr' : '(_TR_Nr in (1)) or ((_TR_Nr >= 3) and
-	#			(_TR_Nr <= 6)) or (_TR_Nr >= 10)',
+	#		{ 'TR Nr' : [ '(tr._TR_key >= 10)',
+	#			'((tr._TR_key >= 3) and (tr._TR_key <= 6))',
+	#			"(tr._TR_key = any ('{1}'::int[]))" ],
 	#		'Size' : '2, 3',
 	#		'Modification Date' : '01-02-1998..06-01-1999' }
 
@@ -3787,29 +3689,17 @@ def validate_Query_Form (
 	CV = Controlled_Vocab.cv	# quick reference to CV info
 	errors = []			# no errors so far
 
-	# define a dictionary which maps from names with underscores to
-	# names with spaces.  This is to allow for GET submissions, which
-	# don't allow spaces in the URL.
-
-	Query_Name_Mapping = {
-		'TR'		:	'TR Nr',
-		'TR_Nr'		:	'TR Nr',
-		'Status_Date'	:	'Status Date',
-		'Needs_Attention_By' :	'Needs Attention By',
-		'Requested_By'	:	'Requested By',
-		'Modification_Date' :	'Modification Date' }
-
 	# make a copy ("raw") of the input dictionary to work with, and
-	# convert its keys using "Query_Name_Mapping"
+	# convert its keys using QUERY_NAME_MAPPING
 
 	raw = copy.deepcopy (raw_dict)
 	for k in raw.keys ():
-		if Query_Name_Mapping.has_key (k):
-			raw [Query_Name_Mapping [k]] = copy.deepcopy (raw [k])
+		if QUERY_NAME_MAPPING.has_key (k):
+			raw [QUERY_NAME_MAPPING [k]] = copy.deepcopy (raw [k])
 			del raw [k]
 
 	# convert the fieldnames embedded in the Displays field using the
-	# "Query_Name_Mapping".  Also strip out spaces.
+	# QUERY_NAME_MAPPING.  Also strip out spaces.
 
 	if raw.has_key ("Displays"):
 		fields = []
@@ -3817,28 +3707,19 @@ def validate_Query_Form (
 		# POST submissions come here separated by comma-space, and GET
 		# submissions come separated only by commas.  So first, convert:
 
-		stripped = regsub.gsub (', ', ',', raw ['Displays'])
+		stripped = string.replace (raw ['Displays'], ', ', ',')
 
 		for field in wtslib.string_To_List (stripped, ','):
-			if Query_Name_Mapping.has_key (field):
-				fields.append (Query_Name_Mapping [field])
+			if QUERY_NAME_MAPPING.has_key (field):
+				fields.append (QUERY_NAME_MAPPING [field])
 			else:
 				fields.append (field)
 		raw ["Displays"] = wtslib.list_To_String (fields, ',')
 
-	# note the controlled vocabulary fields and tables:
-
-	controlled_vocabs = [ ('Priority', 'CV_WTS_Priority'), \
-		('Size', 'CV_WTS_Size'), ('Status', 'CV_WTS_Status'), \
-		('Area', 'CV_WTS_Area'), ('Type', 'CV_WTS_Type'), \
-		('Staff', 'CV_Staff'),
-		('Requested By', 'CV_Staff'), ('Requested_By', 'CV_Staff'),
-		('Status Staff', 'CV_Staff') ]
-
 	# go through each controlled vocabulary and clean it up
 
 	SEP = ', '			# standard separator
-	for item in controlled_vocabs:
+	for item in QUERY_CVS:
 		clean_string = ''
 		this_cv = CV [item[1]]
 
@@ -3874,10 +3755,7 @@ def validate_Query_Form (
 
 	# check (and clean up) the date fields
 
-	date_fields = [ 'Status Date', 'Needs Attention By', \
-		'Modification Date', 'Status_Date', 'Needs_Attention_By', \
-		'Modification_Date' ]
-	for item in date_fields:
+	for item in QUERY_DATES:
 		if raw.has_key (item):
 			(start, stop, err) = wtslib.parse_DateRange (raw [item])
 			if err == None:
@@ -3906,7 +3784,7 @@ def validate_Query_Form (
 
 	# now, if the TR # field is defined, clean it up by generating a set
 	# of clauses which handle ranges with relational operators and combine
-	# explicitly specified values in a single 'in' check.
+	# explicitly specified values in a single '= any' check.
 
 	try:
 		if raw.has_key ('TR Nr'):
@@ -3958,109 +3836,411 @@ def validate_TrackRec_Entry (
 	#	line by the browser.  Wraps the value of each large text field
 	#	in <PRE>..</PRE> if it does not contain any HTML markups.
 	# Throws: 1. TrackRec.error if any validation errors occur.
-	# Notes: The browser (Netscape, at least) submits a text area with each
-	#	line ended by /015/012.  Typical line terminations in unix are
-	#	only /012.  This was resulting in a "^M" displayed in the
-	#	command line interface when editing a tracking record that was
-	#	last saved by the web interface.  So, we just strip out the
-	#	/015 characters from each line.
+	# Notes: The work is done by an Entry_Validator, which is only set up
+	#	once; to validate many tracking records, use its
+	#	validate_Many() method directly.
+	#	Also, the browser (Netscape, at least) submits a text area
+	#	with each line ended by /015/012.  Typical line terminations
+	#	in unix are only /012.  This was resulting in a "^M" displayed
+	#	in the command line interface when editing a tracking record
+	#	that was last saved by the web interface.  So, we just strip
+	#	out the /015 characters from each line.
 
 	global error_separator
 
-	CV = Controlled_Vocab.cv	# quick reference to CV info
-	errors = []			# no errors so far
+	(raw, errors) = entryValidator ().validate (raw_dict)
+	if len (errors) > 0:
+		raise error, wtslib.list_To_String (errorMessages (errors),
+			error_separator)
+	return raw
 
-	# make a copy of the input dictionary to work with...
 
-	raw = copy.deepcopy (raw_dict)
-	raw_keys = raw.keys ()
+def with_db_names (
+	input_dict	# dictionary of tracking record data, with keys which
+			# are object fieldnames
+	):
+	# Purpose: produce and return a dictionary parallel to "input_dict",
+	#	which has the same values but with the keys converted to their
+	#	equivalent database fieldname equivalents.
+	# Returns: a dictionary with database fieldnames mapped to values (from
+	#	input_dict)
+	# Assumes: a proper mapping for each key in input_dict exists in
+	#	the global NAME_TO_DB
+	# Effects: returns a dictionary which has the user-readable object
+	#	attribute names (from input_dict keys) mapped to the database
+	#	fieldname equivalents, with the associated values from
+	#	input_dict.
+	# Throws: 1. KeyError if one of the keys in input_dict does not have
+	#	a corresponding key in NAME_TO_DB.
+	# Notes: see the top of this file for a discussion of the various
+	#	field naming formats.
 
-	# get lists of required attributes and all attributes
+	global NAME_TO_DB
 
-	tr = TrackRec ()			# create a temp tr
-	req_attributes = tr.required_Attributes ()
-	all_attributes = tr.all_Attributes ()
-	del tr					# clean-up the temp tr
+	dict = {}
+	for key in input_dict.keys ():
+		dict [ NAME_TO_DB [key] ] = input_dict [key]
+	return dict
 
-	# check to see that all required fields are present
 
-	missing = None
-	no_values = None
-	for item in req_attributes:
-		if item not in raw_keys:
-                        if missing is not None:
-				missing = missing + ', ' + item
-                        else:
-				missing = item
-		elif raw [item] == None:
-                        if no_values is not None:
-				no_values = no_values + ', ' + item
-                        else:
-				no_values = item
-	if missing:
-		errors.append ('These required fields are missing: ' + \
-			missing)
-	if no_values:
-		errors.append ( \
-			'These required fields exist, but have no value: ' \
-			+ no_values)
+def with_nice_names (
+	input_dict	# dictionary of tracking record data, with keys which
+			# are database fieldnames
+	):
+	# Purpose: produce and return a dictionary parallel to "input_dict",
+	#	which has the same values but with the keys converted to their
+	#	equivalent object fieldname (formerly referred to as "nice"
+	#	names) equivalents.
+	# Returns: a dictionary with user-readable object attribute names
+	#	mapped to values (from input_dict)
+	# Assumes: a proper mapping for each key in input_dict exists in
+	#	the global DB_TO_NAME
+	# Effects: returns a dictionary which has the database fieldnames
+	#	(from input_dict keys) mapped to the user-readable object
+	#	attribute name equivalents, with the associated values from
+	#	input_dict.
+	# Throws: 1. KeyError if one of the keys in input_dict does not have
+	#	a corresponding key in DB_TO_NAME.
+	# Notes: see the top of this file for a discussion of the various
+	#	field naming formats.
+
+	global DB_TO_NAME
+
+	dict = {}
+	for key in input_dict.keys ():
+		dict [ DB_TO_NAME [key] ] = input_dict [key]
+	return dict
 
-	# look for unrecognized field names and remove them from 'raw'
 
-	for item in raw_keys:
-		if item not in all_attributes:
-			del raw[item]
+def unpack_Loaded_TR (
+	row		# one row returned by the LOAD_SELECT query
+	):
+	# Purpose: convert a row from LOAD_SELECT into the dictionary of
+	#	tracking record data which TrackRec.load() passes (via
+	#	with_nice_names) to set_Values()
+	# Returns: a dictionary with database fieldnames as keys
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: Many-to-many fields with no values are left out, so the
+	#	TrackRec keeps its defaults for them.
 
-	# note the controlled vocabulary fields and tables:  (each entry is
-	# (field name, table name, 1-single value or 2-multi-valued)
+	record = row.copy ()
 
-	# (don't bother to check Status Staff, since it isn't filled in yet
-	# for new tracking records)
+	# convert the dates to the standard WTS format.  (A null date becomes
+	# an empty string.)
 
-	controlled_vocabs = [ ('Priority', 'CV_WTS_Priority', 1), \
-		('Size', 'CV_WTS_Size', 1), ('Status', 'CV_WTS_Status', 1), \
-		('Area', 'CV_WTS_Area', 2), ('Type', 'CV_WTS_Type', 2), \
-		('Staff', 'CV_Staff', 2), ('Requested By', 'CV_Staff', 2) ]
+	for field in [ 'status_set_date', 'attention_by', 'modification_date' ]:
+		record [field] = wtslib.format_DateTime (record [field])
 
-	# go through each controlled vocabulary and clean it up
+	# We need to update the Directory field in the record to
+	# reflect changes specified in the "Managing Project Directories
+	# with WTS" document:  We now store a URL to this directory,
+	# with the displayed text being the unix path for it.  (That's
+	# what directoryURL() returns)
+
+	if str (record ['directory_variable']) != 'None':
+		record ['directory_variable'] = directoryURL (
+			record ['directory_variable'])
+
+	# a missing text field is an empty string (as from getText)
+
+	for field in [ 'project_definition', 'progress_notes' ]:
+		if record [field] is None:
+			record [field] = ''
+
+	# build the status history string, starting with the current
+	# status...
+
+	temp = '%s - set by %s - effective %s, ' % \
+		(record ['status_name'],
+		record ['status_staff_username'],
+		record ['status_set_date'])
+
+	for entry in record ['status_history']:
+		# the date is already in the standard WTS format (see
+		# convertDate)
+
+		[ status_name, staff_username, date ] = string.split (
+			entry, '\t')
+
+		temp = temp + status_name + ' - set by ' + \
+			staff_username + ' - effective ' + date + ', '
+	record ['status_history'] = temp [:-2]
+
+	# dependencies
+
+	depends_on = Set.Set ()
+	for tr_key in record ['depends_on']:
+		depends_on.add (tr_key)
+	record ['depends_on'] = depends_on
+
+	# and the other many-to-many fields, as comma-separated strings
+
+	for field in [ 'area', 'type', 'staff_list', 'requested_by' ]:
+		if record [field]:
+			record [field] = string.join (map (str,
+				record [field]), ', ')
+		else:
+			del record [field]
+	return record
+
+
+#-Batch Validation Code-----------------------------------------------------
+
+# An Entry_Validator does the work of validate_TrackRec_Entry().  It looks up
+# the fieldnames and controlled vocabularies once, when it is created, and can
+# then check any number of tracking records -- all at once, with
+# validate_Many(), which needs just one query to check all their dependencies
+# for cycles, including cycles among the tracking records being checked.
+# Rather than raising TrackRec.error, it returns the errors for each tracking
+# record as a list of (fieldname, message) tuples.  The fieldname is None for
+# an error which concerns several fields.
+
+# the controlled vocabulary fields of a tracking record:  (each entry is
+# (field name, table name, 1-single value or 2-multi-valued).  (don't bother
+# to check Status Staff, since it isn't filled in yet for new tracking
+# records)
+
+ENTRY_CVS = [ ('Priority', 'CV_WTS_Priority', 1), \
+	('Size', 'CV_WTS_Size', 1), ('Status', 'CV_WTS_Status', 1), \
+	('Area', 'CV_WTS_Area', 2), ('Type', 'CV_WTS_Type', 2), \
+	('Staff', 'CV_Staff', 2), ('Requested By', 'CV_Staff', 2) ]
+
+ENTRY_DATES = [ 'Status Date', 'Needs Attention By' ]
+
+ENTRY_TEXT_FIELDS = [ 'Project Definition', 'Progress Notes' ]
+
+ENTRY_VALIDATOR = None	# Entry_Validator used by validate_TrackRec_Entry()
+
+class Entry_Validator:
+	# Concept:
+	#	IS: a checker for the values entered for tracking records
+	#	HAS: the required and allowed fieldnames of a tracking record,
+	#		and the Controlled_Vocab object for each controlled
+	#		vocabulary field
+	#	DOES: validates and cleans up the values for one or many
+	#		tracking records, as described for
+	#		validate_TrackRec_Entry()
+	# Implementation:
+	#	Methods:
+	#		__init__ ()
+	#		validate (raw_dict)
+	#		validate_Many (list of raw_dicts)
+	#		check_Fields (raw_dict)			- internal
+	#		check_CV (raw, field info, errors)	- internal
+	#		parse_Date (date)			- internal
+	#		find_Cycles (list of check_Fields results)
+	#							- internal
+	#		reaches (arcs, start, goal)		- internal
+
+	def __init__ (self):
+		# Purpose: creates and initializes a new Entry_Validator
+		# Returns: nothing
+		# Assumes: db's database routines have been initialized
+		# Effects: loads the controlled vocabularies for ENTRY_CVS
+		# Throws: propagates wtslib.sqlError if we cannot load them
+
+		tr = TrackRec ()			# create a temp tr
+		self.required = tr.required_Attributes ()
+		self.allowed = {}
+		for item in tr.all_Attributes ():
+			self.allowed [item] = 1
+		del tr					# clean-up the temp tr
+
+		# (field name, Controlled_Vocab object, 1-single or 2-multi)
+
+		self.cvs = []
+		for (field, table, how_many) in ENTRY_CVS:
+			self.cvs.append ((field, Controlled_Vocab.cv [table],
+				how_many))
+		return
+
+	def validate (self,
+		raw_dict	# dictionary of (user-format) fieldname -->
+				# field value pairs for one tracking record
+		):
+		# Purpose: validates and cleans up the values in "raw_dict"
+		# Returns: a tuple (cleaned-up dictionary, list of errors),
+		#	where each error is a (fieldname, message) tuple.  The
+		#	list is empty if the values are valid.
+		# Assumes: nothing
+		# Effects: may query the database
+		# Throws: propagates wtslib.sqlError if we cannot check the
+		#	dependencies
+
+		return self.validate_Many ([ raw_dict ]) [0]
+
+	def validate_Many (self,
+		raw_dicts	# list of dictionaries, each as for validate()
+		):
+		# Purpose: validates and cleans up the values in each of
+		#	"raw_dicts"
+		# Returns: a list of (cleaned-up dictionary, list of errors)
+		#	tuples, one for each of "raw_dicts", in the same order
+		# Assumes: nothing
+		# Effects: may query the database, once
+		# Throws: propagates wtslib.sqlError if we cannot check the
+		#	dependencies
+
+		results = map (self.check_Fields, raw_dicts)
+		cycles = self.find_Cycles (results)
+		for i in range (0, len (results)):
+			if cycles.has_key (i):
+				for tr_key in cycles [i]:
+					results[i][1].append (('Depends On',
+						'Depends On: cannot have a ' +\
+						'dependency on TR %d' % tr_key +\
+						' as it would create a cycle.'))
+		return results
+
+	def check_Fields (self,
+		raw_dict	# dictionary of (user-format) fieldname -->
+				# field value pairs for one tracking record
+		):
+		# Purpose: do all the validation and clean-up of "raw_dict"
+		#	except for checking its dependencies for cycles
+		# Returns: a tuple (cleaned-up dictionary, list of errors)
+		# Assumes: nothing
+		# Effects: see validate_TrackRec_Entry()
+		# Throws: nothing
+
+		errors = []
+
+		# make a copy of the input dictionary to work with...
+
+		raw = copy.deepcopy (raw_dict)
+		raw_keys = raw.keys ()
+
+		# check to see that all required fields are present
+
+		missing = []
+		no_values = []
+		for item in self.required:
+			if item not in raw_keys:
+				missing.append (item)
+			elif raw [item] == None:
+				no_values.append (item)
+		if missing:
+			errors.append ((None,
+				'These required fields are missing: ' + \
+				string.join (missing, ', ')))
+		if no_values:
+			errors.append ((None,
+				'These required fields exist, but have no ' + \
+				'value: ' + string.join (no_values, ', ')))
+
+		# look for unrecognized field names and remove them from 'raw'
+
+		for item in raw_keys:
+			if not self.allowed.has_key (item):
+				del raw[item]
+
+		# go through each controlled vocabulary and clean it up
+
+		for item in self.cvs:
+			self.check_CV (raw, item, errors)
+
+		# check (and clean up) the date fields.  with new tracking
+		# records, it is possible for these fields to not be filled in
+		# by the user.  If this is the case, disregard it.
+
+		for item in ENTRY_DATES:
+			if raw.has_key (item):
+				(dt, err) = self.parse_Date (raw [item])
+				if err == None:
+					raw [item] = dt
+				else:
+					for e in err:
+						errors.append ((item,
+							item + ':  ' + e))
+
+		# convert the "Depends On" field to be a Set of integer tracking
+		# record keys.
+
+		if raw.has_key ('Depends On') and \
+				(type (raw ['Depends On']) == types.StringType):
+			s = Set.Set ()
+			string_keys = string.split (
+				string.translate (raw ['Depends On'],
+					string.maketrans ('',''), '()TRtr '),
+				',')
+			for key in string_keys:
+				if key == '':
+					continue
+				try:
+					s.add (string.atoi (key))
+				except ValueError:
+					errors.append (('Depends On',
+						'Depends On: "%s" is not ' % \
+						key + 'a TR number'))
+			raw ['Depends On'] = s
+
+		# Clean up the large text fields.  We strip out the extra "^M"
+		# sent by the browser at the end of each line (see Notes for
+		# validate_TrackRec_Entry).  If they are non-empty and do not
+		# contain any HTML tags, we enclose the text in <PRE> and
+		# </PRE> by default.
+
+		for fieldname in ENTRY_TEXT_FIELDS:
+			if raw.has_key (fieldname) and \
+					(raw [fieldname] is not None):
+				raw [fieldname] = string.replace (
+					raw [fieldname], chr (015), '')
+				if not wtslib.isHTML (raw [fieldname]):
+					raw [fieldname] = \
+						'<PRE>\n%s\n</PRE>' % \
+						raw [fieldname]
+		return (raw, errors)
+
+	def check_CV (self,
+		raw,		# dictionary of values being cleaned up
+		item,		# tuple; (field name, Controlled_Vocab object,
+				# 1-single value or 2-multi-valued)
+		errors		# list of errors found so far
+		):
+		# Purpose: check and clean up the value of one controlled
+		#	vocabulary field in "raw"
+		# Returns: nothing
+		# Assumes: nothing
+		# Effects: sets the field in "raw" to its terms, separated by
+		#	a comma and a space; appends to "errors"
+		# Throws: nothing
+
+		(field, cv, how_many) = item
 
-	SEP = ', '			# standard separator
-	for item in controlled_vocabs:
 		# get a list of values for this item
 
-                if raw.has_key(item[0]) and (raw[item[0]] is not None):
-			values = string.split (string.translate ( \
-				raw [item[0]], \
+		if raw.has_key (field) and (raw [field] is not None):
+			values = string.split (string.translate (raw [field],
 				string.maketrans ('',''), ' '), ',')
-                else:
+		else:
 			# Staff is an optional controlled vocabulary, so don't
-                        # pester the user about that one.  Otherwise, remind
-                        # the user that we need a value.
+			# pester the user about that one.  Otherwise, remind
+			# the user that we need a value.
 
-			if item[0] <> 'Staff':
-				errors.append ('Could not find value for ' + \
-					item[0])
+			if field <> 'Staff':
+				errors.append ((field,
+					'Could not find value for ' + field))
 			values = []
 
-		clean_string = ''
-
+		terms = []
 		for key in values:
 			if key[:4] == '----':
 				pass		# skip selected divider lines
 
-			elif CV[item[1]][key] == None:
+			elif cv [key] == None:
 
 				# the staff field may be blank.  if its value
 				# is 'None', just ignore it.  (This could happen
-				# when using the command-line interface.)  
+				# when using the command-line interface.)
 				# Otherwise, we need to note the error.
 
-				if not ((item[0] == 'Staff') and
-					(key == 'None')):
-					errors.append ( \
+				if not ((field == 'Staff') and (key == 'None')):
+					errors.append ((field,
 						'CV Error: could not find "' + \
 						key + '" match for field "' + \
-						item[0] + '"')
+						field + '"'))
 			elif (len (values) > 1) and (key == 'unknown'):
 
 				# if we have multiple values and one is set for
@@ -4068,176 +4248,167 @@ def validate_TrackRec_Entry (
 				# stripping it out.
 
 				pass
+			elif terms and (how_many == 1):
+				errors.append ((field, 'CV Error: found ' + \
+					'multiple values for ' + field + \
+					', a single-valued field.'))
 			else:
-				if clean_string == '':
-					clean_string = key
-				elif item[2] == 1:
-					errors.append ('CV Error: found ' + \
-						'multiple values for ' + \
-						item[0] + ', a single-' + \
-						'valued field.')
-				else:
-					clean_string = clean_string + SEP + key
-		raw [item [0]] = clean_string
+				terms.append (key)
+		raw [field] = string.join (terms, ', ')
+		return
 
-	# check (and clean up) the date fields
+	def parse_Date (self,
+		date		# string; value of a date field
+		):
+		# Purpose: parse "date", as for wtslib.parse_DateTime, except
+		#	that 'None' and '' are valid and parse to None
+		# Returns: a tuple (standardized datetime string or None, list
+		#	of error strings or None)
+		# Assumes: nothing
+		# Effects: nothing
+		# Throws: nothing
 
-	date_fields = [ 'Status Date', 'Needs Attention By' ]
-	for item in date_fields:
-		# with new tracking records, it is possible for these fields to
-		# not be filled in by the user.  If this is the case, disregard
-		# it.
-                if (item in raw_keys):
-			date = raw [item]
-			if date not in [ 'None', '' ]:
-				(dt, err) = wtslib.parse_DateTime (date)
-			else:
-				dt = None
-				err = None
-			if err == None:
-				# store cleaned-up datetime
-				raw [item] = dt	
-			else:
-				# store the errors found
-				for e in err:
-					errors.append (item + ':  ' + e)
-                else:
-			pass
-
-	# convert the "Depends On" field to be a Set of integer tracking record
-	# keys.
-
-	if raw.has_key ('Depends On') and \
-			(type (raw ['Depends On']) == types.StringType):
-		s = Set.Set ()
-		string_keys = string.split (
-			string.translate (raw ['Depends On'],
-				string.maketrans ('',''), '()TRtr '), ',')
-		for key in string_keys:
-			if key != '':
-				s.add (string.atoi (key))
-		raw ['Depends On'] = s
-
-	# if this is an existing node (has a TR number), then we need to
-	# go through each dependency (dep) and look to see if there is a
-	# transitive closure arc back to this node.  If so, that would create
-	# a cycle, and we must disallow it:
-
-	if raw.has_key ('TR Nr') and \
-		(raw ['TR Nr'] is not None) and \
-		(string.strip (str (raw ['TR Nr'])) != '') and \
-		raw.has_key ('Depends On') and (not raw['Depends On'].empty ()):
-
-		# be careful in case we have too many dependencies, that we
-		# don't build a query that's too big.  Limit it to doing 100
-		# at once.  (Hopefully there won't be any this big anyway...)
-
-		cycles = []
-		for sublist in wtslib.splitList (raw ['Depends On'].values (),
-				100):
-			sublist_cycles = wtslib.sql ('''
+		if date in [ 'None', '', None ]:
+			return (None, None)
+		return wtslib.parse_DateTime (date)
+
+	def find_Cycles (self,
+		results		# list of (cleaned-up dictionary, list of
+				# errors) tuples, each returned by
+				# check_Fields()
+		):
+		# Purpose: find the dependencies in "results" which would
+		#	create a cycle
+		# Returns: dictionary mapping the index of each tuple in
+		#	"results" which has any such dependencies to a list of
+		#	the TR numbers it may not depend on
+		# Assumes: the tracking records in "results" will be saved in
+		#	order, skipping those with errors
+		# Effects: queries the database, if any existing tracking
+		#	record in "results" has dependencies
+		# Throws: propagates wtslib.sqlError if the query fails
+		# Notes: If this is an existing node (has a TR number), then we
+		#	need to go through each dependency (dep) and look to
+		#	see if there is a path from dep back to this node.  If
+		#	so, that would create a cycle, and we must disallow it.
+		#	A path may use the arcs of the transitive closure, and
+		#	the new dependencies of the tracking records before
+		#	this one in "results", which will have been saved by
+		#	then.  Any such path goes between the tracking records
+		#	in "results" and their dependencies, so we get the
+		#	closure arcs among those with one query, and follow
+		#	the paths here.
+
+		entries = []	# (index, TR number, list of dependencies)
+		nodes = {}	# TR numbers in "entries" -> 1
+		for i in range (0, len (results)):
+			raw = results [i][0]
+			if not (raw.has_key ('TR Nr') and \
+					(raw ['TR Nr'] is not None) and \
+					raw.has_key ('Depends On') and \
+					(not raw ['Depends On'].empty ())):
+				continue
+			try:
+				tr_key = string.atoi (string.strip (
+					str (raw ['TR Nr'])))
+			except ValueError:
+				continue	# a new tracking record
+			deps = raw ['Depends On'].values ()
+			entries.append ((i, tr_key, deps))
+			nodes [tr_key] = 1
+			for dep in deps:
+				nodes [dep] = 1
+
+		cycles = {}
+		if not entries:
+			return cycles
+
+		# arcs maps each TR number to the TR numbers it depends on
+
+		arcs = {}
+		keys = string.join (map (str, nodes.keys ()), ',')
+		for row in wtslib.sql ('''
 				select _TR_key, _Related_TR_key
 				from WTS_Relationship
-				where (_Related_TR_key = %s) and
-					(relationship_type = %d) and
+				where (relationship_type = %d) and
 					(transitive_closure = 1) and
-					(_TR_key in (%s))''' % \
-				(raw ['TR Nr'], DEPENDS_ON,
-					wtslib.list_To_String (sublist)))
-			cycles = cycles + sublist_cycles
-		if len (cycles) > 0:
-			for row in cycles:
-				errors.append ('Depends On: cannot have a ' + \
-					'dependency on TR %d' % \
-					row ['_tr_key'] + \
-					' as it would create a cycle.')
-
-	# Clean up the large text fields.  If they are non-empty and do not
-	# contain any HTML tags, we should enclose the text in <PRE> and </PRE>
-	# by default.  We should also strip out the extra "^M" sent by the
-	# browser at the end of each line.
-
-	text_fields = [ 'Project Definition', 'Progress Notes' ]
-	for fieldname in text_fields:
-		if raw.has_key (fieldname) and (raw [fieldname] is not None):
-
-			# strip out the "^M" characters (/015) -- see Notes in
-			# the function comments
-
-			raw [fieldname] = regsub.gsub (chr (015), '',
-				raw [fieldname])
-				
-			# if there are no HTML tags, then wrap the text in
-			# <PRE> and </PRE>
-
-			if not wtslib.isHTML (raw [fieldname]):
-				raw [fieldname] = '<PRE>\n%s\n</PRE>' % \
-					raw [fieldname]
-
-	# now, either bail out by raising an exception (if there were errors),
-	# or return the cleaned up dictionary of values (in raw)
-
-	if len (errors) > 0:
-		raise error, wtslib.list_To_String (errors, error_separator)
-	else:
-		return raw
-
-
-def with_db_names (
-	input_dict	# dictionary of tracking record data, with keys which
-			# are object fieldnames
-	):
-	# Purpose: produce and return a dictionary parallel to "input_dict",
-	#	which has the same values but with the keys converted to their
-	#	equivalent database fieldname equivalents.
-	# Returns: a dictionary with database fieldnames mapped to values (from
-	#	input_dict)
-	# Assumes: a proper mapping for each key in input_dict exists in
-	#	the global NAME_TO_DB
-	# Effects: returns a dictionary which has the user-readable object
-	#	attribute names (from input_dict keys) mapped to the database
-	#	fieldname equivalents, with the associated values from
-	#	input_dict.
-	# Throws: 1. KeyError if one of the keys in input_dict does not have
-	#	a corresponding key in NAME_TO_DB.
-	# Notes: see the top of this file for a discussion of the various
-	#	field naming formats.
-
-	global NAME_TO_DB
-
-	dict = {}
-	for key in input_dict.keys ():
-		dict [ NAME_TO_DB [key] ] = input_dict [key]
-	return dict
-
+					(_TR_key <> _Related_TR_key) and
+					(_TR_key = any ('{%s}'::int[])) and
+					(_Related_TR_key = any ('{%s}'::int[]))
+				''' % (DEPENDS_ON, keys, keys)):
+			if not arcs.has_key (row ['_tr_key']):
+				arcs [row ['_tr_key']] = []
+			arcs [row ['_tr_key']].append (row ['_related_tr_key'])
+
+		for (i, tr_key, deps) in entries:
+			bad = []
+			for dep in deps:
+				if self.reaches (arcs, dep, tr_key):
+					bad.append (dep)
+			if bad:
+				bad.sort ()
+				cycles [i] = bad
+			elif not results [i][1]:
+				# this one will be saved, so later ones
+				# must allow for its dependencies
+
+				if not arcs.has_key (tr_key):
+					arcs [tr_key] = []
+				arcs [tr_key] = arcs [tr_key] + deps
+		return cycles
+
+	def reaches (self,
+		arcs,		# dictionary; maps each TR number to a list
+				# of the TR numbers it depends on
+		start,		# integer TR number to start from
+		goal		# integer TR number to look for
+		):
+		# Purpose: find out whether we can get from "start" to "goal"
+		#	by following "arcs"
+		# Returns: boolean (TRUE if we can, FALSE if not)
+		# Assumes: nothing
+		# Effects: nothing
+		# Throws: nothing
 
-def with_nice_names (
-	input_dict	# dictionary of tracking record data, with keys which
-			# are database fieldnames
+		seen = { start : 1 }
+		todo = [ start ]
+		while todo:
+			node = todo.pop ()
+			if node == goal:
+				return TRUE
+			if arcs.has_key (node):
+				for next in arcs [node]:
+					if not seen.has_key (next):
+						seen [next] = 1
+						todo.append (next)
+		return FALSE
+
+### End of Class: Entry_Validator ###
+
+def entryValidator ():
+	# Purpose: get the Entry_Validator used by validate_TrackRec_Entry()
+	# Returns: an Entry_Validator object
+	# Assumes: db's database routines have been initialized
+	# Effects: creates the Entry_Validator, the first time we are called
+	# Throws: propagates wtslib.sqlError if we cannot create it
+
+	global ENTRY_VALIDATOR
+
+	if ENTRY_VALIDATOR is None:
+		ENTRY_VALIDATOR = Entry_Validator ()
+	return ENTRY_VALIDATOR
+
+def errorMessages (
+	errors		# list of (fieldname, message) tuples, as returned by
+			# Entry_Validator
 	):
-	# Purpose: produce and return a dictionary parallel to "input_dict",
-	#	which has the same values but with the keys converted to their
-	#	equivalent object fieldname (formerly referred to as "nice"
-	#	names) equivalents.
-	# Returns: a dictionary with user-readable object attribute names
-	#	mapped to values (from input_dict)
-	# Assumes: a proper mapping for each key in input_dict exists in
-	#	the global DB_TO_NAME
-	# Effects: returns a dictionary which has the database fieldnames
-	#	(from input_dict keys) mapped to the user-readable object
-	#	attribute name equivalents, with the associated values from
-	#	input_dict.
-	# Throws: 1. KeyError if one of the keys in input_dict does not have
-	#	a corresponding key in DB_TO_NAME.
-	# Notes: see the top of this file for a discussion of the various
-	#	field naming formats.
-
-	global DB_TO_NAME
+	# Purpose: get the messages from "errors"
+	# Returns: list of strings
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
 
-	dict = {}
-	for key in input_dict.keys ():
-		dict [ DB_TO_NAME [key] ] = input_dict [key]
-	return dict
+	return map (lambda e: e[1], errors)
 
 
 #-SUPPORTING FUNCTIONS FOR THE SAVE OPERATION-------------------------------
@@ -4493,9 +4664,9 @@ def save_Text_Fields (
 	#	for the large text fields included in a tracking record
 	#	(Project Definition, Progress Notes) so that the data for the
 	#	tracking record info in values is correct.
-	# Returns: a list of strings, each of which is a SQL statement to be
-	#	executed in order for the values to save appropriately in
-	#	the specified tables (see Notes).
+	# Returns: a list of SQL statements to be executed in order for the
+	#	values to save appropriately in the specified tables (see
+	#	Notes).  Inserts and updates are (query, parameters) tuples.
 	# Assumes: Parameter method will be TR_OLD or TR_NEW.
 	# Effects: If method is TR_NEW then we generate SQL insert statements
 	#	to add the current (non-blank) contents of values to the tables
@@ -4521,21 +4692,17 @@ def save_Text_Fields (
 
 	queries = []				# no queries so far
 
-	# note that when including the text string inside the query string,
-	# we need to make sure that all internal double quotes have been
-	# repeated.  Otherwise, sybase think we're ending the string
-	# prematurely.
+	# The text blocks can be large, so rather than escaping their quotes
+	# and copying them into the query strings, we pass them as bind
+	# parameters:  each of those queries is a (query, parameters) tuple,
+	# as understood by wtslib.sql's batch mode.
 
 	if method == TR_NEW:
 		for item in text_fields:
 			if not blank (values [item[0]]):
-				queries.append ("""insert into WTS_Text (text_block,
-					_TR_key, text_type) values ('""" + \
-					wtslib.duplicated_Quotes ( \
-					values [item [0]]) + "', " + \
-					str (values ['_TR_key']) + ', ' + \
-					str (item [1]) + ')'
-					)
+				queries.append ( (INSERT_TEXT, [
+					values [item [0]],
+					values ['_TR_key'], item [1] ]) )
 	else:
 		# for editing, we really have four notable cases:
 		#	both entries are blank, so we can ignore them
@@ -4562,28 +4729,18 @@ def save_Text_Fields (
 					['_tr_key']) + ') and (text_type = ' + \
 					str (item [1]) + '))')
 			elif old_blank and not new_blank:
-				queries.append ("""insert into WTS_Text (text_block,
-					_TR_key, text_type) values ('""" + \
-					wtslib.duplicated_Quotes ( \
-					values [item [0]]) + "', " + \
-					str (values ['_TR_key']) + ', ' + \
-					str (item [1]) + ')'
-					)
+				queries.append ( (INSERT_TEXT, [
+					values [item [0]],
+					values ['_TR_key'], item [1] ]) )
 
 			# If we reach this point, then both old and new values
 			# are non-blank.  If they are different, then we need
 			# to use an update query.
 
 			elif (old_values [item[0]] <> values [item[0]]):
-				queries.append ("""update WTS_Text set
-					text_block = '""" + \
-					wtslib.duplicated_Quotes ( \
-					values[item[0]]) + \
-					"' where ((_TR_key = " + \
-					str (values ['_TR_key']) + \
-					') and (text_type = ' + \
-					str (item [1]) + '))'
-					)
+				queries.append ( (UPDATE_TEXT, [
+					values [item [0]],
+					values ['_TR_key'], item [1] ]) )
 	return queries
 
 
@@ -4702,32 +4859,30 @@ def blank (
 	return 1
 
 
-def expand_TR_Range (
-	rng,	# a string specifying a range of tracking record numbers.
+NO_LOW_TR = -sys.maxint - 1	# low end of a TR range which has none
+NO_HIGH_TR = sys.maxint		# high end of a TR range which has none
+
+TR_RANGE_CLAUSES = 5	# expand_TR() gives each TR range its own clause, up
+			# to this many; beyond that, it joins to a list of them
+
+def parse_TR_Range (
+	rng	# a string specifying a range of tracking record numbers.
 		# range is defined as:  lo..hi  Either lo or hi is optional,
 		# but not both.
-	key	# string name of the key for tracking records in the database
 	):
-	# Purpose: generate a string which is a clause suitable for inclusion
-	#	in the 'where' part of a query, representing the range of
-	#	tracking records specified in rng.
-	# Returns: a string as defined above in Purpose.
+	# Purpose: get the low and high tracking record numbers in rng
+	# Returns: a tuple of two integers (low, high).  If rng has no low end,
+	#	low is NO_LOW_TR; if it has no high end, high is NO_HIGH_TR.
 	# Assumes: hi and lo (see explanation of rng) are both integers.
 	# Effects: Extracts an integer from either side of the .. separator, if
 	#	available.  If neither integer is included, raise an exception.
-	#	If only the first value is specified, return a clause selecting
-	#	tracking records after that one.  If only the second value is
-	#	specified, return a clause selecting tracking records before
-	#	that one.  If both values are specified, return a clause
-	#	selecting values between them.
 	# Throws: 1. ValueError if lo or hi (see explanation of rng) is not
 	#	an integer.  2. TrackRec.error if we can't find anything on
 	#	either side of the .. separator.
 	# Examples:
-	#	expand_TR_Range ('15..', '_TR_key')	==> '(_TR_key >= 15)'
-	#	expand_TR_Range ('..15', '_TR_key')	==> '(_TR_key <= 15)'
-	#	expand_TR_Range ('5..15', '_TR_key')  ==>
-	#		'(_TR_key >= 5) and (_TR_key <= 15)'
+	#	parse_TR_Range ('15..')		==> (15, NO_HIGH_TR)
+	#	parse_TR_Range ('..15')		==> (NO_LOW_TR, 15)
+	#	parse_TR_Range ('5..15')	==> (5, 15)
 
 	nums = string.split (rng, '..')
 	if len (nums) <> 2:
@@ -4739,132 +4894,144 @@ def expand_TR_Range (
 	blank_1 = (nums [1] == '')
 	if blank_0 and blank_1:
 		raise error, 'Could not interpret TR range'
-	
-	# otherwise, build the string s to be returned
 
-	s = ''					# string to be returned
+	low = NO_LOW_TR
+	high = NO_HIGH_TR
 	if not blank_0:
-		temp = string.atoi (nums [0])
-		s = s + ' and (' + key + ' >= ' + nums [0] + ')'
+		low = string.atoi (nums [0])
 	if not blank_1:
-		temp = string.atoi (nums [1])
-		s = s + ' and (' + key + ' <= ' + nums [1] + ')'
-	return s [5:]
+		high = string.atoi (nums [1])
+	return (low, high)
 
 
-def expand_TR (
-	tr_numbers,	# string of tracking record numbers separated by commas
+def parse_TR_Intervals (
+	tr_numbers	# string of tracking record numbers separated by commas
 			# and possibly including ranges (open-ended or closed).
-	key		# name of the key field for tracking records
 	):
-	# Purpose: To convert a string of tracking record numbers to a list of
-	#	clauses which may be used to restrict a query to those tracking
-	#	record numbers.
-	# Returns: a list of strings, each of which is a single clause suitable
-	#	for use (or-ed together) in the "where" section of a SQL select
-	#	statement.
+	# Purpose: To convert a string of tracking record numbers and ranges to
+	#	the fewest ranges which cover the same tracking records
+	# Returns: a list of (low, high) tuples of integers, sorted by low.
+	#	A single tracking record number N is (N, N).  Ranges with no
+	#	low or high end have NO_LOW_TR or NO_HIGH_TR there.
 	# Assumes: Only the integer part of the tracking record number is
-	#	specified in tr_numbers (not the 'TR', too).  This is typical
-	#	for the query form.
-	# Effects: Splits tr_numbers at the commas into separate pieces.  Each
-	#	piece is analyzed to see if it is an integer tracking record
-	#	number.  If so, it is added to a list of them for which we later
-	#	build a SQL clause.  If not, it is analyzed as a tracking
-	#	record range to build clauses.  Returns a list of these clauses.
-	# Throws: may propagate from expand_TR_Range: 1. ValueError if low or
-	#	high (parts of a range - see Notes) is not an integer. 
+	#	specified in tr_numbers (not the 'TR', too).
+	# Effects: Splits tr_numbers at the commas into separate pieces, each
+	#	a tracking record number or a range.  Ranges which overlap or
+	#	are next to each other are merged, so duplicates drop out and a
+	#	run of numbers like "3, 4, 5" becomes the range (3, 5).
+	# Throws: may propagate from parse_TR_Range: 1. ValueError if low or
+	#	high (parts of a range - see Notes) is not an integer.
 	#	2. TrackRec.error if we can't find anything on either side of
 	#	the range separator.
 	# Notes: Ranges of tracking records are of one of the forms:  (low...,
 	#	...high, or low...high).  The separator may be ... (as shown),
 	#	.. or -.
 	# Example:
-	#	expand_TR ('3, 4-6, 8, 10, 12-17', '_TR_key')
+	#	parse_TR_Intervals ('12-17, 3, 4-6, 8, 10, 16..20')
 	#    results in:
-	#	[ '((_TR_key >= 4) and (_TR_key <= 6))',
-	#	  '((_TR_key >= 12) and (_TR_key <= 17))',
-	#	  '(_TR_key in (3, 8, 10)' ]
-
-	# compile a regular expression to confirm that a string consists of
-	# just an integer, and then extract that number in a group
-
-	find_int = regex.compile ( \
-		'^[ \t]*'		# leading space at string beginning
-		'\([0-9]+\)'		# group 1 = integer (at least one digit)
-		'[ \t]*$')		# trailing space at string end
+	#	[ (3, 6), (8, 8), (10, 10), (12, 20) ]
 
 	# map all - and ... to be .. so the code can be simple afterwards
 
-	modified_tr = regsub.sub ('\.\.\.', '..', tr_numbers)
-	modified_tr = regsub.sub ('-', '..', modified_tr)
+	modified_tr = string.replace (tr_numbers, '...', '..')
+	modified_tr = string.replace (modified_tr, '-', '..')
 
 	items = string.split (string.translate (modified_tr, \
-		string.maketrans ('', ''), ' '), ',')
-
-	nrs = []			# list of single specified TR #'s
-	clauses = []			# list of clauses so far
+		string.maketrans ('', ''), ' \t'), ',')
 
+	ranges = []
 	for item in items:
-		# see if it is a single tracking record number (if so, we just
-		# convert it to an integer and add to nrs)
-
-		if find_int.match (item) >= 0:
-			nrs.append (string.atoi (find_int.group (1)))
-
+		# a single tracking record number is a range of one;
 		# otherwise, try to interpret item as a range of tracking
 		# record numbers
 
+		if item and (item [0] in string.digits) and ('..' not in item):
+			nr = string.atoi (item)
+			ranges.append ((nr, nr))
 		else:
-			clauses.append (expand_TR_Range (item, key))
-
-	# if we found any single tracking record numbers specified, add a
-	# clause for them
-
-	if len (nrs) > 0:
-		clauses.append ('(' + key + ' in (' + \
-			wtslib.list_To_String (nrs) + '))')
-	return clauses
+			ranges.append (parse_TR_Range (item))
+	ranges.sort ()
+
+	merged = []
+	for (low, high) in ranges:
+		if merged and (low <= merged[-1][1] + 1):
+			if high > merged[-1][1]:
+				merged[-1] = (merged[-1][0], high)
+		else:
+			merged.append ((low, high))
+	return merged
 
 
-def opposite (
-	input_item	# an integer or string for which we want an opposite
+def expand_TR (
+	tr_numbers,	# string of tracking record numbers separated by commas
+			# and possibly including ranges (open-ended or closed).
+	key		# name of the key field for tracking records
 	):
-	# Purpose: While sorting a list in python is easy, and reversing it is
-	#	also easy, it is a little more difficult when you have a joint
-	#	"sorting key".  For example, if you want to sort by a tuple of
-	#	information, but you want to sort so that the first component
-	#	is sorted in ascending order, but the second is in descending
-	#	order.  (You want: [ (2, 3), (3, 4), (2, 1), (2, 2) ] to become
-	#	[ (2, 3), (2, 2), (2, 1), (3, 4) ].  One way to accomplish this
-	#	is to convert the item you want to sort in descending order to
-	#	an item which is the "opposite" of the original one.  For the
-	#	example above, if we make the second component of each tuple
-	#	negative and then convert them back to positive, it sorts as
-	#	intended.  This function will produce the correct "opposite"
-	#	value for sorting strings and integers in descending order.
-	# Returns: a string or integer (depending on the type of input_item)
-	#	which will sort in reverse order of input_item.
-	# Assumes: input_item is a lowercase string or an integer.
-	# Effects: see Purpose and Examples.
-	# Throws: 1. TypeError if input_item is not a string or an integer.
-	# Examples:
-	#	opposite (3)		==> -3
-	#	opposite (-4)		==> 4
-	#	opposite ('abc')	==> 'zyx'
+	# Purpose: To convert a string of tracking record numbers to a list of
+	#	clauses which may be used to restrict a query to those tracking
+	#	record numbers.
+	# Returns: a list of strings, each of which is a single clause suitable
+	#	for use (or-ed together) in the "where" section of a SQL select
+	#	statement.
+	# Assumes: Only the integer part of the tracking record number is
+	#	specified in tr_numbers (not the 'TR', too).  This is typical
+	#	for the query form.
+	# Effects: Merges tr_numbers into ranges with parse_TR_Intervals(), then
+	#	builds a clause for each open-ended range, one for the closed
+	#	ranges, and one for the single tracking record numbers.
+	# Throws: may propagate from parse_TR_Intervals: 1. ValueError if low
+	#	or high (parts of a range) is not an integer.
+	#	2. TrackRec.error if we can't find anything on either side of
+	#	the range separator.
+	# Notes: The single numbers go in one array constant, however many
+	#	there are, so a long list pasted into the query form makes a
+	#	short query which the database can plan as quickly as a short
+	#	list.  Likewise, if there are more than TR_RANGE_CLAUSES closed
+	#	ranges, we look them up in a pair of arrays rather than giving
+	#	each its own clause.
+	# Example:
+	#	expand_TR ('3, 4-6, 8, 10, 12-17, 16..', '_TR_key')
+	#    results in:
+	#	[ '(_TR_key >= 12)',
+	#	  '((_TR_key >= 3) and (_TR_key <= 6))',
+	#	  "(_TR_key = any ('{8,10}'::int[]))" ]
 
-	# for integers, the negation will sort in reverse order
+	nrs = []			# list of single specified TR #'s
+	lows = []			# low ends of closed ranges
+	highs = []			# high ends of closed ranges
+	clauses = []			# list of clauses so far
 
-	if type (input_item) == types.IntType:
-		return -input_item
+	for (low, high) in parse_TR_Intervals (tr_numbers):
+		if low == high:
+			nrs.append (str (low))
+		elif (low == NO_LOW_TR) and (high == NO_HIGH_TR):
+			clauses.append ('(%s is not null)' % key)
+		elif low == NO_LOW_TR:
+			clauses.append ('(%s <= %d)' % (key, high))
+		elif high == NO_HIGH_TR:
+			clauses.append ('(%s >= %d)' % (key, low))
+		else:
+			lows.append (str (low))
+			highs.append (str (high))
+
+	if len (lows) > TR_RANGE_CLAUSES:
+		clauses.append ('''(exists (select 1
+			from unnest ('{%s}'::int[], '{%s}'::int[])
+				as tr_range (low, high)
+			where %s between tr_range.low and tr_range.high))''' % (
+			string.join (lows, ','), string.join (highs, ','), key))
 	else:
+		for i in range (0, len (lows)):
+			clauses.append ('((%s >= %s) and (%s <= %s))' % (key,
+				lows [i], key, highs [i]))
 
-		# for strings, we use swap each letter at position x in the
-		# alphabet, we swap it with the one at position (27-x).  The
-		# resulting string will sort in reverse order.
+	# if we found any single tracking record numbers specified, add a
+	# clause for them
 
-		return string.translate (string.lower (input_item), \
-			string.maketrans ( 'abcdefghijklmnopqrstuvwxyz', \
-			'zyxwvutsrqponmlkjihgfedcba' ), '')
+	if len (nrs) > 0:
+		clauses.append ("(%s = any ('{%s}'::int[]))" % (key,
+			string.join (nrs, ',')))
+	return clauses
 
 
 def remove (
@@ -4886,6 +5053,67 @@ def remove (
 	return list
 
 
+def load_many (
+	tr_numbers	# list of integer tracking record numbers
+	):
+	# Purpose: load many tracking records at once
+	# Returns: list of TrackRec objects, in the order given in
+	#	"tr_numbers".  Duplicates are loaded once, and numbers which
+	#	are not in the database are skipped.
+	# Assumes: db's SQL routines have been initialized
+	# Effects: queries the database
+	# Throws: propagates wtslib.sqlError if an error occurs in running
+	#	the query
+	# Notes: This runs one query (LOAD_SELECT for all the keys) no
+	#	matter how many tracking records we want, rather than one per
+	#	tracking record as TrackRec (tr_num) would.
+
+	keys = Set.Set ()
+	for tr_num in tr_numbers:
+		keys.add (tr_num)
+	if keys.empty ():
+		return []
+
+	rows = {}
+	for row in wtslib.sqlPrepared ('loadTrackRecs', [ keys.values () ]):
+		rows [row ['_tr_key']] = row
+
+	trs = []
+	done = Set.Set ()
+	for tr_num in tr_numbers:
+		if rows.has_key (tr_num) and not done.contains (tr_num):
+			trs.append (TrackRec (tr_num, rows [tr_num]))
+			done.add (tr_num)
+	return trs
+
+
+def find_TR_Numbers (
+	tr_spec		# string of tracking record numbers separated by commas
+			# and possibly including ranges (as for expand_TR)
+	):
+	# Purpose: find which tracking records in the database match "tr_spec"
+	# Returns: sorted list of integer tracking record numbers
+	# Assumes: db's SQL routines have been initialized
+	# Effects: queries the database
+	# Throws: propagates from expand_TR: 1. ValueError if a range in
+	#	"tr_spec" has a non-integer end, 2. TrackRec.error if a
+	#	range has neither end; and propagates wtslib.sqlError if an
+	#	error occurs in running the query
+	# Example:
+	#	find_TR_Numbers ('3, 5-8') might return [ 3, 5, 7, 8 ] if
+	#	there is no TR 6
+
+	clauses = expand_TR (tr_spec, '_TR_key')
+	if not clauses:
+		return []
+	results = wtslib.sql ('''select _TR_key
+		from WTS_TrackRec
+		where %s
+		order by _TR_key''' % string.join (map (lambda c: '(%s)' % c,
+			clauses), ' or '))
+	return map (lambda row: row ['_tr_key'], results)
+
+
 def lockedTrackRecList ():
 	# Purpose: get info about the currently locked tracking records
 	# Returns: a list of tuples, each of which represents a single tracking
@@ -4899,18 +5127,16 @@ def lockedTrackRecList ():
 	results = wtslib.sql ('''
 		select tr._TR_key, st.staff_username,
 			left(tr.tr_title, 30) as tr_title,
-			%s as locked_when
+			tr.locked_when
 		from WTS_TrackRec tr, CV_Staff st
 		where (tr._Locked_Staff_key = st._Staff_key) and
 			(tr.locked_when is not null)
-		order by tr._TR_key asc''' % (
-			convertDate('tr.locked_when')
-			))
+		order by tr._TR_key asc''')
 	list = []
 	for row in results:
-		datetime, error = wtslib.parse_DateTime (row ['locked_when'])
 		list.append ( (row ['_tr_key'], row ['staff_username'],
-				datetime, row ['tr_title']) )
+				wtslib.format_DateTime (row ['locked_when']),
+				row ['tr_title']) )
 	return list
 		
 
@@ -4923,12 +5149,22 @@ def queryTitle (
 	# Assumes: nothing
 	# Effects: queries the database
 	# Throws: propagates any exceptions thrown by wtslib.sql
-
+	# Notes: As for the Text Fields on the query form, the TEXT_SEARCH
+	#	config parameter decides whether we look for the words in
+	#	'title' (using the full-text index on Titles) or for the exact
+	#	string.
+
+	title = wtslib.duplicated_Quotes (title)
+	if textSearchEngine () == 'substring':
+		where = "tr_title ilike '%s%s%s'" % ('%', title, '%')
+	else:
+		where = '%s @@ %s' % (textVector ('tr_title'),
+			textQuery (title))
 	results = wtslib.sql ('''
 		select _TR_key
 		from WTS_TrackRec
-		where tr_title ilike '%s%s%s'
-		order by _TR_key''' % ('%', title, '%'))
+		where %s
+		order by _TR_key''' % where)
 	trs = []
 	for row in results:
 		trs.append (str(row['_tr_key']))
@@ -5127,15 +5363,150 @@ def rebuild_htaccess (
 	return
 
 
-#-TRANSITIVE CLOSURE CODE---------------------------------------------------
+#-TRANSITIVE CLOSURE CODE---------------------------------------------------
+
+# queries for the incremental closure update:
+#	tcAncestors = keys of the tracking records which (transitively) reach
+#		a given one, according to the stored closure
+#	tcArcsFrom = all arcs (direct and closure) out of a list of tracking
+#		records
+
+wtslib.definePrepared ('tcAncestors', [ 'int', 'int' ], '''
+	select _TR_key
+	from WTS_Relationship
+	where (_Related_TR_key = $1) and
+		(relationship_type = $2) and
+		(transitive_closure = 1)''')
+wtslib.definePrepared ('tcArcsFrom', [ 'int[]', 'int' ], '''
+	select _TR_key, _Related_TR_key, transitive_closure
+	from WTS_Relationship
+	where (_TR_key = any ($1)) and
+		(relationship_type = $2)''')
+
+def updateTransitiveClosure (
+	tr_num,		# integer; key of the tracking record we're working with
+	rel_type,	# integer; type of relationship for which to update t.c.
+	):
+	# Purpose: updates the transitive closure in the database for the given
+	#	relationship type ("rel_type") after the arcs going out of the
+	#	specified "tr_num" have been added or removed
+	# Returns: (ArcSet of added Arcs, ArcSet of deletedArcs)
+	# Assumes: that the changes to the actual arcs in WTS_Relationship have
+	#	already been made, that only arcs out of "tr_num" were changed,
+	#	and that the stored closure was correct before those changes.
+	# Effects: see Purpose.
+	# Throws: 1. wtslib.sqlError if there is a problem in executing the SQL
+	#	statements for some reason.
+	# Notes: Only the descendants of "tr_num" and of its ancestors can
+	#	change when arcs out of "tr_num" change.  (The ancestors
+	#	themselves do not: any path into "tr_num" which used one of
+	#	its own arcs would have had to pass through "tr_num" first.)
+	#	So, we:
+	#		* get the ancestors of "tr_num" from the stored closure
+	#		* load the direct arcs and the old closure out of them
+	#		* for each direct child outside that set, take its old
+	#			descendants as still correct
+	#		* propagate descendants up among the ancestors until
+	#			nothing changes (which copes with cycles)
+	#		* reconcile the differences (missing / new arcs)
+	#	The work is in proportion to the number of ancestors and their
+	#	descendants, not to the size of the whole connected component.
+	#	Use recomputeTransitiveClosure() to repair a damaged closure.
+
+	# the tracking records whose descendants may change: "tr_num" and
+	# its ancestors
+
+	ancestors = Set.Set ()
+	ancestors.add (tr_num)
+	for row in wtslib.sqlPrepared ('tcAncestors', [ tr_num, rel_type ]):
+		ancestors.add (row ['_tr_key'])
+
+	# load the direct arcs out of those tracking records (noting each
+	# one's children), and the old closure from them
+
+	children = {}			# node -> list of its direct children
+	outside = Set.Set ()		# direct children not in "ancestors"
+	old_tc = ArcSet.ArcSet ()	# the old transitive closure
+
+	for node in ancestors.values ():
+		children [node] = []
+
+	for row in wtslib.sqlPrepared ('tcArcsFrom', [ ancestors.values (),
+			rel_type ]):
+		start = row ['_tr_key']
+		stop = row ['_related_tr_key']
+		if row ['transitive_closure']:
+			old_tc.addPair (start, stop)
+		else:
+			children [start].append (stop)
+			if not ancestors.contains (stop):
+				outside.add (stop)
+
+	# the descendants of children outside "ancestors" are unaffected, so
+	# we can take them from the old closure.  (Each node reaches itself.)
+
+	reaches = {}		# node -> dictionary of the nodes it reaches
+	new_tc = ArcSet.ArcSet ()	# the new transitive closure
+
+	for node in outside.values ():
+		reaches [node] = {}
+
+	if not outside.empty ():
+		for row in wtslib.sqlPrepared ('tcArcsFrom', [ outside.values (),
+				rel_type ]):
+			if row ['transitive_closure']:
+				reaches [row ['_tr_key']][row ['_related_tr_key']] = 1
+
+	# an outside child which had no relationships before may lack its
+	# self-referential arc, so add that to the new closure
+
+	for node in outside.values ():
+		if not reaches [node].has_key (node):
+			reaches [node][node] = 1
+			new_tc.addPair (node, node)
+
+	# seed each ancestor with itself and its outside children's
+	# descendants, then pass descendants up the arcs among the ancestors
+	# until no more are found
+
+	for node in ancestors.values ():
+		reaches [node] = { node : 1 }
+		for child in children [node]:
+			if outside.contains (child):
+				reaches [node].update (reaches [child])
+
+	changed = TRUE
+	while changed:
+		changed = FALSE
+		for node in ancestors.values ():
+			mine = reaches [node]
+			for child in children [node]:
+				if not outside.contains (child):
+					for item in reaches [child].keys ():
+						if not mine.has_key (item):
+							mine [item] = 1
+							changed = TRUE
+
+	# the rest of the new closure is the arcs out of the ancestors.  (If
+	# "tr_num" no longer has any relationships, it has no closure.)
+
+	if (ancestors.count () == 1) and (not children [tr_num]):
+		reaches [tr_num] = {}
+
+	for node in ancestors.values ():
+		for item in reaches [node].keys ():
+			new_tc.addPair (node, item)
 
-def updateTransitiveClosure (
+	return reconcileClosure (old_tc, new_tc, rel_type)
+
+
+def recomputeTransitiveClosure (
 	tr_num,		# integer; key of the tracking record we're working with
 	rel_type,	# integer; type of relationship for which to update t.c.
 	):
-	# Purpose: updates the transitive closure in the database for the given
-	#	relationship type ("rel_type") for all nodes which are related
-	#	to the specified "tr_num"
+	# Purpose: recomputes the transitive closure in the database for the
+	#	given relationship type ("rel_type") for all nodes which are
+	#	related to the specified "tr_num"
 	# Returns: (ArcSet of added Arcs, ArcSet of deletedArcs)
 	# Assumes: that the changes to the actual arcs in WTS_Relationship have
 	#	already been made.
@@ -5156,13 +5527,6 @@ def updateTransitiveClosure (
 	TC_LINK = 1		# constant; indicates this is t.c.-related
 	NOT_TC_LINK = 0		# constant; indicates this is not t.c.-related
 
-	to_add = ArcSet.ArcSet ()	# set of Arc objects to add to the
-					# database to update the transitive
-					# closure among tracking records.
-	to_delete = ArcSet.ArcSet ()	# set of Arc objects to delete from the
-					# database to update the transitive
-					# closure among tracking records.
-
 	to_do = Set.Set ()	# set of tracking record numbers yet
 				# to be examined
 	done = Set.Set ()	# set of tracking record numbers we have
@@ -5219,7 +5583,7 @@ def updateTransitiveClosure (
 		for arc in arcs:
 			start = arc ['_tr_key']
 			stop = arc ['_related_tr_key']
-			connected_component.addArc (Arc.Arc (start, stop))
+			connected_component.addPair (start, stop)
 			if not done.contains (start):
 				to_do.add (start)
 			if not done.contains (stop):
@@ -5257,8 +5621,7 @@ def updateTransitiveClosure (
 
 	old_tc = ArcSet.ArcSet ()	# the old transitive closure
 	for row in old_closure:
-		old_tc.addArc (Arc.Arc (row ['_tr_key'],
-			row ['_related_tr_key']))
+		old_tc.addPair (row ['_tr_key'], row ['_related_tr_key'])
 
 	# now, pass the connected_component on to the Digraph module which will
 	# compute the new transitive closure and whether the digraph has a
@@ -5267,26 +5630,43 @@ def updateTransitiveClosure (
 	digraph = Digraph.Digraph (connected_component)
 	new_tc = digraph.getTransitiveClosure ()
 
-	# Finally, we are ready to go through the old transitive closure
+	return reconcileClosure (old_tc, new_tc, rel_type)
+
+
+def reconcileClosure (
+	old_tc,		# ArcSet; the transitive closure arcs now stored
+	new_tc,		# ArcSet; the transitive closure arcs we should have
+	rel_type	# integer; type of relationship for the arcs
+	):
+	# Purpose: update the stored transitive closure from "old_tc" to
+	#	"new_tc"
+	# Returns: (ArcSet of added Arcs, ArcSet of deletedArcs)
+	# Assumes: nothing
+	# Effects: inserts and deletes transitive closure arcs in the
+	#	WTS_Relationship table
+	# Throws: 1. wtslib.sqlError if there is a problem in executing the SQL
+	#	statements for some reason.
+
+	TC_LINK = 1		# constant; indicates this is t.c.-related
+
+	# We are ready to go through the old transitive closure
 	# (old_tc) and the new transitive closure (new_tc) to find out what
 	# has changed.
 
-	# Go through the old transitive closure.  Any Arc which does not appear
-	# in the new transitive closure must be deleted (it is no longer in
-	# the transitive closure), except self-referential arcs.
+	# Any arc in the old transitive closure which does not appear in the
+	# new transitive closure must be deleted (it is no longer in the
+	# transitive closure), except self-referential arcs.
 
-	for arc in old_tc.getArcs ():
-		if not new_tc.exists (arc):
-			if arc.getFromNode () != arc.getToNode ():
-				to_delete.addArc (arc)
+	to_delete = old_tc.difference (new_tc)
+	for (from_node, to_node) in to_delete.getPairs ():
+		if from_node == to_node:
+			to_delete.removeArc (Arc.Arc (from_node, to_node))
 
-	# And, go through the new transitive closure.  Any Arc which does not
-	# appear in the old transitive closure must be added.  (They are now in
-	# the transitive closure)
+	# And, any arc in the new transitive closure which does not appear in
+	# the old transitive closure must be added.  (They are now in the
+	# transitive closure)
 
-	for arc in new_tc.getArcs ():
-		if not old_tc.exists (arc):
-			to_add.addArc (arc)
+	to_add = new_tc.difference (old_tc)
 
 	# Finally, we need to update the database to reflect the new transitive
 	# closure.  To do that, we need to build a list of SQL statements to
@@ -5298,72 +5678,338 @@ def updateTransitiveClosure (
 	# generate insert statements for arcs we need to add to transitive
 	# closure.
 
-	for arc in to_add.getArcs ():
+	for (from_node, to_node) in to_add.getPairs ():
 		sql_statements.append ('''
 			insert into WTS_Relationship (_TR_key, _Related_TR_key,
 				relationship_type, transitive_closure)
 			values (%d, %d, %d, %d)''' % \
-				(arc.getFromNode (), arc.getToNode (),
-				rel_type, TC_LINK))
+				(from_node, to_node, rel_type, TC_LINK))
 
 	# generate delete statements for arcs we need to delete from the
 	# transitive closure.
 
-	for arc in to_delete.getArcs ():
+	for (from_node, to_node) in to_delete.getPairs ():
 		sql_statements.append ('''
 			delete from WTS_Relationship
 			where	(_TR_key = %d) and
 				(_Related_TR_key = %d) and
 				(relationship_type = %d) and
 				(transitive_closure = %d)''' % \
-			(arc.getFromNode (), arc.getToNode (),
-				rel_type, TC_LINK))
+			(from_node, to_node, rel_type, TC_LINK))
 
 	# Execute those sql statements to bring the database up to date.
 
 	if len (sql_statements) > 0:
-		wtslib.sql (sql_statements)
+		wtslib.sql (sql_statements, batch = 1)
 	return (to_add, to_delete)
 
-#-Tree Generating Code------------------------------------------------------
 
-# define two global variables for use in this section:
-#	Child_Query = the query to find children of a given node
-#	ChildrenOf = a dictionary which maps a node to its children
+# queries for the set-based closure engine.  Each is run with bind parameters
+# (so it returns its rows even in a batch), and they share two temporary
+# tables, which are dropped when the transaction commits:
+#	tc_component = the tracking records whose closure we are rebuilding
+#	tc_new = the new transitive closure among them
+
+TC_COMPONENT_OF = '''create temp table tc_component on commit drop as
+	with recursive component (node) as (
+		select %s::int
+		union
+		select case when r._TR_key = c.node then r._Related_TR_key
+			else r._TR_key end
+		from component c, WTS_Relationship r
+		where ((r._TR_key = c.node) or (r._Related_TR_key = c.node))
+			and (r.relationship_type = %s)
+			and (r.transitive_closure = 0)
+		)
+	select node from component'''
+
+TC_COMPONENT_ALL = '''create temp table tc_component on commit drop as
+	select _TR_key as node
+	from WTS_Relationship
+	where (relationship_type = %s) and (transitive_closure = 0)
+	union
+	select _Related_TR_key
+	from WTS_Relationship
+	where (relationship_type = %s) and (transitive_closure = 0)'''
+
+# each node with any relationship reaches itself, and whatever its children
+# reach
+
+TC_NEW = '''create temp table tc_new on commit drop as
+	with recursive reach (_TR_key, _Related_TR_key) as (
+		select c.node, c.node
+		from tc_component c
+		where exists (select 1
+			from WTS_Relationship r
+			where ((r._TR_key = c.node) or
+				(r._Related_TR_key = c.node))
+			and (r.relationship_type = %s)
+			and (r.transitive_closure = 0))
+		union
+		select reach._TR_key, r._Related_TR_key
+		from reach, WTS_Relationship r
+		where (r._TR_key = reach._Related_TR_key)
+			and (r.relationship_type = %s)
+			and (r.transitive_closure = 0)
+		)
+	select _TR_key, _Related_TR_key from reach'''
+
+TC_INDEX = 'create index tc_new_idx on tc_new (_TR_key, _Related_TR_key)'
+
+# as in reconcileClosure(), self-referential arcs are never deleted
+
+TC_DELETE = '''delete from WTS_Relationship r
+	using tc_component c
+	where ((r._TR_key = c.node) or (r._Related_TR_key = c.node))
+		and (r.relationship_type = %s)
+		and (r.transitive_closure = 1)
+		and (r._TR_key != r._Related_TR_key)
+		and not exists (select 1
+			from tc_new n
+			where (n._TR_key = r._TR_key)
+			and (n._Related_TR_key = r._Related_TR_key))
+	returning r._TR_key, r._Related_TR_key'''
+
+# when rebuilding the whole closure, a stale arc may no longer touch any node
+# in tc_component (if both its nodes lost all their real relationships), so
+# we check every closure arc of the type
+
+TC_DELETE_ALL = '''delete from WTS_Relationship r
+	where (r.relationship_type = %s)
+		and (r.transitive_closure = 1)
+		and (r._TR_key != r._Related_TR_key)
+		and not exists (select 1
+			from tc_new n
+			where (n._TR_key = r._TR_key)
+			and (n._Related_TR_key = r._Related_TR_key))
+	returning r._TR_key, r._Related_TR_key'''
+
+TC_INSERT = '''insert into WTS_Relationship (_TR_key, _Related_TR_key,
+		relationship_type, transitive_closure)
+	select n._TR_key, n._Related_TR_key, %s, 1
+	from tc_new n
+	where not exists (select 1
+		from WTS_Relationship r
+		where (r._TR_key = n._TR_key)
+		and (r._Related_TR_key = n._Related_TR_key)
+		and (r.relationship_type = %s)
+		and (r.transitive_closure = 1))
+	returning _TR_key, _Related_TR_key'''
+
+def sqlTransitiveClosure (
+	tr_num,		# integer; key of the tracking record we're working
+			# with, or None to rebuild the closure for every
+			# tracking record
+	rel_type	# integer; type of relationship for which to update t.c.
+	):
+	# Purpose: recomputes the transitive closure in the database for the
+	#	given relationship type ("rel_type"), for all nodes which are
+	#	related to the specified "tr_num" (or for all nodes), entirely
+	#	within the database server
+	# Returns: (ArcSet of added Arcs, ArcSet of deletedArcs)
+	# Assumes: that the changes to the actual arcs in WTS_Relationship have
+	#	already been made.
+	# Effects: see Purpose.
+	# Throws: 1. wtslib.sqlError if there is a problem in executing the SQL
+	#	statements for some reason.
+	# Notes: This gives the same results as recomputeTransitiveClosure(),
+	#	but finds the connected component and its closure with
+	#	recursive queries, and applies the differences with one
+	#	set-based delete and one set-based insert, rather than a
+	#	statement per arc.  It is used instead of the Python code when
+	#	the TC_ENGINE config parameter is 'sql' (see closureEngine()),
+	#	and always for rebuilding the closure of the whole database.
+
+	if tr_num is None:
+		component = (TC_COMPONENT_ALL, [ rel_type, rel_type ])
+		delete = TC_DELETE_ALL
+	else:
+		component = (TC_COMPONENT_OF, [ tr_num, rel_type ])
+		delete = TC_DELETE
+
+	results = wtslib.sql ([ component,
+		(TC_NEW, [ rel_type, rel_type ]),
+		(TC_INDEX, []),
+		(delete, [ rel_type ]),
+		(TC_INSERT, [ rel_type, rel_type ]) ], batch = 1)
+
+	to_add = ArcSet.ArcSet ()	# set of Arc objects added
+	to_delete = ArcSet.ArcSet ()	# set of Arc objects deleted
+
+	for row in results[3]:
+		to_delete.addPair (row ['_tr_key'], row ['_related_tr_key'])
+	for row in results[4]:
+		to_add.addPair (row ['_tr_key'], row ['_related_tr_key'])
+	return (to_add, to_delete)
+
+
+def closureEngine ():
+	# Purpose: find out how we should maintain the transitive closure
+	# Returns: string; 'sql' to use sqlTransitiveClosure(), or 'python'
+	#	(the default) to use the Python code
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: set by the optional TC_ENGINE parameter in the config file
+
+	return string.lower (str (wtslib.fileConfig ('TC_ENGINE', 'python')))
 
-ChildQuery = '''select _Related_TR_key
-		from WTS_Relationship
-		where (_TR_key = %d) and
-			(relationship_type = %d) and
-			(transitive_closure = 0)
-		order by _Related_TR_key'''
-ChildrenOf = {}
+def sortEngine ():
+	# Purpose: find out where we should sort the results of a query
+	# Returns: string; 'sql' (the default) to sort in the database, or
+	#	'python' to sort in sort_results()
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: set by the optional SORT_ENGINE parameter in the config file
+
+	return string.lower (str (wtslib.fileConfig ('SORT_ENGINE', 'sql')))
+
+#-Tree Generating Code------------------------------------------------------
+
+# The tree service fetches a whole dependency tree (or a flat list of all
+# relatives) in one recursive query, along with the title and status of only
+# those tracking records in it.  Each query can go either way along the
+# "Depends On" arcs:
+#	down = toward the tracking records on which a TR depends
+#	up = toward the tracking records which depend on it (ancestors, or
+#		"who is waiting on me")
+
+# TreeQuery has a row for each node of the tree, in the order it should be
+# drawn.  A node's 'path' is the list of TR numbers from the root to it, so
+# sorting on it lists each parent before its children, and children in
+# numerical order.  Any TR already on the path is not followed again, so
+# cycles cannot loop forever.  $3 is the depth limit (negative for none).
+# We use an outer join to WTS_TrackRec, so that a relationship to a TR which
+# is missing from it still gives a row (with 'found' false, and a null title
+# and status); skipping it would hang its children on the wrong parent.
+
+TreeQuery = '''with recursive tree (_TR_key, depth, path) as (
+		select $1::int, 0, array[$1::int]
+		union all
+		select r.%s, t.depth + 1, t.path || r.%s
+		from tree t, WTS_Relationship r
+		where (r.%s = t._TR_key) and
+			(r.relationship_type = $2) and
+			(r.transitive_closure = 0) and
+			(($3 < 0) or (t.depth < $3)) and
+			not (r.%s = any (t.path))
+		)
+	select t._TR_key, t.depth, tr.tr_title, tr._Status_key,
+		(tr._TR_key is not null) as found
+	from tree t
+	left outer join WTS_TrackRec tr on (t._TR_key = tr._TR_key)
+	order by t.path'''
+
+# RelativesQuery has one row for each TR reachable from $1 (other than $1)
+
+RelativesQuery = '''with recursive relatives (_TR_key) as (
+		select $1::int
+		union
+		select r.%s
+		from relatives rel, WTS_Relationship r
+		where (r.%s = rel._TR_key) and
+			(r.relationship_type = $2) and
+			(r.transitive_closure = 0)
+		)
+	select tr._TR_key, tr.tr_title, tr._Status_key
+	from relatives rel, WTS_TrackRec tr
+	where (rel._TR_key = tr._TR_key) and
+		(rel._TR_key != $1)
+	order by tr._TR_key'''
+
+DOWN = ('_Related_TR_key', '_TR_key')	# (field to follow, field to match)
+UP = ('_TR_key', '_Related_TR_key')
+
+wtslib.definePrepared ('treeDown', [ 'int', 'int', 'int' ], TreeQuery % \
+	(DOWN[0], DOWN[0], DOWN[1], DOWN[0]))
+wtslib.definePrepared ('treeUp', [ 'int', 'int', 'int' ], TreeQuery % \
+	(UP[0], UP[0], UP[1], UP[0]))
+wtslib.definePrepared ('relativesDown', [ 'int', 'int' ], RelativesQuery % \
+	DOWN)
+wtslib.definePrepared ('relativesUp', [ 'int', 'int' ], RelativesQuery % UP)
+
+def getTree (
+	tr_num,			# number of the tracking record at the root
+	ancestors = FALSE,	# boolean; build the tree of TRs which depend
+				# on "tr_num", rather than those on which it
+				# depends?
+	max_depth = None	# integer; number of levels to go below the
+				# root, or None for no limit
+	):
+	# Purpose: get the dependency tree rooted at "tr_num"
+	# Returns: a tuple with two items: the tree, in the list form
+	#	described in subTreeOf(), and a dictionary which maps each TR
+	#	number in the tree to a row with its 'tr_title' and
+	#	'_status_key' (both None for a TR missing from WTS_TrackRec)
+	# Assumes: db's SQL routines have been initialized
+	# Effects: queries the database
+	# Throws: 1. error if "tr_num" does not exist; 2. propagates
+	#	wtslib.sqlError if we have problems querying the database
+	# Notes: A TR reached along more than one path appears once for each.
+	#	A path stops short of any TR already on it (a cycle).
 
-def getChildrenOf (
-	tr_num		# number of the tracking record we are investigating
+	if ancestors:
+		name = 'treeUp'
+	else:
+		name = 'treeDown'
+	if max_depth is None:
+		max_depth = -1
+
+	rows = wtslib.sqlPrepared (name, [ tr_num, DEPENDS_ON, max_depth ])
+	if not rows [0]['found']:
+		raise error, 'Cannot find TR%s in database' % tr_num
+
+	# the rows come in the order we would draw them, so the parent of each
+	# node is the last one we saw at the next level up
+
+	info = {}
+	tree = None
+	branches = []	# branches [i] = latest node seen at depth i
+	for row in rows:
+		info [row ['_tr_key']] = row
+		node = [ row ['_tr_key'] ]
+		depth = row ['depth']
+		del branches [depth:]
+		if branches:
+			branches [-1].append (node)
+		else:
+			tree = node
+		branches.append (node)
+	return tree, info
+
+def getRelatives (
+	tr_num,			# number of the tracking record to investigate
+	ancestors = FALSE	# boolean; get the TRs which depend on "tr_num",
+				# rather than those on which it depends?
 	):
-	# Purpose: return a list of tracking records on which "tr_num" depends
-	# Returns: a list of integer tracking record numbers
+	# Purpose: get all tracking records on which "tr_num" depends, directly
+	#	or indirectly (or which depend on it)
+	# Returns: a list of rows, each with '_tr_key', 'tr_title', and
+	#	'_status_key', ordered by TR number.  "tr_num" itself is not
+	#	included.
 	# Assumes: db's SQL routines have been initialized
-	# Effects: queries the database to retrieve children of tr_num
+	# Effects: queries the database
 	# Throws: propagates wtslib.sqlError if we have problems querying the
 	#	database
 
-	results = wtslib.sql (ChildQuery % (tr_num, DEPENDS_ON))
-	kids = []
-	for row in results:
-		kids.append (row ['_related_tr_key'])
-	return kids
+	if ancestors:
+		name = 'relativesUp'
+	else:
+		name = 'relativesDown'
+	return wtslib.sqlPrepared (name, [ tr_num, DEPENDS_ON ])
 
 def subTreeOf (
-	tr_num		# number of the tracking record we want to investigate
+	tr_num,		# number of the tracking record we want to investigate
+	ancestors = FALSE,	# boolean; go up the dependencies, not down?
+	max_depth = None	# integer; levels below "tr_num", or None for
+				# no limit
 	):
 	# Purpose: return a list with information about all tracking records on
 	#	which "tr_num" depends
 	# Returns: a list as described in Notes
 	# Assumes: db's SQL routines have been initialized
-	# Effects: queries the database to build the required list, adds entries
-	#	to the ChildrenOf dictionary
+	# Effects: queries the database to build the required list
 	# Throws: propagates wtslib.sqlError if we have problems querying the
 	#	database
 	# Notes: We return a list with potentially multiple items.  The first
@@ -5377,15 +6023,7 @@ def subTreeOf (
 	#	And, subTreeOf (1) would return:
 	#		[ 1, [2, [3, [5], [6]], [4]]]
 
-	global ChildrenOf
-
-	if not ChildrenOf.has_key (tr_num):
-		ChildrenOf [tr_num] = getChildrenOf (tr_num)
-	kids = ChildrenOf [tr_num]
-	list = [ tr_num ]
-	for kid in kids:
-		list.append (subTreeOf (kid))
-	return list
+	return getTree (tr_num, ancestors, max_depth)[0]
 
 def graphSubTree (
 	branch,		# the subtree to graph (as generated by subTreeOf () )
@@ -5440,45 +6078,871 @@ def graphSubTree (
 
 def graphTree (
 	tr_num,			# "root" tracking record number we want to graph
-	showTitle = TRUE	# show the titles beside the TR nubmers?
+	showTitle = TRUE,	# show the titles beside the TR nubmers?
+	ancestors = FALSE,	# graph the TRs which depend on "tr_num",
+				# rather than those on which it depends?
+	max_depth = None	# integer; number of levels to graph below the
+				# root, or None for no limit
 	):
 	# Purpose: return a list of strings which graph (textually) the
 	#	dependencies of "tr_num"
 	# Returns: a list of strings
 	# Assumes: nothing
 	# Effects: builds the required list
-	# Throws: propagates wtslib.sqlError if we have problems querying the
-	#	database
+	# Throws: 1. error if "tr_num" does not exist; 2. propagates
+	#	wtslib.sqlError if we have problems querying the database
 	# Example: see the Examples of graphSubTree()
 
-	tree = subTreeOf (tr_num)
-	results = wtslib.sql ('select _TR_key, tr_title from WTS_TrackRec')
+	tree, info = getTree (tr_num, ancestors, max_depth)
 	titles = {}
-	for row in results:
-		titles [ row ['_tr_key'] ] = row ['tr_title']
+	for (key, row) in info.items ():
+		titles [key] = row ['tr_title']
 	return graphSubTree (tree, titles, '', showTitle)
 
 
+#-Full-Text Search Code----------------------------------------------------
+
+# A search of the big text fields (or of Titles, with queryTitle()) looks for
+# words rather than substrings, using Postgres full-text search.  Each is
+# backed by a GIN index on an expression (see TEXT_INDEXES), which the
+# database keeps up to date as text is saved, so WTS need not maintain it.
+# Our queries must use exactly the same expression (see textVector()) for
+# the database to use the index.
+
+TEXT_SEARCH_CONFIG = 'english'	# Postgres text search configuration
+
+TEXT_INDEXES = [
+	'''create index if not exists wts_text_fulltext_idx on WTS_Text
+		using gin (to_tsvector ('%s', text_block))''' % \
+		TEXT_SEARCH_CONFIG,
+	'''create index if not exists wts_trackrec_title_fulltext_idx
+		on WTS_TrackRec
+		using gin (to_tsvector ('%s', tr_title))''' % \
+		TEXT_SEARCH_CONFIG,
+	]
+
+TEXT_MARK = '**'		# marks the words matched in a snippet
+
+TEXT_SNIPPET_OPTIONS = 'StartSel=%s, StopSel=%s, MaxFragments=2, ' \
+	'MaxWords=20, MinWords=5' % (TEXT_MARK, TEXT_MARK)
+
+def textSearchEngine ():
+	# Purpose: find out how we should search the big text fields
+	# Returns: string; 'fulltext' (the default) to search for words with
+	#	the full-text index, or 'substring' to search for the exact
+	#	string with "ilike"
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: set by the optional TEXT_SEARCH parameter in the config file
+
+	return string.lower (str (wtslib.fileConfig ('TEXT_SEARCH',
+		'fulltext')))
+
+def textVector (
+	column		# string; name of the text column to search
+	):
+	# Purpose: get the SQL expression for the words in 'column'
+	# Returns: string
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	return "to_tsvector ('%s', %s)" % (TEXT_SEARCH_CONFIG, column)
+
+def textQuery (
+	words		# string; words to search for, as entered by the user,
+			# with any single quotes doubled
+	):
+	# Purpose: get the SQL expression which searches for all of 'words'
+	# Returns: string
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	return "plainto_tsquery ('%s', '%s')" % (TEXT_SEARCH_CONFIG, words)
+
+def buildTextIndexes ():
+	# Purpose: create the full-text indexes, if they do not exist already
+	# Returns: nothing
+	# Assumes: we may create indexes in the WTS schema
+	# Effects: creates indexes in the database, which may take a while for
+	#	a large WTS_Text table
+	# Throws: propagates wtslib.sqlError if we cannot create them
+
+	wtslib.sql (TEXT_INDEXES, TRUE)
+	return
+
+def highlightSnippet (
+	snippet		# string; text matched by a full-text search, as in
+			# the "Matching Text" of a query result
+	):
+	# Purpose: convert 'snippet' to HTML, with the matched words in bold
+	# Returns: string
+	# Assumes: the matched words are surrounded by TEXT_MARK
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: The text fields may contain HTML of their own, which we show
+	#	as-is rather than let a fragment of it break the page.
+
+	snippet = string.replace (snippet, '&', '&amp;')
+	snippet = string.replace (snippet, '<', '&lt;')
+	snippet = string.replace (snippet, '>', '&gt;')
+	pieces = string.split (snippet, TEXT_MARK)
+	for i in range (1, len (pieces), 2):
+		pieces [i] = '<B>%s</B>' % pieces [i]
+	return string.join (pieces, '')
+
+#-Query Result Cache--------------------------------------------------------
+
+# Saved searches (a staff member's "my TRs", area dashboards) run the same
+# queries over and over, so we keep the results of each query in a file for
+# QUERY_CACHE_TTL seconds.  Each file is named for a digest of the validated
+# query dictionary, and holds (generation, time stored, results).  Any save of
+# a tracking record bumps the generation number, which marks every stored
+# result as stale.  (A save can add a TR to a query's results as easily as
+# change or remove one, so we cannot tell which results are unaffected.)
+# Each lookup appends one character to the 'counts' file -- 'h' for a hit or
+# 'm' for a miss -- as appends are atomic and need no locking.  Reading the
+# statistics starts a new counts file.
+
+QUERY_CACHE_GENERATION = 'generation'	# names of the bookkeeping files in
+QUERY_CACHE_COUNTS = 'counts'		# the cache directory
+QUERY_CACHE_SUFFIX = '.results'		# suffix for files of cached results
+
+def queryCacheDir ():
+	# Purpose: get the directory which holds the query result cache
+	# Returns: string; the QUERY_CACHE_DIR parameter from the config file,
+	#	or wts.query.cache in DIAG_DIR if that is not defined
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	return wtslib.fileConfig ('QUERY_CACHE_DIR', os.path.join (
+		wtslib.fileConfig ('DIAG_DIR', '.'), 'wts.query.cache'))
+
+def queryCacheTTL ():
+	# Purpose: get the number of seconds for which to keep query results
+	# Returns: integer; 0 if the cache is turned off
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: set by the optional QUERY_CACHE_TTL parameter in the config
+	#	file (default 300)
+
+	try:
+		return string.atoi (str (wtslib.fileConfig ('QUERY_CACHE_TTL',
+			'300')))
+	except ValueError:
+		return 300
+
+def queryCacheGeneration ():
+	# Purpose: get the current generation number of the query cache
+	# Returns: integer; 0 if no TR has been saved since the cache began
+	# Assumes: nothing
+	# Effects: reads the generation file
+	# Throws: nothing
+
+	try:
+		fp = open (os.path.join (queryCacheDir (),
+			QUERY_CACHE_GENERATION), 'r')
+		generation = string.atoi (string.strip (fp.read ()))
+		fp.close ()
+	except (IOError, ValueError):
+		generation = 0
+	return generation
+
+def invalidateQueryCache ():
+	# Purpose: note that tracking record data has changed, so no stored
+	#	query results may be used
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: increments the generation number, then removes the files
+	#	of stored results to reclaim their space
+	# Throws: nothing
+	# Notes: The generation number (not the removal) is what guarantees
+	#	freshness, as a query which was running during the save may
+	#	yet store its results; they are marked with the old generation.
+	#	Two saves at once must each bump the generation, or results
+	#	stored between them would look current, so we hold a WriteLock
+	#	while reading and writing it (as for bump_CV_Version).  A
+	#	failure to write the cache is not an error, as it just means
+	#	there is no cache.
+
+	path = queryCacheDir ()
+	if not os.path.isdir (path):
+		return
+	try:
+		generation = os.path.join (path, QUERY_CACHE_GENERATION)
+		padlock = WriteLock.WriteLock (generation + '.lock')
+		if padlock.lock ():
+			try:
+				Controlled_Vocab.write_File (generation,
+					'%d\n' % (queryCacheGeneration () + 1))
+			finally:
+				padlock.unlock ()
+		for filename in os.listdir (path):
+			if filename [-len (QUERY_CACHE_SUFFIX):] == \
+					QUERY_CACHE_SUFFIX:
+				os.remove (os.path.join (path, filename))
+	except (IOError, OSError):
+		pass
+	return
+
+def countQueryCache (
+	outcome		# string; 'h' for a cache hit, 'm' for a miss
+	):
+	# Purpose: count one lookup in the query cache
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: appends "outcome" to the counts file
+	# Throws: nothing
+
+	try:
+		fp = open (os.path.join (queryCacheDir (), QUERY_CACHE_COUNTS),
+			'a')
+		fp.write (outcome)
+		fp.close ()
+	except IOError:
+		pass
+	return
+
+def queryCacheKey (
+	clean_dict,	# dictionary, as returned by validate_Query_Form()
+	page = None	# tuple (page number, page size), or None for all
+	):
+	# Purpose: get the name of the file which would hold the results of
+	#	the query in "clean_dict" (or of one "page" of them)
+	# Returns: string; a filename (without the directory)
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: The CV version is part of the key, as the results include
+	#	the names of controlled vocabulary terms.
+
+	items = clean_dict.items ()
+	items.sort ()
+	return md5.new (repr ( (Controlled_Vocab.get_CV_Version (), items,
+		page) )).hexdigest () + QUERY_CACHE_SUFFIX
+
+def run_Query (
+	clean_dict	# dictionary, as returned by validate_Query_Form(),
+			# with the display and sorting fields filled in
+	):
+	# Purpose: get the results of the query in "clean_dict", from the
+	#	cache if we can
+	# Returns: a list of dictionaries, as from build_And_Run_SQL()
+	# Assumes: see build_And_Run_SQL()
+	# Effects: see cachedQuery()
+	# Throws: propagates wtslib.sqlError if we have problems querying the
+	#	database
+
+	return cachedQuery (clean_dict, None)
+
+def run_Query_Page (
+	clean_dict,	# dictionary, as returned by validate_Query_Form(),
+			# with the display and sorting fields filled in
+	page_number,	# integer; which page of results to get (1 = first)
+	page_size	# integer; number of rows on each page
+	):
+	# Purpose: get one page of the results of the query in "clean_dict",
+	#	from the cache if we can
+	# Returns: tuple (list of dictionaries, integer total number of rows
+	#	in all pages), as from build_And_Run_Page()
+	# Assumes: see build_And_Run_SQL()
+	# Effects: see cachedQuery()
+	# Throws: propagates wtslib.sqlError if we have problems querying the
+	#	database
+
+	return cachedQuery (clean_dict, (page_number, page_size))
+
+def queryCacheContents (
+	results,	# as returned by cachedQuery()
+	page		# tuple (page number, page size), or None for all
+	):
+	# Purpose: convert "results" to a form which the marshal module can
+	#	write to a file of cached results
+	# Returns: "results", with each row copied to a plain dictionary and
+	#	encoded by wtslib.toWire()
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: We do not pickle cached results, as the cache directory is
+	#	writable by the web server's group, and unpickling a file can
+	#	run code chosen by whoever wrote it.
+
+	if page is None:
+		return wtslib.toWire (map (lambda row: row.copy (), results))
+	rows, total = results
+	return wtslib.toWire ((map (lambda row: row.copy (), rows), total))
+
+def cachedQuery (
+	clean_dict,	# dictionary, as returned by validate_Query_Form(),
+			# with the display and sorting fields filled in
+	page		# tuple (page number, page size), or None for all
+	):
+	# Purpose: get the results of the query in "clean_dict" (or of one
+	#	page of them), from the cache if we can
+	# Returns: as from build_And_Run_SQL() if "page" is None, or as from
+	#	build_And_Run_Page() if not
+	# Assumes: see build_And_Run_SQL()
+	# Effects: may query the database, and may read or write a file in
+	#	the query cache directory.  Counts a hit or miss.
+	# Throws: propagates wtslib.sqlError if we have problems querying the
+	#	database
+	# Notes: A failure to read or write the cache is not an error; we just
+	#	query the database.  If QUERY_CACHE_TTL is 0, or the cache
+	#	directory does not exist and cannot be made, we always do.
+
+	if page is None:
+		run = build_And_Run_SQL
+		args = (clean_dict,)
+	else:
+		run = build_And_Run_Page
+		args = (clean_dict, page[0], page[1])
+
+	ttl = queryCacheTTL ()
+	path = queryCacheDir ()
+	if ttl <= 0:
+		return apply (run, args)
+	if not os.path.isdir (path):
+		try:
+			os.mkdir (path)
+			os.chmod (path, 0775)	# shared with the CGIs
+		except OSError:
+			return apply (run, args)
+
+	filename = os.path.join (path, queryCacheKey (clean_dict, page))
+	generation = queryCacheGeneration ()
+	try:
+		fp = open (filename, 'rb')
+		(stored_generation, stored_time, results) = wtslib.fromWire (
+			marshal.loads (fp.read ()))
+		fp.close ()
+		if (stored_generation == generation) and \
+				(time.time () - stored_time < ttl):
+			countQueryCache ('h')
+			return results
+	except:
+		pass		# missing or unreadable; just run the query
+
+	countQueryCache ('m')
+	results = apply (run, args)
+	try:
+		Controlled_Vocab.write_File (filename, marshal.dumps ((
+			generation, time.time (),
+			queryCacheContents (results, page))))
+	except (IOError, OSError, ValueError):
+		pass		# ValueError if a value cannot be marshalled
+	return results
+
+def queryCacheStats ():
+	# Purpose: summarize how well the query cache is working
+	# Returns: dictionary with integer values for keys 'hits', 'misses'
+	#	(both since the last call), 'entries' (files of results now
+	#	stored), 'generation', and 'ttl'
+	# Assumes: nothing
+	# Effects: reads the query cache directory; removes the counts file,
+	#	so that it does not grow without limit
+	# Throws: nothing
+
+	stats = { 'hits' : 0, 'misses' : 0, 'entries' : 0,
+		'generation' : queryCacheGeneration (),
+		'ttl' : queryCacheTTL () }
+	path = queryCacheDir ()
+
+	# move the counts file aside before reading it, so lookups from now
+	# on start a new one
+
+	counts_path = os.path.join (path, QUERY_CACHE_COUNTS)
+	read_path = '%s.%d' % (counts_path, os.getpid ())
+	try:
+		os.rename (counts_path, read_path)
+		fp = open (read_path, 'r')
+		counts = fp.read ()
+		fp.close ()
+		os.remove (read_path)
+		stats ['hits'] = string.count (counts, 'h')
+		stats ['misses'] = string.count (counts, 'm')
+	except (IOError, OSError):
+		pass
+	try:
+		for filename in os.listdir (path):
+			if filename [-len (QUERY_CACHE_SUFFIX):] == \
+					QUERY_CACHE_SUFFIX:
+				stats ['entries'] = stats ['entries'] + 1
+	except OSError:
+		pass
+	return stats
+
+#-Query Paging and Streaming Code------------------------------------------
+
+# A query which matches many tracking records can take a long time to show,
+# and its results a lot of memory to hold.  So, the query results screen
+# shows one "page" of QUERY_PAGE_SIZE rows at a time, which we get from the
+# database with "limit" and "offset".  The "As Text" output has no pages;
+# instead, we pass its rows along as they come from a cursor in the
+# database.  (Both need the database to sort the rows.  If SORT_ENGINE is
+# 'python', we must get all the rows before we can show any of them.)
+
+def queryPageSize ():
+	# Purpose: get the number of tracking records to show on each page of
+	#	query results
+	# Returns: integer; 0 if we should show them all on one page
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	try:
+		return max (0, string.atoi (str (wtslib.fileConfig (
+			'QUERY_PAGE_SIZE', '100'))))
+	except ValueError:
+		return 100
+
+def build_And_Run_Page (
+	clean_dict,	# a validated dictionary of fieldname -> desired values
+			# (from the tracking record Query Form) to use in
+			# generating and running queries
+	page_number,	# integer; which page of results to get (1 = first)
+	page_size	# integer; number of rows on each page
+	):
+	# Purpose: builds and runs the SQL query as specified by the user on
+	#	the tracking record Query Form, getting only one page of the
+	#	results
+	# Returns: tuple (list of dictionaries, as from build_And_Run_SQL(),
+	#	for the rows on the page; integer total number of rows in all
+	#	pages)
+	# Assumes: see build_Query_SQL()
+	# Effects: queries the database
+	# Throws: wtslib.sqlError if an error occurs while running the SQL
+	#	statement
+
+	page = (page_number, page_size)
+	plan = build_Query_SQL (clean_dict, page)
+
+	if plan ['python_sort']:
+		# we must get and sort all the rows to know which are on
+		# this page
+
+		results = finish_Query_Rows (wtslib.sql (plan ['sql']), plan)
+		start = (page_number - 1) * page_size
+		return (results [start : start + page_size], len (results))
+
+	rows = wtslib.sql (plan ['sql'])
+	if rows:
+		total = rows[0]['total_rows']
+	elif page_number > 1:
+		# we are past the last page, so count the rows separately
+
+		total = wtslib.sql ('select count (*) as total_rows from ' + \
+			'(%s) pg' % build_Query_SQL (clean_dict) ['sql']
+			) [0]['total_rows']
+	else:
+		total = 0
+	return (finish_Query_Rows (rows, plan), total)
+
+def stream_Query (
+	clean_dict,	# a validated dictionary of fieldname -> desired values
+			# (from the tracking record Query Form) to use in
+			# generating and running queries
+	handler		# function which accepts a list of dictionaries (as
+			# from build_And_Run_SQL()); called for each batch
+	):
+	# Purpose: builds and runs the SQL query as specified by the user on
+	#	the tracking record Query Form, passing the results to
+	#	"handler" a batch at a time
+	# Returns: integer; the number of rows found
+	# Assumes: see build_Query_SQL()
+	# Effects: queries the database, through a cursor (see
+	#	wtslib.sqlCursor) unless we must sort in Python
+	# Throws: wtslib.sqlError if an error occurs while running the SQL
+	#	statement
+	# Notes: The results do not go through the query result cache, as
+	#	the point is to not hold them all at once.  Since they are
+	#	going straight out as text, their dates are already formatted
+	#	(see format_Query_Dates()).
+
+	plan = build_Query_SQL (clean_dict)
+
+	if plan ['python_sort']:
+		results = format_Query_Dates (finish_Query_Rows (
+			wtslib.sql (plan ['sql']), plan))
+		handler (results)
+		return len (results)
+
+	return wtslib.sqlCursor (plan ['sql'],
+		lambda rows, plan = plan, handler = handler:
+			handler (format_Query_Dates (finish_Query_Rows (rows,
+				plan))))
+
+def format_Query_Dates (
+	results		# list of dictionaries, as from build_And_Run_SQL()
+	):
+	# Purpose: convert the dates in "results" to strings in the standard
+	#	WTS format, for output as text
+	# Returns: "results"
+	# Assumes: nothing
+	# Effects: changes the dictionaries in "results"
+	# Throws: nothing
+
+	for row in results:
+		for field in QUERY_RESULT_DATES:
+			if row.has_key (field):
+				row [field] = wtslib.format_DateTime (
+					row [field])
+	return results
+
+#-Graph Report Code---------------------------------------------------------
+
+# The graph report loads the whole "Depends On" graph in one query and
+# analyzes it in memory, using the linear-time component and chain code in
+# the Digraph module.
+
+wtslib.definePrepared ('graphArcs', [ 'int' ], '''
+	select _TR_key, _Related_TR_key
+	from WTS_Relationship
+	where (relationship_type = $1) and (transitive_closure = 0)''')
+
+# self-referential closure rows are never removed (see reconcileClosure()),
+# so we need not check them
+
+wtslib.definePrepared ('graphClosure', [ 'int' ], '''
+	select _TR_key, _Related_TR_key
+	from WTS_Relationship
+	where (relationship_type = $1) and (transitive_closure = 1) and
+		(_TR_key != _Related_TR_key)''')
+
+wtslib.definePrepared ('graphSummaries', [ 'int[]' ], '''
+	select _TR_key, tr_title, _Status_key
+	from WTS_TrackRec
+	where _TR_key = any ($1)''')
+
+def graphReport (
+	top = 10	# integer; number of chains and hot spots to report
+	):
+	# Purpose: analyze the whole "Depends On" graph
+	# Returns: a dictionary with:
+	#	'nodes' : number of TRs with any dependency
+	#	'arcs' : number of direct dependencies
+	#	'cycles' : list of cycles, each a sorted list of TR numbers
+	#	'chains' : list of the "top" longest blocking chains, longest
+	#		first, as returned by Digraph.longestChains()
+	#	'fanIn' : list of (count, TR number) tuples for the "top" TRs
+	#		on which the most other TRs directly depend, most first
+	#	'orphans' : sorted list of (TR number, related TR number)
+	#		tuples for closure rows not implied by the dependencies
+	#	'info' : dictionary mapping each TR number mentioned above to a
+	#		row with its 'tr_title' and '_status_key'
+	#	'seconds' : float; time taken to build the report
+	# Assumes: db's SQL routines have been initialized
+	# Effects: queries the database
+	# Throws: propagates wtslib.sqlError if we have problems querying the
+	#	database
+
+	start_time = time.time ()
+
+	children = {}		# node -> list of nodes on which it depends
+	fan_in = {}		# node -> number of nodes which depend on it
+	arc_count = 0
+
+	for row in wtslib.sqlPrepared ('graphArcs', [ DEPENDS_ON ]):
+		start = row ['_tr_key']
+		stop = row ['_related_tr_key']
+		if not children.has_key (start):
+			children [start] = []
+		if not children.has_key (stop):
+			children [stop] = []
+		children [start].append (stop)
+		fan_in [stop] = fan_in.get (stop, 0) + 1
+		arc_count = arc_count + 1
+
+	closure, cycles = Digraph.sccClosure (children)
+	chains = Digraph.longestChains (children, top)
+
+	hot_spots = []
+	for (node, count) in fan_in.items ():
+		hot_spots.append ( (-count, node) )
+	hot_spots.sort ()
+	hot_spots = map (lambda (count, node): (-count, node), hot_spots [:top])
+
+	orphans = []
+	for row in wtslib.sqlPrepared ('graphClosure', [ DEPENDS_ON ]):
+		start = row ['_tr_key']
+		stop = row ['_related_tr_key']
+		if not (closure.has_key (start) and (stop in closure [start])):
+			orphans.append ( (start, stop) )
+	orphans.sort ()
+
+	# look up the titles and statuses of just those TRs we report
+
+	mentioned = {}
+	for cycle in cycles:
+		for node in cycle:
+			mentioned [node] = 1
+	for chain in chains:
+		for members in chain:
+			for node in members:
+				mentioned [node] = 1
+	for (count, node) in hot_spots:
+		mentioned [node] = 1
+	for (start, stop) in orphans:
+		mentioned [start] = 1
+		mentioned [stop] = 1
+
+	info = {}
+	if mentioned:
+		for row in wtslib.sqlPrepared ('graphSummaries',
+				[ mentioned.keys () ]):
+			info [row ['_tr_key']] = row
+
+	return {
+		'nodes' : len (children),
+		'arcs' : arc_count,
+		'cycles' : cycles,
+		'chains' : chains,
+		'fanIn' : hot_spots,
+		'orphans' : orphans,
+		'info' : info,
+		'seconds' : time.time () - start_time,
+		}
+
+def componentString (
+	members		# list of TR numbers in one strongly connected
+			# component, as in the chains from graphReport()
+	):
+	# Purpose: get a short string for a component of a blocking chain
+	# Returns: string; the TR number, or for a cycle the TR numbers in
+	#	braces, like {4 5}
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	if len (members) == 1:
+		return str (members[0])
+	return '{%s}' % string.join (map (str, members), ' ')
+
+def graphReportLines (
+	report		# dictionary, as returned by graphReport()
+	):
+	# Purpose: format the given graph "report" as plain text
+	# Returns: a list of strings, one per line
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	status = Controlled_Vocab.cv ['CV_WTS_Status'].keyToName
+	info = report ['info']
+
+	def describe (tr_num, info = info, status = status):
+		if info.has_key (tr_num):
+			row = info [tr_num]
+			return '%s (%s) %s' % (tr_num,
+				status (row ['_status_key']), row ['tr_title'])
+		return '%s (not in WTS_TrackRec)' % tr_num
+
+	lines = [ 'Dependency graph: %d TRs, %d direct dependencies ' \
+			'(analyzed in %0.2f seconds)' % (report ['nodes'],
+			report ['arcs'], report ['seconds']),
+		'' ]
+
+	lines.append ('Cycles: %d' % len (report ['cycles']))
+	for cycle in report ['cycles']:
+		lines.append ('  ' + componentString (cycle))
+		for tr_num in cycle:
+			lines.append ('    ' + describe (tr_num))
+	lines.append ('')
+
+	lines.append ('Longest blocking chains:')
+	for chain in report ['chains']:
+		length = 0
+		for members in chain:
+			length = length + len (members)
+		lines.append ('  %d TRs: %s' % (length, string.join (
+			map (componentString, chain), ' -> ')))
+		lines.append ('    starts at ' + describe (chain[0][0]))
+	lines.append ('')
+
+	lines.append ('Most depended-on TRs:')
+	for (count, tr_num) in report ['fanIn']:
+		lines.append ('  %5d  %s' % (count, describe (tr_num)))
+	lines.append ('')
+
+	lines.append ('Orphaned closure rows: %d' % len (report ['orphans']))
+	for (start, stop) in report ['orphans']:
+		lines.append ('  %s -> %s' % (start, stop))
+	return lines
+
+
 #-Code for handling building a table for query results----------------------
 
-def getSqlForTempStatusTable (
+STATUS_DATES = 'status_dates'	# name of the WITH item from getStatusDateCTEs()
+
+# WTS_Status_Interval has one row for each Status a TR has had:  the Status,
+# when it was set (valid_from), and when the next one was set (valid_to, or
+# null for the current Status).  It is built from WTS_Status_History and
+# WTS_TrackRec by "wts --buildStatusIntervals", and save() refreshes the rows
+# for each TR whose Status or Status Date it changes, so we can find the
+# Status of each TR in a range of dates with one indexed lookup.
+
+STATUS_INTERVAL_DDL = [
+	'''create table if not exists WTS_Status_Interval (
+		_TR_key int not null,
+		_Status_key int not null,
+		valid_from timestamp not null,
+		valid_to timestamp null)''',
+	'''create index if not exists wts_status_interval_tr_idx
+		on WTS_Status_Interval (_TR_key)''',
+	'''create index if not exists wts_status_interval_from_idx
+		on WTS_Status_Interval (valid_from)''',
+	]
+
+# Each TR's earlier Statuses (from its history, in order by date) are
+# followed by its current one, which always ends up with a null valid_to.
+# Both %s are filled in with the same "where" clause (or '' for all TRs).
+
+STATUS_INTERVAL_FILL = '''insert into WTS_Status_Interval (_TR_key,
+		_Status_key, valid_from, valid_to)
+	select _TR_key, _Status_key, set_date,
+		lead (set_date) over (partition by _TR_key
+			order by is_current, set_date, _Status_key)
+	from (select _TR_key, _Status_key, set_date, 0 as is_current
+			from WTS_Status_History %s
+		union all
+		select _TR_key, _Status_key, status_set_date, 1
+			from WTS_TrackRec %s) events'''
+
+status_interval_table = None	# does WTS_Status_Interval exist?  (None until
+				# hasStatusIntervals() first looks)
+
+def hasStatusIntervals ():
+	# Purpose: find out whether the WTS_Status_Interval table exists
+	# Returns: boolean (TRUE if it does, FALSE if not)
+	# Assumes: wtslib's SQL routines have been properly initialized
+	# Effects: queries the database the first time this process asks;
+	#	after that, remembers the answer in status_interval_table
+	# Throws: propagates wtslib.sqlError if we have problems
+	# Notes: to_regclass() looks the table up in the schema on the search
+	#	path, just as our queries would, and gives null if it is not
+	#	there.
+
+	global status_interval_table
+
+	if status_interval_table is None:
+		status_interval_table = wtslib.sql ('''select
+			(to_regclass ('wts_status_interval') is not null)
+				as present''') [0]['present']
+	return status_interval_table
+
+def statusDateEngine ():
+	# Purpose: find out how we should look up the Status of TRs in a
+	#	range of Status Dates
+	# Returns: string; 'intervals' (the default) to use the
+	#	WTS_Status_Interval table, or 'history' to work it out from
+	#	WTS_Status_History for each query
+	# Assumes: nothing
+	# Effects: may query the database; see hasStatusIntervals()
+	# Throws: propagates wtslib.sqlError if we have problems
+	# Notes: set by the optional STATUS_DATE_ENGINE parameter in the
+	#	config file.  If WTS_Status_Interval has not been built yet
+	#	(by "wts --buildStatusIntervals"), we fall back on 'history',
+	#	so an upgraded installation keeps working until it is.  With
+	#	'history', save() does not maintain WTS_Status_Interval.
+
+	engine = string.lower (str (wtslib.fileConfig ('STATUS_DATE_ENGINE',
+		'intervals')))
+	if (engine == 'intervals') and not hasStatusIntervals ():
+		return 'history'
+	return engine
+
+def statusIntervalQueries (
+	tr_num		# integer; key of the TR whose intervals to refresh
+	):
+	# Purpose: get the SQL statements which rebuild the rows in
+	#	WTS_Status_Interval for one TR
+	# Returns: list of strings
+	# Assumes: they will run after any changes to the TR's Status and
+	#	Status History, in the same transaction
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: A TR has only a few Status changes, so rebuilding all its
+	#	rows is as cheap as patching them, and is correct even if the
+	#	user changed the Status Date of its current Status.
+
+	where = 'where (_TR_key = %d)' % tr_num
+	return [ 'delete from WTS_Status_Interval %s' % where,
+		STATUS_INTERVAL_FILL % (where, where) ]
+
+def buildStatusIntervals ():
+	# Purpose: create WTS_Status_Interval (if it does not exist already)
+	#	and fill it from the Status History of every TR
+	# Returns: integer; number of rows now in WTS_Status_Interval
+	# Assumes: we may create tables and indexes in the WTS schema
+	# Effects: replaces the contents of WTS_Status_Interval, in one
+	#	transaction; sets status_interval_table
+	# Throws: propagates wtslib.sqlError if we have problems
+
+	global status_interval_table
+
+	wtslib.sql (STATUS_INTERVAL_DDL + [
+		'delete from WTS_Status_Interval',
+		STATUS_INTERVAL_FILL % ('', '') ], TRUE)
+	status_interval_table = TRUE
+	return wtslib.sql ('''select count(*) as total
+		from WTS_Status_Interval''') [0]['total']
+
+def getStatusDateCTEs (
 	start,		# starting date, as a string, or ''
 	stop		# stopping date, as a string, or ''
 	):
-	# Purpose: produces a temp table with TR info based on a range of
-	#	Status Dates bounded by "start" and "stop".  The table includes
-	#	info for TR's which had at least one change in Status in that
-	#	time period.  The table has fields "_TR_key", "_Status_key",
-	#	and "status_set_date".  Only the latest Status change is
-	#	recorded in the table.
-	# Returns: a tuple with (name of the table generated, list of SQL
-	#	statements needed to generate the table)
+	# Purpose: produces the items for a SQL WITH clause which give TR info
+	#	based on a range of Status Dates bounded by "start" and "stop".
+	#	The last item (named by STATUS_DATES) includes info for TR's
+	#	which had at least one change in Status in that time period.
+	#	It has fields "_TR_key", "_Status_key", and "status_set_date".
+	#	Only the latest Status change is recorded in it.
+	# Returns: a list of strings, each of the form "name as (select ...)"
 	# Assumes: nothing
-	# Effects: when the list of SQL statements is run, they produce a
-	#	temporary table
+	# Effects: nothing
 	# Throws: nothing
+	# Notes: The latest Status change in the time period is the one which
+	#	started in it and was still in effect at its end.  (If there is
+	#	no end, that is the current Status.)  With the default
+	#	STATUS_DATE_ENGINE, we look that up in WTS_Status_Interval.
+	#	Otherwise, see getStatusHistoryCTEs().  Because these are just
+	#	parts of one query, nothing is created in the database.
+
+	if statusDateEngine () == 'history':
+		return getStatusHistoryCTEs (start, stop)
+
+	clauses = []
+	if start != '':
+		clauses.append ("(valid_from >= '%s')" % start)
+	if stop != '':
+		clauses.append ("(valid_from <= '%s')" % stop)
+		clauses.append ("((valid_to is null) or (valid_to > '%s'))" % \
+			stop)
+	else:
+		clauses.append ('(valid_to is null)')
 
-	# returns (string name of table, list of query strings)
+	return [ '''%s as (
+		select _TR_key, _Status_key, valid_from as status_set_date
+		from WTS_Status_Interval
+		where %s)''' % (STATUS_DATES, string.join (clauses, ' and ')) ]
+
+def getStatusHistoryCTEs (
+	start,		# starting date, as a string, or ''
+	stop		# stopping date, as a string, or ''
+	):
+	# Purpose: produces the items for a SQL WITH clause which give TR info
+	#	based on a range of Status Dates, as for getStatusDateCTEs(),
+	#	but working from WTS_Status_History and WTS_TrackRec
+	# Returns: a list of strings, each of the form "name as (select ...)"
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: A TR whose current Status was set in the time period uses
+	#	that Status.  Any other TR uses the latest change recorded in
+	#	its Status History in the time period.
 
 	misc_dates = ''
 	tr_dates = ''
@@ -5491,92 +6955,75 @@ def getSqlForTempStatusTable (
 	misc_dates = misc_dates [5:]
 	tr_dates = tr_dates [5:]
 
-	tbl_root = "TMP_%s" % os.environ ['REMOTE_USER']
-	tbl = "%s_Status" % tbl_root
-	tbl_1 = "%s_1" % tbl_root
-	tbl_2 = "%s_2" % tbl_root
-	tbl_keymap = "%s_key_map" % tbl_root
-	tbl_updates = "%s_update" % tbl_root
-	tbl_inserts = "%s_insert" % tbl_root
-
-	q1 = '''select _TR_key, max(set_date) as status_set_date
-		into temporary table %s
+	q1 = '''history_dates as (
+		select _TR_key, max(set_date) as status_set_date
 		from WTS_Status_History misc
 		where %s
-		group by _TR_key''' % (tbl_1, misc_dates)
-
-	q2 = '''select t1._TR_key, t1.status_set_date, sh._Status_key
-		into temporary table %s
-		from %s t1, WTS_Status_History sh
-		where (t1._TR_key = sh._TR_key) and
-			(t1.status_set_date = sh.set_date)''' % (tbl_2, tbl_1)
-
-	q3 = '''select tr._TR_key as tr_TR_key, res._TR_key as res_TR_key
-		into temporary table %s
-		from WTS_TrackRec tr
-		left outer join %s res on (tr._TR_key = res._TR_key)''' % (tbl_keymap, tbl_2)
-
-	q4 = '''select tr._TR_key, tr.status_set_date, tr._Status_key
-		into temporary table %s
-		from %s km, WTS_TrackRec tr
-		where (km.tr_TR_key = tr._TR_key) and (km.res_TR_key is not null)
-			and %s''' % (tbl_updates, tbl_keymap, tr_dates)
-
-	q5 = '''select tr._TR_key, tr.status_set_date, tr._Status_key
-		into temporary table %s
-		from %s km, WTS_TrackRec tr
-		where (km.tr_TR_key = tr._TR_key) and (km.res_TR_key is null)
-			and %s''' % (tbl_inserts, tbl_keymap, tr_dates)
-
-	q6 = '''update %s
-		set _Status_key = upd._Status_key,
-			status_set_date = upd.status_set_date
-		from %s upd
-		where (upd._TR_key = %s._TR_key)''' % (tbl_2, tbl_updates,
-			tbl_2)
-
-	q7 = '''insert into %s
-			select _TR_key, status_set_date, _Status_key
-			from %s''' % (tbl_2, tbl_inserts)
+		group by _TR_key)''' % misc_dates
 
 	# In the case where a TR had two status changes in the same minute, it
 	# is not possible to tell which was the latter.  So, we arbitrarily
 	# choose the one with the highest key...
 
-	q8 = '''select _TR_key, status_set_date, max (_Status_key) as _Status_key
-		into %s
-		from %s
-		group by _TR_key, status_set_date''' % (tbl, tbl_2)
+	q2 = '''history_status as (
+		select hd._TR_key, hd.status_set_date,
+			max (sh._Status_key) as _Status_key
+		from history_dates hd, WTS_Status_History sh
+		where (hd._TR_key = sh._TR_key) and
+			(hd.status_set_date = sh.set_date)
+		group by hd._TR_key, hd.status_set_date)'''
+
+	q3 = '''current_status as (
+		select tr._TR_key, tr.status_set_date, tr._Status_key
+		from WTS_TrackRec tr
+		where %s)''' % tr_dates
 
-	q9 = 'drop table %s' % tbl_keymap
-	q10 = 'drop table %s' % tbl_updates
-	q11 = 'drop table %s' % tbl_inserts
-	q12 = 'drop table %s' % tbl_1
-	q13 = 'drop table %s' % tbl_2
+	q4 = '''%s as (
+		select _TR_key, status_set_date, _Status_key
+		from current_status
+		union all
+		select hs._TR_key, hs.status_set_date, hs._Status_key
+		from history_status hs
+		where not exists (select 1
+			from current_status cs
+			where (cs._TR_key = hs._TR_key)))''' % STATUS_DATES
 
-	return (tbl, [ q1, q2, q3, q4, q5, q6, q7, q8, q9, q10, q11, q12, q13 ])
+	return [ q1, q2, q3, q4 ]
 
 
-def getStatusTable (
+def getStatusCounts (
 	row_type,	# string; either "Area" or "Type"
 	date_range	# string; a valid date range (dates only, no times)
 	):
-	# Purpose: get an HTML representation of the (Area or Type) by Status
-	#	grid, for the given "start" and "stop" dates
-	# Returns: an HTMLgen.TableLite object
+	# Purpose: count the TRs by (Area or Type) and Status, for those TRs
+	#	which had a change in Status in "date_range"
+	# Returns: a dictionary with keys:
+	#	'rowType' : row_type
+	#	'dateRange' : date_range
+	#	'statuses' : list of Status names, in order
+	#	'rows' : list of Area or Type names, in order
+	#	'counts' : dictionary; maps Area or Type name -> Status name
+	#		-> number of TRs (only non-zero counts are included)
+	#	'rowTotals' : dictionary; maps Area or Type name -> number of
+	#		TRs (only non-zero counts are included)
+	#	'statusTotals' : dictionary; maps Status name -> number of
+	#		TRs, including those with no Area or Type (only
+	#		non-zero counts are included)
+	#	'total' : total number of TRs
 	# Assumes: 1. wtslib's SQL routines have been properly initialized;
-	#	2. getSqlForTempStatusTable produces a table with these three
+	#	2. getStatusDateCTEs produces a WITH item with these three
 	#	fields:  _TR_key, _Status_key, status_set_date
-	# Effects: nothing
+	# Effects: queries the database
 	# Throws: propagates wtslib.sqlError if an error occurs while running
-	#	the SQL statements; raises TrackRec.error if we encounter bad
+	#	the SQL statement; raises TrackRec.error if we encounter bad
 	#	dates.
-
-	# get the basic set of SQL commands, then add three:
-	#	one to extract info from the temp table,
-	#	one to extract the needed info for the given controlled vocab
-	#		specified in "row_type", and
-	#	one to remove the temp table (clean up)
+	# Notes: All the counts come from one query, with a grouping set for
+	#	each kind of count.  grouping() tells us which grouping set
+	#	each row is from:  0 for (Area or Type, Status), 1 for Area or
+	#	Type alone, 2 for Status alone, and 3 for the overall total.
+	#	We join to the Areas or Types with an outer join, so the Status
+	#	totals include TRs which have none; rows for those TRs from the
+	#	first two grouping sets (with a null Area or Type) we skip.
 
 	global error_separator
 
@@ -5584,59 +7031,17 @@ def getStatusTable (
 	if err is not None:
 		raise error, wtslib.list_To_String (err, error_separator)
 
-	tbl_name, statements = getSqlForTempStatusTable (start, stop)
-	statements.append ('select * from %s' % tbl_name)
-	statements.append ('''
-			select res._TR_key, AreaOrType._%s_key
-			from %s res, WTS_%s AreaOrType
-			where (AreaOrType._TR_key = res._TR_key)''' % \
-		(row_type, tbl_name, row_type))
-	statements.append ('drop table %s' % tbl_name)
-
-	results = wtslib.sql (statements)
-
-	# extract info about each TR from the first query above, and build:
-	#	TR_info [TR #] = (Status key, date status was set)
-
-	TR_info = {}
-	for rec in results [-3]:
-		key = rec ['_tr_key']
-		TR_info [key] = (rec ['_status_key'], rec ['status_set_date'])
-
-	# extract CV info from the second query above, and build:
-	#	cv_info [cv_key][Status key] = Set of TR with that Status
-	#		and cv key (only TRs from "tbl_name")
-
-	cv_info = {}
-	for row in results [-2]:
-		cv_key = row ['_%s_key' % row_type.lower()]
-		if not cv_info.has_key (cv_key):
-			cv_info [cv_key] = {}
-		status_key = TR_info [row['_tr_key']][0]
-		if not cv_info [cv_key].has_key (status_key):
-			cv_info [cv_key][status_key] = Set.Set ()
-		cv_info [cv_key][status_key].add (row ['_tr_key'])
-
-	# build:
-	#	cv_info [cv_key]['total'] = count of all TRs with that cv key
-	#		(only those TRs from "tbl_name")
-
-	for cv_key in cv_info.keys ():
-		total = 0
-		for status_key in cv_info [cv_key].keys():
-			total = total + cv_info [cv_key][status_key].count ()
-		cv_info [cv_key]['total'] = total
-
-	# build:
-	#	all [status_key] = count of all TRs with that Status (only TRs
-	#		from "tbl_name")
-
-	all = {}
-	for tr_key in TR_info.keys ():
-		status_key = TR_info [tr_key][0]
-		if not all.has_key (status_key):
-			all [status_key] = 0
-		all [status_key] = all [status_key] + 1
+	results = wtslib.sql ('''with %s
+		select grouping (x._%s_key, sd._Status_key) as level,
+			x._%s_key as row_key, sd._Status_key,
+			count (distinct sd._TR_key) as tr_count
+		from %s sd
+		left outer join WTS_%s x on (x._TR_key = sd._TR_key)
+		group by grouping sets ((x._%s_key, sd._Status_key),
+			(x._%s_key), (sd._Status_key), ())''' % (
+		string.join (getStatusDateCTEs (start, stop), ', '),
+		row_type, row_type, STATUS_DATES, row_type, row_type,
+		row_type))
 
 	# we want to get a list of the status keys, in order corresponding to
 	# their status names, but we can ignore the standard error list and
@@ -5657,6 +7062,56 @@ def getStatusTable (
 	row_keys, ignore_err_list, ignore_err_flag = row_cv.validate (
 		wtslib.list_To_String (row_cv.ordered_names ()))
 
+	counts = {}
+	row_totals = {}
+	status_totals = {}
+	total = 0
+	for row in results:
+		level = row ['level']
+		if level == 3:
+			total = row ['tr_count']
+		elif level == 2:
+			status_totals [status_cv.keyToName (
+				row ['_status_key'])] = row ['tr_count']
+		elif row ['row_key'] is None:
+			continue		# TRs with no Area or Type
+		elif level == 1:
+			row_totals [row_cv.keyToName (row ['row_key'])] = \
+				row ['tr_count']
+		else:
+			row_name = row_cv.keyToName (row ['row_key'])
+			if not counts.has_key (row_name):
+				counts [row_name] = {}
+			counts [row_name][status_cv.keyToName (
+				row ['_status_key'])] = row ['tr_count']
+
+	return {
+		'rowType' : row_type,
+		'dateRange' : date_range,
+		'statuses' : map (status_cv.keyToName, status_keys),
+		'rows' : map (row_cv.keyToName, row_keys),
+		'counts' : counts,
+		'rowTotals' : row_totals,
+		'statusTotals' : status_totals,
+		'total' : total,
+		}
+
+def getStatusTable (
+	row_type,	# string; either "Area" or "Type"
+	date_range	# string; a valid date range (dates only, no times)
+	):
+	# Purpose: get an HTML representation of the (Area or Type) by Status
+	#	grid, for the given "start" and "stop" dates
+	# Returns: an HTMLgen.TableLite object
+	# Assumes: see getStatusCounts()
+	# Effects: queries the database
+	# Throws: propagates wtslib.sqlError if an error occurs while running
+	#	the SQL statement; raises TrackRec.error if we encounter bad
+	#	dates.
+
+	grid = getStatusCounts (row_type, date_range)
+	counts = grid ['counts']
+
 	# now, build the HTMLgen table...
 
 	tbl = HTMLgen.TableLite (border = 3, align = 'center')
@@ -5668,8 +7123,7 @@ def getStatusTable (
 
 	header_row = HTMLgen.TR ()
 	header_row.append (HTMLgen.TH (HTMLgen.BR ()))
-	for s in status_keys:
-		status = status_cv.keyToName (s)
+	for status in grid ['statuses']:
 		header_row.append (HTMLgen.TH (HTMLgen.Href (basicURL + \
 			"&Status=%s&Primary=%s" % (status, row_type),
 			status[:3])))
@@ -5680,28 +7134,24 @@ def getStatusTable (
 	# build the data rows, with the Type/Area name followed by the counts
 	# for each Status column:
 
-	for t in row_keys:
+	for row_label in grid ['rows']:
 		row = HTMLgen.TR ()
-		row_label = row_cv.keyToName (t)
 		row.append (HTMLgen.TD (HTMLgen.Bold (HTMLgen.Href (basicURL + \
 			"&%s=%s&Primary=Status" % (row_type, row_label),
 			row_label))))
-		for s in status_keys:
-			if cv_info.has_key (t):
-				if cv_info [t].has_key (s):
-					row.append (HTMLgen.TD (HTMLgen.Href (
-						basicURL + \
-						'&%s=%s&Status=%s' % (row_type,
-						row_label, status_cv.keyToName (
-						s)), cv_info[t][s].count()),
-						align="right"))
-				else:
-					row.append (HTMLgen.TD (HTMLgen.BR()))
+		for status in grid ['statuses']:
+			if counts.has_key (row_label) and \
+					counts [row_label].has_key (status):
+				row.append (HTMLgen.TD (HTMLgen.Href (
+					basicURL + '&%s=%s&Status=%s' % (
+					row_type, row_label, status),
+					counts [row_label][status]),
+					align="right"))
 			else:
 				row.append (HTMLgen.TD (HTMLgen.BR()))
-		if cv_info.has_key (t):
+		if grid ['rowTotals'].has_key (row_label):
 			row.append (HTMLgen.TD (HTMLgen.Italic (HTMLgen.Bold (
-				cv_info [t]['total'])), align="right"))
+				grid ['rowTotals'][row_label])), align="right"))
 		else:
 			row.append (HTMLgen.TD (HTMLgen.BR ()))
 		tbl.append (row)
@@ -5713,15 +7163,14 @@ def getStatusTable (
 	row.append (HTMLgen.TD (HTMLgen.Bold (HTMLgen.Italic (HTMLgen.Href (
 		basicURL + '&Primary=Status&Secondary=%s' % row_type,
 		'# Unique TRs')))))
-	total = 0
-	for s in status_keys:
-		if all.has_key (s):
+	for status in grid ['statuses']:
+		if grid ['statusTotals'].has_key (status):
 			row.append (HTMLgen.TD (HTMLgen.Italic (
-				HTMLgen.Bold (all [s])), align = "right"))
-			total = total + all [s]
+				HTMLgen.Bold (grid ['statusTotals'][status])),
+				align = "right"))
 		else:
 			row.append (HTMLgen.TD (HTMLgen.BR ()))
-	row.append (HTMLgen.TD (HTMLgen.Italic (HTMLgen.Bold (total)),
+	row.append (HTMLgen.TD (HTMLgen.Italic (HTMLgen.Bold (grid ['total'])),
 		align = "right"))
 	tbl.append (row)
 
@@ -5801,10 +7250,8 @@ def getText (
 
 	# determine the full length of the text field for the given 'TR'
 
-	results = wtslib.sql('''select text_block
-		from wts_text
-		where _TR_key = %s
-			and text_type = %s''' % (TR, noteType))
+	results = wtslib.sqlPrepared ('getText',
+		[ string.atoi (str (TR)), noteType ])
 
 	if not results:
 		return ''	# the given 'TR' does not have that 'noteType'
@@ -5915,16 +7362,112 @@ def expandWTSMarkup (
 def self_test ():
 	# Purpose: Typically WTS modules may be self-tested by executing them
 	#	from the unix command line.  The TrackRec module is so involved,
-	#	however, that we just test it from the web interface.  So, we
-	#	need to print a reminder message when someone attempts to test
-	#	it from the command line.
+	#	however, that we test most of it from the web interface.  Here,
+	#	we check the functions which do not need the database, and
+	#	print a reminder about the rest.
 	# Returns: nothing
 	# Assumes: Someone has tested the latest changes using the web
 	#	interface.
-	# Effects: see Purpose.
+	# Effects: sends to stdout a line for each check saying whether it
+	#	matched the expected results
 	# Throws: nothing
 
-	print "Tested manually via web interface."
+	check = wtslib.check_Result
+
+	def raises (
+		function,	# function to call
+		*args		# arguments for it
+		):
+		# returns the exception raised by function (*args), or None
+
+		try:
+			apply (function, args)
+		except:
+			return sys.exc_type
+		return None
+
+	# parse_TR_Intervals() and expand_TR()
+
+	check ('TR ranges are sorted and merged',
+		parse_TR_Intervals ('12-17, 3, 4-6, 8, 10, 16..20'),
+		[ (3, 6), (8, 8), (10, 10), (12, 20) ])
+	check ('adjacent and repeated TR numbers are merged',
+		parse_TR_Intervals ('7, 5, 6, 6, 9'), [ (5, 7), (9, 9) ])
+	check ('open-ended TR ranges',
+		parse_TR_Intervals ('..3, 1, 20...,25-30'),
+		[ (NO_LOW_TR, 3), (20, NO_HIGH_TR) ])
+	check ('TR range with neither end', raises (parse_TR_Intervals,
+		'3, ..'), error)
+	check ('TR range which is not a number', raises (parse_TR_Intervals,
+		'3-x'), ValueError)
+	check ('TR Nr clauses', expand_TR ('3, 4-6, 8, 10, 12-17, 16..',
+		'_TR_key'), [ '(_TR_key >= 12)',
+		'((_TR_key >= 3) and (_TR_key <= 6))',
+		"(_TR_key = any ('{8,10}'::int[]))" ])
+	check ('TR Nr clauses for all TRs', expand_TR ('..5, 3..', 'tr'),
+		[ '(tr is not null)' ])
+
+	ranges = []
+	for i in range (0, TR_RANGE_CLAUSES + 1):
+		ranges.append ('%d-%d' % (i * 10, i * 10 + 5))
+	clauses = expand_TR (string.join (ranges, ','), 'tr')
+	check ('TR Nr clauses for many closed ranges',
+		(len (clauses), string.find (clauses [0], 'unnest') >= 0),
+		(1, TRUE))
+
+	# Entry_Validator.check_Fields(), with two made-up vocabularies in
+	# place of the ones from the database
+
+	class Test_CV:
+		def __init__ (self, terms):
+			self.terms = terms
+		def __getitem__ (self, key):
+			if key in self.terms:
+				return key
+			return None
+
+	class Test_Validator (Entry_Validator):
+		def __init__ (self):
+			self.required = [ 'Title', 'Priority' ]
+			self.allowed = {}
+			for field in [ 'TR Nr', 'Title', 'Priority', 'Area',
+					'Status Date', 'Needs Attention By',
+					'Depends On', 'Progress Notes' ]:
+				self.allowed [field] = 1
+			self.cvs = [ ('Priority', Test_CV ([ 'low', 'high' ]),
+				1), ('Area', Test_CV ([ 'web', 'unknown' ]), 2) ]
+
+	(raw, errors) = Test_Validator ().check_Fields ({
+		'TR Nr' : '12',
+		'Title' : 'a test',
+		'Priority' : 'high',
+		'Area' : 'web, unknown',
+		'Status Date' : '1/2/03 04:05 PM',
+		'Needs Attention By' : 'None',
+		'Depends On' : 'TR3, (TR 10)',
+		'Progress Notes' : 'one\r\ntwo',
+		'Bogus' : 'dropped',
+		})
+	depends_on = raw ['Depends On'].values ()
+	depends_on.sort ()
+	check ('valid entry', (errors, raw ['Area'], raw ['Status Date'],
+		raw ['Needs Attention By'], depends_on, raw ['Progress Notes'],
+		raw.has_key ('Bogus')), ([], 'web', '01/02/2003 04:05 PM',
+		None, [3, 10], '<PRE>\none\ntwo\n</PRE>', FALSE))
+
+	(raw, errors) = Test_Validator ().check_Fields ({
+		'Priority' : 'low, high',
+		'Area' : 'web, mobile',
+		'Needs Attention By' : '13/45/03',
+		'Depends On' : 'TR3, TRx',
+		})
+	check ('invalid entry', map (lambda e: e[0], errors),
+		[ None, 'Priority', 'Area', 'Needs Attention By',
+		'Depends On' ])
+	check ('Depends On keeps the valid TR numbers',
+		raw ['Depends On'].values (), [3])
+
+	print "The rest is tested manually via web interface."
 
 
 if __name__ == '__main__':		# if executed from command line,
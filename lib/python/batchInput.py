@@ -14,6 +14,7 @@ import TrackRec
 import wtslib
 
 LF = '\n'
+BATCH_SIZE = 100	# most rows to load, validate, and save together
 
 def log_error (
 	line,	# string; the line which caused the problem
@@ -35,71 +36,44 @@ def log_error (
 	sys.stderr.write (LF)
 	return
 
-def batchInput (
-	filename	# string; name of the tab-delimited file to input
+def save_Batch (
+	tdf,		# TabFile object; the file being input
+	pending,	# list of (row, TrackRec object) pairs; each row is a
+			# dictionary from "tdf", and the TrackRec has had the
+			# row's changes made to it
+	validator	# TrackRec.Entry_Validator object
 	):
-	# Purpose: read filename, parse, and make needed changes to TRs
-	# Returns: integer number of errors found
-	# Assumes: 1. current user has permission to read "filename"; 
-	#	2. db's SQL routines have been initialized
-	# Effects: reads the file and updates the tracking record tables as
-	#	needed in the WTS database
-	# Throws: 1. propagates wtslib.sqlError if there are problems updating
-	#	the database; 2. propagates IOError if there are problems
-	#	reading "filename"
+	# Purpose: validate the changed TRs in "pending" and save those which
+	#	are valid
+	# Returns: nothing
+	# Assumes: no TR appears in "pending" twice
+	# Effects: updates the tracking record tables as needed in the WTS
+	#	database; writes errors to stderr
+	# Throws: nothing
 
-	tdf = TabFile.TabFile (filename)
-	for row in tdf.getList ():
-		try:
-			tr_nr = row ['TR Nr']
-			tr = TrackRec.TrackRec (string.atoi (tr_nr))
-		except ValueError, KeyError:
-			log_error (tdf.getLine (row), \
-				'Cannot parse value for TR number, ' + \
-				'or cannot load the specified TR')
-			continue
+	if not pending:
+		return
+	try:
+		results = validator.validate_Many (map (lambda p: p[1].dict (),
+			pending))
+	except wtslib.sqlError:
+		for (row, tr) in pending:
+			log_error (tdf.getLine (row), str (sys.exc_value))
+		return
 
-		rowKeys = Set.Set ()
-		for k in row.keys ():
-			rowKeys.add (k)
-		rowKeys.remove ('TR Nr')	# already handled this one
-		rowKeys.remove ('Directory')	# managed by system
-		rowKeys.remove ('Project Definition')	# excluded by spec
-		rowKeys.remove ('Progress Notes')	# excluded by spec
-
-		plusMinus = regex.compile ('[+-]')
-		for k in rowKeys.values ():
-			if row[k] == '':
-				pass
-			elif k in TrackRec.SINGLE_VALUED_CV:
-				value = regsub.gsub ('[+-]', '', row[k])
-				tr.set_Values ({k : value})
-			elif k in TrackRec.MULTI_VALUED:
-				old_value = tr.dict ()[k]
-				if plusMinus.search (row[k]) == -1:
-					tr.set_Values ({k : row[k]})
-				else:
-					changes = regsub.split (row[k], ' *, *')
-					for c in changes:
-						if c[0] == '+':
-							tr.addToCV (k, c[1:])
-						elif c[0] == '-':
-							tr.removeFromCV (k,
-								c[1:])
-						else:
-							log_error (tdf.getLine (
-								row),
-								'Missing +/- '
-								' in %s' % k)
-			else:
-				tr.set_Values ({k : row[k]})
+	for i in range (0, len (pending)):
+		(row, tr) = pending [i]
+		(vals, errors) = results [i]
+		if errors:
+			log_error (tdf.getLine (row),
+				TrackRec.errorMessages (errors))
+			continue
 		try:
-			vals = TrackRec.validate_TrackRec_Entry (tr.dict ())
 			tr.set_Values (vals)
 			tr.lock ()
 			tr.save ()
-		except TrackRec.alreadyLocked, wtslib.sqlError:
-			log_error (tdf.getLine (row), sys.exc_value)
+		except (TrackRec.alreadyLocked, wtslib.sqlError):
+			log_error (tdf.getLine (row), str (sys.exc_value))
 		except IndexError:
 			log_error (tdf.getLine (row),
 				"Could not find TR in database")
@@ -111,3 +85,134 @@ def batchInput (
 			tr.unlock ()
 		except TrackRec.notLocked:
 			pass
+	return
+
+def apply_Row (
+	tdf,	# TabFile object; the file being input
+	row,	# dictionary; one row from "tdf"
+	tr	# TrackRec object; the TR named in "row"
+	):
+	# Purpose: make the changes described in "row" to "tr"
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: updates the values of "tr" in memory; writes errors to
+	#	stderr
+	# Throws: propagates any exception raised by tr.set_Values(),
+	#	tr.addToCV(), or tr.removeFromCV()
+
+	rowKeys = Set.Set ()
+	for k in row.keys ():
+		rowKeys.add (k)
+	rowKeys.remove ('TR Nr')	# already handled this one
+	rowKeys.remove ('Directory')	# managed by system
+	rowKeys.remove ('Project Definition')	# excluded by spec
+	rowKeys.remove ('Progress Notes')	# excluded by spec
+
+	plusMinus = regex.compile ('[+-]')
+	for k in rowKeys.values ():
+		if row[k] == '':
+			pass
+		elif k in TrackRec.SINGLE_VALUED_CV:
+			value = regsub.gsub ('[+-]', '', row[k])
+			tr.set_Values ({k : value})
+		elif k in TrackRec.MULTI_VALUED:
+			old_value = tr.dict ()[k]
+			if plusMinus.search (row[k]) == -1:
+				tr.set_Values ({k : row[k]})
+			else:
+				changes = regsub.split (row[k], ' *, *')
+				for c in changes:
+					if c[0] == '+':
+						tr.addToCV (k, c[1:])
+					elif c[0] == '-':
+						tr.removeFromCV (k, c[1:])
+					else:
+						log_error (tdf.getLine (row),
+							'Missing +/- '
+							' in %s' % k)
+		else:
+			tr.set_Values ({k : row[k]})
+	return
+
+def input_Chunk (
+	tdf,		# TabFile object; the file being input
+	rows,		# list of dictionaries; consecutive rows from "tdf"
+	validator	# TrackRec.Entry_Validator object
+	):
+	# Purpose: load the TRs named in "rows", make each row's changes, and
+	#	validate and save the changed TRs
+	# Returns: nothing
+	# Assumes: db's SQL routines have been initialized
+	# Effects: updates the tracking record tables as needed in the WTS
+	#	database; writes errors to stderr
+	# Throws: propagates wtslib.sqlError if there are problems loading
+	#	the TRs
+	# Notes: The TRs are loaded here, just before they are saved, rather
+	#	than once for the whole file.  Otherwise, a change made through
+	#	the web interface while a long file was being input would be
+	#	overwritten by our stale copy of the TR.
+
+	# load all the TRs named in the chunk with one query, rather than
+	# one TR at a time
+
+	tr_nums = []
+	for row in rows:
+		try:
+			tr_nums.append (string.atoi (row ['TR Nr']))
+		except (ValueError, KeyError):
+			pass		# reported below
+
+	loaded = {}		# TR number -> TrackRec object
+	for tr in TrackRec.load_many (tr_nums):
+		loaded [string.atoi (tr.num ())] = tr
+
+	pending = []		# (row, TrackRec object) pairs not yet saved
+	used = Set.Set ()	# TR numbers whose loaded object we have used
+	for row in rows:
+		try:
+			tr_nr = string.atoi (row ['TR Nr'])
+			if used.contains (tr_nr):
+				# TR appears again in the chunk; save the
+				# changes so far, then get a fresh copy, in
+				# case the prior changes failed
+
+				save_Batch (tdf, pending, validator)
+				pending = []
+				tr = TrackRec.TrackRec (tr_nr)
+			else:
+				tr = loaded [tr_nr]
+				used.add (tr_nr)
+		except (ValueError, KeyError):
+			log_error (tdf.getLine (row), \
+				'Cannot parse value for TR number, ' + \
+				'or cannot load the specified TR')
+			continue
+
+		apply_Row (tdf, row, tr)
+		pending.append ((row, tr))
+	save_Batch (tdf, pending, validator)
+	return
+
+def batchInput (
+	filename	# string; name of the tab-delimited file to input
+	):
+	# Purpose: read filename, parse, and make needed changes to TRs
+	# Returns: integer number of errors found
+	# Assumes: 1. current user has permission to read "filename"; 
+	#	2. db's SQL routines have been initialized
+	# Effects: reads the file and updates the tracking record tables as
+	#	needed in the WTS database
+	# Throws: 1. propagates wtslib.sqlError if there are problems updating
+	#	the database; 2. propagates IOError if there are problems
+	#	reading "filename"
+
+	tdf = TabFile.TabFile (filename)
+	rows = tdf.getList ()
+
+	# the rows are input in chunks of up to BATCH_SIZE; the TRs for each
+	# chunk are loaded, validated together, and then saved
+
+	validator = TrackRec.Entry_Validator ()
+	for i in range (0, len (rows), BATCH_SIZE):
+		input_Chunk (tdf, rows [i:i + BATCH_SIZE], validator)
+	return
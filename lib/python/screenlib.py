@@ -62,6 +62,8 @@
 #		setup (clean dictionary)
 #	Status_Grid_Screen
 #		setup (row_type, date_range, table object)
+#	Graph_Report_Screen
+#		setup (graph report dictionary)
 #
 # Wrapper Functions:
 #	gen_Exception_Screen (filename)
@@ -1106,12 +1108,16 @@ class TrackRec_Detail_Screen (WTS_Document):
 					# tracking record display screen, 0 if
 					# there is not.  (This tells us whether
 					# to display a Previous button or not)
-		expanded = 0		# boolean; if non-zero, then we should
+		expanded = 0,		# boolean; if non-zero, then we should
 					# display an expanded TR detail page
 					# (with enhanced dependency info)
+		show_all = 0		# boolean; if non-zero, then we should
+					# show all the tracking records in
+					# tr_numbers on this one page
 		):
 		# Purpose: set up this TrackRec_Detail_Screen to contain the
-		#	details of the first tracking record in tr_numbers
+		#	details of the first tracking record in tr_numbers (or
+		#	of all of them, if show_all is non-zero)
 		# Returns: nothing
 		# Assumes: nothing
 		# Effects: Retrieves (using the TrackRec module) the HTMLgen
@@ -1126,6 +1132,11 @@ class TrackRec_Detail_Screen (WTS_Document):
 		global WTS_HOME_PAGE
 		self.title = PREFIX + ': Tracking Record Detail Screen'
 
+		if show_all:
+			self.setup_All (tr_numbers, previous_tr_screen,
+				expanded)
+			return
+
 		# take the first number from tr_numbers for display
 
 		temp_tr_numbers = string.split ( \
@@ -1196,11 +1207,15 @@ class TrackRec_Detail_Screen (WTS_Document):
 				'window.location.replace ("%s&Expanded=1")' % \
 				basic_url))
 
-		# now, if there are more TR listed, we need a Next button...
+		# now, if there are more TR listed, we need a Next button, and
+		# a button to show them all expanded on one page...
 
 		if temp_tr_numbers:
 			submit_button = HTMLgen.Input (type = 'submit', name = \
 				'Next', value = 'Next')
+			button_list.append (Button ('Expand All',
+				'window.location.replace ("%s&Expanded=1' \
+				'&All=1")' % basic_url))
 		else:
 			submit_button = None
 
@@ -1266,6 +1281,97 @@ class TrackRec_Detail_Screen (WTS_Document):
 
 		self.append (frm)
 
+	def setup_All (self,
+		tr_numbers,		# string; contains a comma-separated
+					# series of tracking record keys to
+					# be displayed
+		previous_tr_screen = 0,	# boolean; 1 if there is a previous
+					# tracking record display screen
+		expanded = 0		# boolean; if non-zero, then we should
+					# display expanded TR details
+		):
+		# Purpose: set up this TrackRec_Detail_Screen to contain the
+		#	details of all the tracking records in tr_numbers
+		# Returns: nothing
+		# Assumes: nothing
+		# Effects: Retrieves all the tracking records at once (using
+		#	TrackRec.load_many) and builds their HTMLgen objects into
+		#	the detail display page, one after another.
+		# Throws: progagates - 1. ValueError if none of the specified
+		#	tracking records can be found in the database.
+		#	2. wtslib.sqlError if we have problems in querying the
+		#	database.
+
+		global WTS_HOME_PAGE
+
+		tr_nums = []
+		for item in string.split (string.translate (tr_numbers,
+				string.maketrans ('',''), 'TR '), ','):
+			tr_num = string.atoi (item)
+			if tr_num != 0:		# 0 is a flag from the query
+				tr_nums.append (tr_num)	# results screen
+
+		trs = TrackRec.load_many (tr_nums)
+		if not trs:
+			raise ValueError, 'No tracking records found'
+
+		tr_numbers = string.join (map (str, tr_nums), ',')
+		basic_url = 'tr.detail.cgi?TR_Nr=%s&Prev_TR_Screen=%s' % \
+			(tr_numbers, previous_tr_screen)
+
+		if previous_tr_screen <> 0:
+			button_list = [ Button ('Previous', \
+				'window.history.go (-1)')]
+		else:
+			button_list = []
+
+		if expanded:
+			button_list.append (Button ('Contract All',
+				'window.location.replace ("%s&All=1")' % \
+				basic_url))
+		else:
+			button_list.append (Button ('Expand All',
+				'window.location.replace ("%s&Expanded=1' \
+				'&All=1")' % basic_url))
+		button_list.append (Button ('One at a Time',
+			'window.location.replace ("%s")' % basic_url))
+		button_list.append (Button (PREFIX + ' Home', \
+			'window.location.href="' + WTS_HOME_PAGE + '"'))
+
+		self.script = [
+			HTMLgen.Script (src = "Notes.js"),
+			HTMLgen.Script (src = "wts.js"),
+			]
+
+		frm = WTS_Form ('tr.detail.cgi',
+			method = 'GET',
+			name = 'TrDetailForm',
+			submit = None,
+			buttons = button_list)
+
+		# add each tracking record's info, with an Edit link for each
+
+		for tr in trs:
+			frm.append (HTMLgen.BR ())
+			frm.append (HTMLgen.Href ('tr.edit.cgi?TrackRec=%s' % \
+				tr.num (), 'Edit TR %s' % tr.num ()))
+			for obj in tr.html_Display (expanded):
+				frm.append (obj)
+			frm.append (HTMLgen.HR ())
+
+		self.meta.append (HTMLgen.Meta (equiv="pragma",
+			content="no-cache"))
+		self.meta.append (HTMLgen.Meta (equiv="Expires",
+			content="Tue, 26-Oct-1965 12:00:00"))
+		self.meta.append (HTMLgen.Meta (equiv="Expires", content="NOW"))
+		self.meta.append (HTMLgen.Meta (equiv="last modified",
+			content="NOW"))
+
+		self.append (HTMLgen.Center (HTMLgen.Small ('Displayed: %s' % \
+			wtslib.current_Time ())), HTMLgen.P () )
+		self.append (frm)
+		return
+
 ### End of Class: TrackRec_Detail_Screen ###
 
 
@@ -1345,7 +1451,8 @@ class Query_Result_Screen (WTS_Document):
 	# Effects:	see above
 	# Modifies:	self
 	'''
-	def setup (self, clean_results, hidden_fields, status_date = None):
+	def setup (self, clean_results, hidden_fields, status_date = None,
+		paging = None):
 		'''
 		#
 		# Requires:	clean_results - a list of dictionaries, each of
@@ -1359,6 +1466,16 @@ class Query_Result_Screen (WTS_Document):
 		#			to carry over information about how to
 		#			sort the query results, and which
 		#			tracking records to display.
+		#		status_date - string; range of Status Dates
+		#			searched, or None
+		#		paging - None if clean_results has all the
+		#			records, or a dictionary which describes
+		#			the page they are on, with keys: 'first'
+		#			(number of the first record on the page,
+		#			from 1), 'total' (number of records on
+		#			all pages), 'previous' and 'next' (URLs
+		#			of the pages before and after this one,
+		#			or None)
 		# Effects:	builds and runs the queries for the given
 		#		clean_dict.  Then uses the results to generate
 		#		screen-specific info to present the tracking
@@ -1400,7 +1517,17 @@ class Query_Result_Screen (WTS_Document):
 
 		frm.append (HTMLgen.BR ())
 		recCount = len (clean_results)
-		if recCount == 0:
+		if (paging is not None) and (recCount < paging ['total']):
+			if recCount == 0:
+				recCountMsg = "no records on this page " + \
+					"(%d records returned)" % \
+					paging ['total']
+			else:
+				recCountMsg = "records %d-%d of %d returned" % (
+					paging ['first'],
+					paging ['first'] + recCount - 1,
+					paging ['total'])
+		elif recCount == 0:
 			recCountMsg = "no records returned"
 		elif recCount == 1:
 			recCountMsg = "1 record returned"
@@ -1408,6 +1535,20 @@ class Query_Result_Screen (WTS_Document):
 			recCountMsg = "%d records returned" % recCount
 		frm.append (HTMLgen.Center (recCountMsg))
 
+		# links to the previous and next pages, if there are any
+
+		pageLinks = []
+		if paging is not None:
+			if paging ['previous'] is not None:
+				pageLinks.append (HTMLgen.Href (
+					paging ['previous'], '&lt;&lt; Previous'))
+			if paging ['next'] is not None:
+				pageLinks.append (HTMLgen.Href (
+					paging ['next'], 'Next &gt;&gt;'))
+		if pageLinks:
+			frm.append (HTMLgen.Center (string.join (map (str,
+				pageLinks), ' &nbsp; ')))
+
 		# leading space, then message about Status Date, if non-None
 
 		if status_date is not None:
@@ -1424,9 +1565,12 @@ class Query_Result_Screen (WTS_Document):
 		for item in obj_list:
 			frm.append (item)
 
-		# trailing space after the table
+		# trailing space after the table, and the page links again
 	
 		frm.append (HTMLgen.BR ())
+		if pageLinks:
+			frm.append (HTMLgen.Center (string.join (map (str,
+				pageLinks), ' &nbsp; ')), HTMLgen.BR ())
 
 		# add the necessary hidden fields to the form:  (These will
 		# be used if we do a Re-Display, to remember the desired
@@ -1498,6 +1642,121 @@ class Status_Grid_Screen (WTS_Document):
 
 ### End of Class: Status_Grid_Screen ###
 
+class Graph_Report_Screen (WTS_Document):
+	# Concept:
+	#	IS: an HTML-formatted page which reports on the whole "Depends
+	#		On" graph: its cycles, longest blocking chains, most
+	#		depended-on TRs, and orphaned closure rows
+	#	HAS: standard attributes inherited from WTS_Document
+	#	DOES: sends the page (self) to stdout
+
+	def setup (self,
+		report		# dictionary, as returned by
+				# TrackRec.graphReport()
+		):
+		# Purpose: set up the innards of this page
+		# Returns: nothing
+		# Assumes: nothing
+		# Effects: adds to self -- only run this once!
+		# Throws: nothing
+
+		self.title = PREFIX + ': Dependency Graph Report'
+		status = Controlled_Vocab.cv ['CV_WTS_Status'].keyToName
+		info = report ['info']
+		cgi = 'tr.detail.cgi?TR_Nr=%s'
+
+		def link (tr_num, cgi = cgi):
+			return HTMLgen.Href (cgi % tr_num, str (tr_num))
+
+		def header (title, labels):
+			tbl = HTMLgen.TableLite (border = 3, align = 'center')
+			tbl.append (HTMLgen.TR (HTMLgen.TH (title,
+				colspan = len (labels))))
+			row = HTMLgen.TR ()
+			for label in labels:
+				row.append (HTMLgen.TH (label))
+			tbl.append (row)
+			return tbl
+
+		def describe (tr_num, info = info, status = status,
+				link = link):
+			if info.has_key (tr_num):
+				row = info [tr_num]
+				return [ HTMLgen.TD (link (tr_num)),
+					HTMLgen.TD (row ['tr_title']),
+					HTMLgen.TD (status (row ['_status_key'])) ]
+			return [ HTMLgen.TD (str (tr_num)),
+				HTMLgen.TD ('(not in WTS_TrackRec)'),
+				HTMLgen.TD (HTMLgen.BR ()) ]
+
+		btns = []
+		btns.append (Button (PREFIX + ' Home', \
+			'window.history.go (-1)'))
+		frm = WTS_Form (buttons = btns)
+		frm.append (HTMLgen.Center ('%d TRs, %d direct dependencies ' \
+			'(analyzed in %0.2f seconds)' % (report ['nodes'],
+			report ['arcs'], report ['seconds']), HTMLgen.P ()))
+
+		# cycles
+
+		tbl = header ('Cycles: %d' % len (report ['cycles']),
+			[ 'Cycle', 'TR #', 'Title', 'Status' ])
+		for cycle in report ['cycles']:
+			for tr_num in cycle:
+				row = HTMLgen.TR (HTMLgen.TD (
+					TrackRec.componentString (cycle)))
+				for cell in describe (tr_num):
+					row.append (cell)
+				tbl.append (row)
+		frm.append (tbl, HTMLgen.P ())
+
+		# longest blocking chains
+
+		tbl = header ('Longest Blocking Chains',
+			[ 'Length', 'Chain', 'Starts At', 'Title', 'Status' ])
+		for chain in report ['chains']:
+			length = 0
+			pieces = []
+			for members in chain:
+				length = length + len (members)
+				if len (members) == 1:
+					pieces.append (str (link (members[0])))
+				else:
+					pieces.append ('{%s}' % string.join (
+						map (str, map (link, members)), ' '))
+			row = HTMLgen.TR (HTMLgen.TD (str (length)),
+				HTMLgen.TD (HTMLgen.RawText (string.join (pieces,
+					' -&gt; '))))
+			for cell in describe (chain[0][0]):
+				row.append (cell)
+			tbl.append (row)
+		frm.append (tbl, HTMLgen.P ())
+
+		# fan-in hot spots
+
+		tbl = header ('Most Depended-On TRs',
+			[ 'Dependents', 'TR #', 'Title', 'Status' ])
+		for (count, tr_num) in report ['fanIn']:
+			row = HTMLgen.TR (HTMLgen.TD (str (count)))
+			for cell in describe (tr_num):
+				row.append (cell)
+			tbl.append (row)
+		frm.append (tbl, HTMLgen.P ())
+
+		# orphaned closure rows
+
+		tbl = header ('Orphaned Closure Rows: %d' % \
+			len (report ['orphans']), [ 'TR #', 'Related TR #' ])
+		for (start, stop) in report ['orphans']:
+			tbl.append (HTMLgen.TR (HTMLgen.TD (link (start)),
+				HTMLgen.TD (link (stop))))
+		frm.append (tbl, HTMLgen.P ())
+
+		self.append (frm)
+		return
+
+### End of Class: Graph_Report_Screen ###
+
 class Help_Screen (WTS_Document):
 	# Concept:
 	#	IS: an HTML-formatted page which shows a page of help
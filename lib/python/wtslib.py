@@ -16,8 +16,10 @@
 # DateTime-Related Functions:
 #	parse_DateRange (daterange string)
 #	parse_DateTime (datetime string)
+#	format_DateTime (datetime value from the database)
 #	parse_Date (date string)		* internal use only
 #	parse_Time (time string)		* internal use only
+#	benchmark_Dates (optional count, optional distinct count)
 # Other Functions:
 #	FieldStorage_to_Dict (FieldStorage object)
 #	underscored (string to have spaces coverted to underscores)
@@ -25,17 +27,29 @@
 #	list_To_String (list of items, string separator)
 #	string_To_List (string of comma-space separated items, string separator)
 #	duplicated_Quotes (string to have internal ' changed to '')
-#	sql (queries)
+#	sql (queries, optional batch flag, optional bind parameters)
+#	definePrepared (name, parameter types, query)
+#	sqlPrepared (name, parameters)
+#	sqlCursor (query, handler, optional batch size)
+#	beginTransaction ()
+#	commitTransaction ()
+#	rollbackTransaction ()
+#	getSession ()
+#	releaseSession (session)
+#	getPoolStats ()
+#	renameColumns (list of rows, mapping of old to new column names)
 #	record_SQL_Errors (queries, 		* internal use only
 #		exc_type, exc_value, exc_traceback)
 #	send_Mail (send_from, send_to, subject,	message)
 #       dbValueString (value to format for inclusion in a sql query)
+#	jsonString (value to format as JSON)
 #	parseCommandLine (argv, options)
 #	escapeAmps (string)
 #	isHTML (string)
 #	isPRE (string)
 #	wrapLines (string, max line length)
 #	splitList (list, maximum integer items per sublist)
+#	check_Result (description, actual value, expected value)
 '''
 
 import os
@@ -48,7 +62,14 @@ import time
 import traceback
 import sys
 import types
+import copy
 import smtplib
+import socket
+import struct
+import atexit
+import marshal
+import datetime
+import decimal
 import dbManager
 
 TRUE = 1
@@ -72,10 +93,418 @@ SENDMAIL = '/usr/lib/sendmail'		# path to the standard sendmail program
 
 config = ConfigurationWrapper.ConfigurationWrapper()
 
-db = dbManager.postgresManager(config['DB_SERVER'], config['DB_DATABASE'],
-	config['DB_USER'], config['DB_PASSWORD'])
-db.execute("set schema '%s'" % config['DB_SCHEMA'])
-db.setReturnAsSybase(True)
+#---DATABASE SESSIONS---------------------------------------------------
+
+# We no longer open a database connection (and set the schema) as a side
+# effect of importing wtslib.  Instead, sql() borrows a warm session (one with
+# the WTS schema already set) when it needs one and hands it back afterward.
+# Sessions come from one of two places:
+#	1. the local pooler process (admin/wtsPooler.py), if DB_POOL_SOCKET is
+#	   defined in the config file and the pooler is listening there.  The
+#	   pooler keeps its own connections open between CGI hits, so cheap
+#	   pages like help.cgi and dir.cgi skip the connection handshake.
+#	2. a direct connection to the database server, otherwise.
+# Idle sessions are kept in 'idleSessions' for reuse by later queries in the
+# same process.  'poolStats' counts hits (we got an already-warm session) and
+# misses (we had to open a new connection to the server).
+
+POOL_SIZE = 2			# maximum number of idle sessions to keep
+POOL_TIMEOUT = 5.0		# seconds to wait when contacting the pooler
+
+idleSessions = []		# list of warm sessions available for reuse
+transaction = None		# session pinned by beginTransaction(), if any
+CURSOR_BATCH = 500		# rows per fetch in sqlCursor()
+BATCHABLE = [ 'insert', 'update', 'delete', 'create', 'drop' ]
+				# first words of statements which
+				# groupStatements() may send together
+PREPARED = {}			# maps statement name -> (list of parameter
+				# types, query text); see definePrepared()
+poolStats = {			# maps counter name -> integer count
+	'hits' : 0,
+	'misses' : 0,
+	}
+
+def fileConfig (
+	name,		# string; name of the configuration parameter
+	default = None	# value to return if 'name' is not in the config file
+	):
+	# Purpose: look up an optional bootstrap parameter from the config file
+	# Returns: the value of 'name' from wts.cfg, or 'default' if it is
+	#	not defined there
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: config[name] would go to the WTS_Config table for a missing
+	#	parameter, which we cannot do before we have a session.
+
+	if config.config.has_key (name):
+		return config.config[name]
+	return default
+
+WIRE_TAG = '__wts_wire__'	# key marking a value which marshal cannot carry,
+				# as encoded by toWire()
+
+def toWire (
+	item		# Python object to be sent by sendMessage()
+	):
+	# Purpose: convert 'item' to something the marshal module can write
+	# Returns: 'item', with each date, time, datetime, or Decimal inside it
+	#	replaced by a dictionary { WIRE_TAG : (kind, fields) }
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+	# Notes: We do not pickle messages, as unpickling can run code chosen by
+	#	whoever wrote the message.  marshal only knows the basic types,
+	#	though, and query results may hold dates and Decimals.
+
+	t = type (item)
+	if t == types.TupleType:
+		return tuple (map (toWire, item))
+	elif t == types.ListType:
+		return map (toWire, item)
+	elif t == types.DictType:
+		d = {}
+		for (key, value) in item.items ():
+			d[key] = toWire (value)
+		return d
+	elif isinstance (item, datetime.datetime):
+		return { WIRE_TAG : ('datetime', (item.year, item.month,
+			item.day, item.hour, item.minute, item.second,
+			item.microsecond)) }
+	elif isinstance (item, datetime.date):
+		return { WIRE_TAG : ('date', (item.year, item.month,
+			item.day)) }
+	elif isinstance (item, datetime.time):
+		return { WIRE_TAG : ('time', (item.hour, item.minute,
+			item.second, item.microsecond)) }
+	elif isinstance (item, decimal.Decimal):
+		return { WIRE_TAG : ('decimal', str (item)) }
+	return item
+
+def fromWire (
+	item		# Python object as received by receiveMessage()
+	):
+	# Purpose: undo the conversion done by toWire()
+	# Returns: 'item', with each encoded value rebuilt
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: 'error' if 'item' has an encoded value of an unknown kind
+
+	t = type (item)
+	if t == types.TupleType:
+		return tuple (map (fromWire, item))
+	elif t == types.ListType:
+		return map (fromWire, item)
+	elif t != types.DictType:
+		return item
+	elif not item.has_key (WIRE_TAG):
+		d = {}
+		for (key, value) in item.items ():
+			d[key] = fromWire (value)
+		return d
+
+	kind, fields = item[WIRE_TAG]
+	if kind == 'datetime':
+		return apply (datetime.datetime, fields)
+	elif kind == 'date':
+		return apply (datetime.date, fields)
+	elif kind == 'time':
+		return apply (datetime.time, fields)
+	elif kind == 'decimal':
+		return decimal.Decimal (fields)
+	raise error, 'Unknown value in message: %s' % kind
+
+def sendMessage (
+	sock,		# connected socket.socket object
+	item		# Python object to send (see toWire())
+	):
+	# Purpose: send 'item' across 'sock' as one length-prefixed message
+	# Returns: nothing
+	# Assumes: the other end reads it with receiveMessage()
+	# Effects: writes to 'sock'
+	# Throws: propagates socket.error if the write fails
+
+	s = marshal.dumps (toWire (item))
+	sock.sendall (struct.pack ('!I', len(s)) + s)
+	return
+
+def receiveMessage (
+	sock		# connected socket.socket object
+	):
+	# Purpose: read one message sent by sendMessage() from 'sock'
+	# Returns: the Python object which was sent, or None if the other end
+	#	closed the connection
+	# Assumes: nothing
+	# Effects: reads from 'sock'
+	# Throws: propagates socket.error if the read fails; ValueError or
+	#	EOFError if the message is not a valid one
+
+	header = readBytes (sock, 4)
+	if header is None:
+		return None
+	s = readBytes (sock, struct.unpack ('!I', header)[0])
+	if s is None:
+		return None
+	return fromWire (marshal.loads (s))
+
+def readBytes (
+	sock,		# connected socket.socket object
+	count		# integer number of bytes to read
+	):
+	# Purpose: read exactly 'count' bytes from 'sock'
+	# Returns: string of 'count' bytes, or None if the connection closed
+	#	before we got them all
+	# Assumes: nothing
+	# Effects: reads from 'sock'
+	# Throws: propagates socket.error if the read fails
+
+	chunks = []
+	while count > 0:
+		s = sock.recv (min (count, 65536))
+		if not s:
+			return None
+		chunks.append (s)
+		count = count - len(s)
+	return string.join (chunks, '')
+
+class DirectSession:
+	# Concept:
+	#	IS: a warm session on our own connection to the database server
+	#	HAS: a dbManager.postgresManager with the WTS schema already set
+	#	DOES: executes queries, commits, rolls back, closes
+	# Implementation:
+	#	Also used by the pooler process for the sessions it hands out.
+
+	def __init__ (self):
+		self.db = dbManager.postgresManager (config['DB_SERVER'],
+			config['DB_DATABASE'], config['DB_USER'],
+			config['DB_PASSWORD'])
+		self.db.execute ("set schema '%s'" % config['DB_SCHEMA'])
+		self.db.setReturnAsSybase (False)	# see toRows()
+		self.warm = FALSE	# this session had to be opened
+		self.prepared = {}	# maps name of each statement
+					# prepared on this connection so far
+					# -> its (parameter types, query)
+		return
+
+	def execute (self, query, params = None):
+		if params is None:
+			return self.db.execute (query)
+		return self.db.execute (query, tuple(params))
+
+	def executePrepared (self, name, params, definition = None):
+		# run the prepared statement 'name', preparing it on this
+		# connection first if needed.  'definition' is a tuple
+		# (list of parameter types, query text) as sent by a client of
+		# the pooler; otherwise we use the one in PREPARED.
+
+		if definition is None:
+			definition = PREPARED[name]
+		paramTypes, query = definition
+		definition = (list (paramTypes), query)
+
+		# another pooler client may have prepared a different
+		# statement under the same name on this connection
+
+		if self.prepared.get (name) != definition:
+			if self.prepared.has_key (name):
+				self.db.execute ('deallocate %s' % name)
+				del self.prepared[name]
+			self.db.execute ('prepare %s (%s) as %s' % (name,
+				string.join (paramTypes, ', '), query))
+			self.prepared[name] = definition
+		return self.db.execute ('execute %s (%s)' % (name,
+			string.join (['%s'] * len(params), ', ')),
+			tuple(params))
+
+	def batch (self, queries):
+		# run 'queries' without committing; see runBatch()
+
+		results = []
+		for (returnsRows, group) in groupStatements (queries):
+			if type(group[0]) == types.TupleType:
+				(query, params) = group[0]
+				results.append (self.execute (query, params))
+			elif returnsRows:
+				results.append (self.db.execute (group[0]))
+			else:
+				self.db.execute (string.join (group, ';\n'))
+				results = results + [ [] ] * len(group)
+		return results
+
+	def commit (self):
+		self.db.commit ()
+		return
+
+	def rollback (self):
+		self.db.rollback ()
+		return
+
+	def close (self):
+		self.db.closeConnection ()
+		return
+
+class PoolerSession:
+	# Concept:
+	#	IS: a warm session borrowed from the local pooler process
+	#	HAS: a Unix socket connected to the pooler, which has dedicated
+	#		one of its server connections to us until we disconnect
+	#	DOES: executes queries, commits, rolls back, closes
+	# Implementation:
+	#	Each request is a tuple (operation name, argument); each reply
+	#	is a tuple (status, value), where status is 'ok' or 'error'.
+
+	def __init__ (self,
+		path		# string; path to the pooler's Unix socket
+		):
+		self.sock = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.settimeout (POOL_TIMEOUT)
+		self.sock.connect (path)
+		self.sock.settimeout (None)	# queries may run a while
+
+		# the pooler tells us whether it had a warm session waiting
+
+		self.warm = self.request ('hello')
+		return
+
+	def request (self,
+		operation,	# string; name of the operation to perform
+		arg = None	# argument for 'operation', if any
+		):
+		# Purpose: send one request to the pooler and wait for its reply
+		# Returns: the value returned by the pooler
+		# Assumes: nothing
+		# Effects: communicates with the pooler over our socket
+		# Throws: 'error' if the pooler reports a failure or drops
+		#	the connection
+
+		sendMessage (self.sock, (operation, arg))
+		reply = receiveMessage (self.sock)
+		if reply is None:
+			raise error, 'Lost connection to WTS pooler'
+		status, value = reply
+		if status != 'ok':
+			raise error, value
+		return value
+
+	def execute (self, query, params = None):
+		return self.request ('execute', (query, params))
+
+	def executePrepared (self, name, params):
+		# send the definition along, as the pooler's session may not
+		# have seen this statement yet
+
+		return self.request ('prepared', (name, PREPARED[name],
+			params))
+
+	def batch (self, queries):
+		# the pooler runs the whole batch in one round trip
+
+		return self.request ('batch', queries)
+
+	def commit (self):
+		self.request ('commit')
+		return
+
+	def rollback (self):
+		self.request ('rollback')
+		return
+
+	def close (self):
+		self.sock.close ()
+		return
+
+def getSession ():
+	# Purpose: get a warm database session for running queries
+	# Returns: a DirectSession or PoolerSession object
+	# Assumes: nothing
+	# Effects: may contact the pooler or open a new connection to the
+	#	database server; updates 'poolStats'
+	# Throws: propagates any exceptions raised in opening a connection
+
+	global idleSessions, poolStats
+
+	if idleSessions:
+		poolStats['hits'] = poolStats['hits'] + 1
+		return idleSessions.pop ()
+
+	path = fileConfig ('DB_POOL_SOCKET')
+	session = None
+	if path and os.path.exists (path):
+		try:
+			session = PoolerSession (path)
+		except (socket.error, error):
+			session = None	# pooler is not running; go direct
+
+	if session is None:
+		session = DirectSession ()
+
+	if session.warm:
+		poolStats['hits'] = poolStats['hits'] + 1
+	else:
+		poolStats['misses'] = poolStats['misses'] + 1
+	return session
+
+def releaseSession (
+	session		# session obtained from getSession()
+	):
+	# Purpose: give 'session' back so later queries can reuse it
+	# Returns: nothing
+	# Assumes: 'session' has no uncommitted work
+	# Effects: keeps 'session' in 'idleSessions', or closes it if we
+	#	already have POOL_SIZE idle sessions
+	# Throws: nothing
+
+	global idleSessions
+
+	if len (idleSessions) < POOL_SIZE:
+		idleSessions.append (session)
+	else:
+		discardSession (session)
+	return
+
+def discardSession (
+	session		# session obtained from getSession()
+	):
+	# Purpose: close 'session' without returning it to the pool
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: closes the session's connection
+	# Throws: nothing
+
+	try:
+		session.close ()
+	except:
+		pass
+	return
+
+def closeSessions ():
+	# Purpose: close all idle sessions
+	# Returns: nothing
+	# Assumes: nothing
+	# Effects: closes connections; registered to run at exit so that the
+	#	pooler gets its sessions back promptly
+	# Throws: nothing
+
+	global idleSessions
+
+	while idleSessions:
+		discardSession (idleSessions.pop ())
+	return
+
+def getPoolStats ():
+	# Purpose: report how well session reuse is working in this process
+	# Returns: dictionary with keys 'hits', 'misses', and 'idle' (the
+	#	number of idle sessions currently held)
+	# Assumes: nothing
+	# Effects: nothing
+	# Throws: nothing
+
+	stats = poolStats.copy ()
+	stats['idle'] = len (idleSessions)
+	return stats
+
+atexit.register (closeSessions)
 
 #---DATE AND TIME FUNCTIONALITY------------------------------------------
 
@@ -119,9 +548,152 @@ MAX_DAYS = {	1 : 31,		2 : 29,		3 : 31,		4 : 30,
 START = '^[ \t]*'	# regex match to start of string, whitespace ok
 END = '[ \t]*$'		# regex match to end of string, whitespace ok
 
+# the pieces of dates and times:
+
+RE_DAY = '\([ 0123]?[0-9]\)'	# optional tens digit, then ones digit
+RE_MONTH = '\([ 01]?[0-9]\)'	# optional tens digit, then ones digit
+RE_MONTH_NAME = (
+	'\([a-zA-Z]'		# must have at least three letters
+	'[a-zA-Z][a-zA-Z]+\)'
+	)
+RE_YEAR = (
+	'\(19[0-9][0-9]\|'	# 19yy --> 1900's, or
+	'20[0-9][0-9]\|'	# 20yy --> 2000's, or
+	'[0-9][0-9]\)'		# just yy - no century
+	)
+RE_AMPM = '\([AP]M\)'				# AM/PM
+RE_HHMM = '\([012 ]?[0-9]\):\([0-5][0-9]\)'	# HH:MM
+
+# The recognizable date formats, in the order we try them.  Each is a tuple
+# of (regular expression string, group numbers of the (month, day, year) in
+# it, and TRUE if the month is a name rather than a number).  The regular
+# expressions are compiled just once, into DATE_FORMATS.
+
+DATE_PATTERNS = [
+	# month/day/year (all numeric)
+	(START + RE_MONTH + '/' + RE_DAY + '/' + RE_YEAR + END,
+		(1, 2, 3), FALSE),
+
+	# day monthName year
+	(START + RE_DAY + ' +' + RE_MONTH_NAME + ' +' + RE_YEAR + END,
+		(2, 1, 3), TRUE),
+
+	# monthName day, year
+	(START + RE_MONTH_NAME + ' +' + RE_DAY + ',? +' + RE_YEAR + END,
+		(1, 2, 3), TRUE),
+	]
+
+DATE_FORMATS = map (lambda p: (regex.compile (p[0]), p[1], p[2]),
+	DATE_PATTERNS)
+
+# the time formats:  (for description, see parse_Time)
+
+TIME_PATTERNS = [
+	'.*' + RE_AMPM,				# is AM/PM anywhere?
+	START + RE_HHMM + END,			# time without AM/PM
+	START + RE_HHMM + '[ \t]*' + RE_AMPM + END,	# time with AM/PM
+	]
+
+(TIME_AMPM, TIME_NO_AMPM, TIME_FULL) = map (regex.compile, TIME_PATTERNS)
+
+# Two regular expressions which should catch the delimiters (.., ..., -) in
+# a range of dates, if they exist, in the order we try them:
+
+RANGE_PATTERNS = [
+	'\([^\.]*\)'		# group 1 = any non-period characters
+	'\.\.\.?'		# separated by 2 or 3 periods
+	'\([^\.]*\)',		# group 2 = any non-period characters
+
+	'\(.*\)'		# group 1 = any characters
+	'-'			# separated by a hyphen
+	'\(.*\)',		# group 2 = any characters
+	]
+
+RANGE_DELIMITERS = map (regex.compile, RANGE_PATTERNS)
+
+# The same few strings come up again and again -- in each tracking record's
+# Status History, for instance, and in the lists of tracking records -- so
+# we remember the result of parsing each recent string in DATE_CACHE.
+
+DATE_CACHE_SIZE = 2000		# maximum number of strings to remember
+
+class LRU_Cache:
+	# Concept:
+	#	IS: a dictionary of limited size, which forgets the entries
+	#		used least recently when it fills up
+	#	HAS: up to "size" keys and their values
+	#	DOES: looks up and remembers values
+	# Implementation:
+	#	Each entry remembers when it was last used, as a count of
+	#	lookups so far.  When the cache is full, we drop the least
+	#	recently used quarter of the entries at once, so the cost of
+	#	sorting them is spread over many lookups.
+	#	Methods:
+	#		__init__ (size)
+	#		get (key)
+	#		put (key, value)
+	#		clear ()
+
+	def __init__ (self, size):
+		self.size = size
+		self.clear ()
+
+	def get (self, key):
+		# Returns: the value for "key", or None if we do not have it
+
+		if not self.entries.has_key (key):
+			return None
+		self.clock = self.clock + 1
+		entry = self.entries [key]
+		entry [1] = self.clock
+		return entry [0]
+
+	def put (self, key, value):
+		if len (self.entries) >= self.size:
+			last_used = map (lambda e: e[1], self.entries.values ())
+			last_used.sort ()
+			oldest = last_used [self.size / 4]
+			for (k, entry) in self.entries.items ():
+				if entry [1] < oldest:
+					del self.entries [k]
+		self.clock = self.clock + 1
+		self.entries [key] = [ value, self.clock ]
+
+	def clear (self):
+		self.entries = {}	# key -> [ value, when last used ]
+		self.clock = 0		# number of lookups so far
+
+### End of Class: LRU_Cache ###
+
+DATE_CACHE = LRU_Cache (DATE_CACHE_SIZE)
+
 
 #---DATE AND TIME FUNCTIONS----------------------------------------------
 
+def cached_Parse (kind, s, parser):
+	''' returns the result of parser (s), from DATE_CACHE if we can
+	#
+	# Requires:	kind - string; which kind of parse this is
+	#		s - string to parse
+	#		parser - function which parses s, returning a tuple
+	#			whose last item is None or a list of errors
+	# Effects:	looks up (kind, s) in DATE_CACHE, calling parser and
+	#		remembering its result if it is not there.  Returns
+	#		a copy of the list of errors, so callers may change
+	#		it.
+	# Modifies:	DATE_CACHE
+	'''
+	key = (kind, s)
+	result = DATE_CACHE.get (key)
+	if result is None:
+		result = parser (s)
+		DATE_CACHE.put (key, result)
+	errors = result [-1]
+	if errors is not None:
+		errors = errors [:]
+	return result [:-1] + (errors,)
+
+
 def parse_Date (date):
 	''' returns a tuple (standardized date string, list of error strings)
 	#
@@ -137,76 +709,46 @@ def parse_Date (date):
 	#		encountered in parsing.  Returns a tuple with either:
 	#		(date string, None) if no errors, or ('', list of
 	#		error strings) if errors were found
-	# Modifies:	no side effects
+	# Modifies:	DATE_CACHE
 	'''
-	global START, END, MONTH_MAP, MAX_DAYS, YEAR_SPLIT
-
-	# we use regular expressions to do our initial examination and
-	# splitting of date into its component pieces.  Set up the regex
-	# strings we'll use:
-
-	re_day = '\([ 0123]?[0-9]\)'	# optional tens digit, then ones digit
-	re_month = '\([ 01]?[0-9]\)'	# optional tens digit, then ones digit
-	re_monthName = (
-		'\([a-zA-Z]'		# must have at least three letters
-		'[a-zA-Z][a-zA-Z]+\)'
-		)
-	re_year = (
-		'\(19[0-9][0-9]\|'	# 19yy --> 1900's, or
-		'20[0-9][0-9]\|'	# 20yy --> 2000's, or
-		'[0-9][0-9]\)'		# just yy - no century
-		)
-
-	# now, compile the regular expressions to look for recognizable date
-	# formats (for a list, see above):
-
-	format1 = regex.compile (START + re_month + '/' + re_day + '/' + 
-		re_year + END)
-	format2 = regex.compile (START + re_day + ' +' + re_monthName + ' +' + 
-		re_year + END)
-	format3 = regex.compile (START + re_monthName + ' +' + re_day + ',? +' +
-		re_year + END)
-
-	# now, see if we can extract month, day, and year using any of the
-	# above-listed recognized formats:
+	return cached_Parse ('date', date, uncached_Date)
+
+
+def uncached_Date (date):
+	''' does the work of parse_Date, without looking in DATE_CACHE
+	'''
+	global MONTH_MAP, MAX_DAYS, YEAR_SPLIT, DATE_FORMATS
+
+	# see if we can extract month, day, and year using any of the
+	# recognized formats (see DATE_PATTERNS):
 
 	errors = []			# found no errors yet
 	month = None			# no month yet
 	day = None			# no day yet
 	year = None			# no year yet
 
-	# is it:  month/day/year (all numeric)
-
-	if format1.match (date) >= 0:
-		(month, day, year) = format1.group (1, 2, 3)
-		month = string.atoi (month)
-		if (month < 1) or (month > 12):
-			errors.append ('Month out of range: %d' % month)
-
-	# is it:  day monthName year
+	for (format, groups, named_month) in DATE_FORMATS:
+		if format.match (date) >= 0:
+			(month, day, year) = format.group (groups [0],
+				groups [1], groups [2])
+			break
 
-	elif format2.match (date) >= 0:
-		(day, monthName, year) = format2.group (2, 1, 3)
-		monthName = string.lower (monthName)
-		if MONTH_MAP.has_key (monthName):
-			month = MONTH_MAP [monthName]
-		else:
-			errors.append ('Unrecognized month: %s' % monthName)
+	# if we didn't recognize a format, just give up
 
-	# is it:  monthName day, year
+	if month is None:
+		return ('', [ 'Could not recognize date %s' % date ])
 
-	elif format3.match (date) >= 0:
-		(monthName, day, year) = format3.group (1, 2, 3)
-		monthName = string.lower (monthName)
+	if named_month:
+		monthName = string.lower (month)
 		if MONTH_MAP.has_key (monthName):
 			month = MONTH_MAP [monthName]
 		else:
+			month = None
 			errors.append ('Unrecognized month: %s' % monthName)
-
-	# if we didn't recognize a format, just give up
-
 	else:
-		return ('', [ 'Could not recognize date %s' % date ])
+		month = string.atoi (month)
+		if (month < 1) or (month > 12):
+			errors.append ('Month out of range: %d' % month)
 
 	# now, get integer values for day and year.  validate the day value.
 	# promote a two-digit year to four digits, based on YEAR_SPLIT.
@@ -244,24 +786,15 @@ def parse_Time (tym):
 	#		encountered in parsing.  Returns a tuple with either:
 	#		(time string, None) if no errors, or ('', list of error
 	#		strings) if errors were found.
-	# Modifies:	no side effects
+	# Modifies:	DATE_CACHE
 	'''
-	global START, END
-
-	# we use regular expressions to do our initial examination and
-	# splitting of tym into its component pieces.  Set up the regex
-	# strings we'll use:
+	return cached_Parse ('time', tym, uncached_Time)
 
-	re_ampm = '\([AP]M\)'				# AM/PM
-	re_hhmm = '\([012 ]?[0-9]\):\([0-5][0-9]\)'	# HH:MM
 
-	# now, compile the regular expressions to look for recognizable tym
-	# formats (for description, see above):
-
-	timeampm = regex.compile ('.*' + re_ampm)	# is AM/PM anywhere?
-	time = regex.compile (START + re_hhmm + END)	# time without AM/PM
-	fulltime = regex.compile (START + re_hhmm + 
-		'[ \t]*' + re_ampm + END)		# time with AM/PM
+def uncached_Time (tym):
+	''' does the work of parse_Time, without looking in DATE_CACHE
+	'''
+	global TIME_AMPM, TIME_NO_AMPM, TIME_FULL
 
 	ampm = None		# no AM/PM designation yet
 	hours = None		# no hours yet
@@ -270,11 +803,11 @@ def parse_Time (tym):
 	# now, try to match tym to one of the formats (one with AM/PM, one
 	# without)
 
-	if (timeampm.match (tym) >= 0):
-		if (fulltime.match (tym) >= 0):
-			(hours, minutes, ampm) = fulltime.group (1, 2, 3)
-	elif (time.match (tym) >= 0):
-		(hours, minutes) = time.group (1, 2)
+	if (TIME_AMPM.match (tym) >= 0):
+		if (TIME_FULL.match (tym) >= 0):
+			(hours, minutes, ampm) = TIME_FULL.group (1, 2, 3)
+	elif (TIME_NO_AMPM.match (tym) >= 0):
+		(hours, minutes) = TIME_NO_AMPM.group (1, 2)
 
 	# if hours is still None, then we know it didn't match.  bail out.
 
@@ -346,34 +879,30 @@ def parse_DateRange (dates):
 	#               list of error strings) if errors were found.  Each
 	#		datetime string returned is of the format:
 	#			mm/dd/yyyy HH:MM PM
-	# Modifies:     no side effects
+	# Modifies:     DATE_CACHE
+	'''
+	return cached_Parse ('range', dates, uncached_DateRange)
+
+
+def uncached_DateRange (dates):
+	''' does the work of parse_DateRange, without looking in DATE_CACHE
 	'''
-	# Let's define two regular expressions which should catch the 
-	# delimiters (.., ..., -) if they exist in dates.
-
-	re_delim1 = regex.compile (
-		'\([^\.]*\)'		# group 1 = any non-period characters
-		'\.\.\.?'		# separated by 2 or 3 periods
-		'\([^\.]*\)')		# group 2 = any non-period characters
-	re_delim2 = regex.compile (
-		'\(.*\)'		# group 1 = any characters
-		'-'			# separated by a hyphen
-		'\(.*\)')		# group 2 = any characters
+	global RANGE_DELIMITERS
 
 	# now, try to pick out temp_start and temp_stop (the raw start and
 	# stop dates, before processing).  If there is no date on either side
 	# of the delimiter, the field will be filled in as ''.
 
-	found_marker = 1		# assume that we will find a marker
+	found_marker = None		# no marker found yet
 
-	if re_delim1.match (dates) >= 0:
-		(temp_start, temp_stop) = re_delim1.group (1, 2)
-	elif re_delim2.match (dates) >= 0:
-		(temp_start, temp_stop) = re_delim2.group (1, 2)
-	else:
+	for delimiter in RANGE_DELIMITERS:
+		if delimiter.match (dates) >= 0:
+			(temp_start, temp_stop) = delimiter.group (1, 2)
+			found_marker = 1
+			break
+	if not found_marker:
 		temp_start = dates	# assume dates is really a single date
 		temp_stop = ''		# fill this in later
-		found_marker = None	# note that we didn't find a marker
 
 	# if both the temp_start and temp_stop dates are empty strings, then
 	# we only had a marker.  We should bail out with an error message.
@@ -425,7 +954,7 @@ def parse_DateRange (dates):
 	elif stop_date == '':
 		return (start_date + FIRST_MINUTE, '', None)
 	else:
-		return (start_date + FIRST_MINUTE, stop_date + LAST_MINUTE, 
+		return (start_date + FIRST_MINUTE, stop_date + LAST_MINUTE,
 			None)
 
 
@@ -447,7 +976,17 @@ def parse_DateTime (datetime):
 	#		(where MMM is the text name of the month)
 	#		A time is recognized in the form:  HH:MM PM
 	#		(The AM/PM designation is optional.)
-	# Modifies:	no side effects
+	# Modifies:	DATE_CACHE
+	'''
+	return cached_Parse ('datetime', datetime, uncached_DateTime)
+
+
+def uncached_DateTime (datetime, date_parser = parse_Date,
+	time_parser = parse_Time):
+	''' does the work of parse_DateTime, without looking in DATE_CACHE
+	#	for datetime itself.  The date and time parts are parsed with
+	#	date_parser and time_parser, which benchmark_Dates may replace
+	#	to keep DATE_CACHE out of it entirely.
 	'''
 	global FIRST_MINUTE
 
@@ -466,7 +1005,7 @@ def parse_DateTime (datetime):
 		# we only have a date, so just process that part and return
 		# the appropriate values
 
-		temp_date, temp_date_errors = parse_Date (local_datetime)
+		temp_date, temp_date_errors = date_parser (local_datetime)
 		if temp_date_errors == None:
 
 			# append a string with the first minute of the day
@@ -486,9 +1025,9 @@ def parse_DateTime (datetime):
 			return ('', ['Could not find a date'])
 
 		temp_date, temp_date_errors = \
-			parse_Date (local_datetime [:split_pos])
+			date_parser (local_datetime [:split_pos])
 		temp_time, temp_time_errors = \
-			parse_Time (local_datetime [split_pos:])
+			time_parser (local_datetime [split_pos:])
 
 		# now, combine our error strings:
 
@@ -507,6 +1046,122 @@ def parse_DateTime (datetime):
 			return ('', errors)
 
 
+def format_DateTime (value):
+	''' returns a string with value in the standard WTS datetime format
+	#	(mm/dd/yyyy HH:MM PM), or '' if value is None
+	#
+	# Requires:	value - a date or datetime value as it comes from the
+	#		database, or None.  A string is parsed with
+	#		parse_DateTime, ignoring any errors.
+	# Effects:	see Returns.  A date with no time is given the first
+	#		minute of the day, as parse_DateTime does.
+	# Modifies:	no side effects
+	'''
+	if value is None:
+		return ''
+	if type (value) == types.StringType:
+		return parse_DateTime (value)[0]
+	if hasattr (value, 'hour'):
+		hours = value.hour
+		minutes = value.minute
+	else:
+		hours = 0
+		minutes = 0
+	if hours < 12:
+		ampm = 'AM'
+	else:
+		ampm = 'PM'
+	hours = hours % 12
+	if hours == 0:
+		hours = 12
+	return '%02d/%02d/%04d %02d:%02d %s' % (value.month, value.day,
+		value.year, hours, minutes, ampm)
+
+
+def benchmark_Dates (
+	count = 2000,		# number of tracking records to load
+	distinct = 200		# number of different tracking records among them
+	):
+	''' returns a list of (description, seconds) tuples
+	#
+	# Requires:	count - integer; number of tracking records to load
+	#		distinct - integer; how many different tracking
+	#			records there are
+	# Effects:	parses the dates of "count" tracking records, as
+	#		loading a tracking record did:  its Status Date, Needs
+	#		Attention By (for one in three), and modification
+	#		date, and the date of each entry in its Status History
+	#		(two to six of them).  A tracking record is often
+	#		loaded many times (by saved searches, and again before
+	#		it is saved), and its Status History entries include
+	#		dates which are also other tracking records' Status
+	#		Dates.  We time this three ways:  recompiling the
+	#		regular expressions for each date and time (as we used
+	#		to), with the precompiled ones, and with the
+	#		precompiled ones and DATE_CACHE.  Only the last way
+	#		uses DATE_CACHE at all.
+	# Modifies:	clears DATE_CACHE
+	'''
+	def date (i):
+		# the i-th date, in the form stored by convertDate()
+
+		return '%02d/%02d/%04d %02d:%02d %s' % (1 + i % 12,
+			1 + i % 28, 1998 + i % 20, 1 + i % 12, i % 60,
+			[ 'AM', 'PM' ][i % 2])
+
+	records = []
+	for i in range (0, distinct):
+		if i % 3 == 0:
+			attention_by = date (i + 7)
+		else:
+			attention_by = ''
+		history = []
+		for j in range (0, 2 + i % 5):
+			history.append ('%s\t%s\t%s' % ('Status', 'staff',
+				date (i - j)))
+		records.append ((date (i), attention_by, date (i + 1),
+			history))
+	records = (records * (1 + count / distinct)) [:count]
+
+	def loadDates (
+		record,		# tuple; (Status Date, Needs Attention By,
+				# modification date, Status History entries)
+		parser		# function to parse each date
+		):
+		status_set_date, attention_by, modification_date, \
+			history = record
+		for datetime in [ status_set_date, attention_by,
+				modification_date ]:
+			if datetime:
+				parser (datetime)
+		for entry in history:
+			parser (string.split (entry, '\t') [2])
+		return
+
+	def recompiledDate (date):
+		map (lambda p: regex.compile (p[0]), DATE_PATTERNS)
+		return uncached_Date (date)
+
+	def recompiledTime (tym):
+		map (regex.compile, TIME_PATTERNS)
+		return uncached_Time (tym)
+
+	timings = []
+	for (description, parser) in [
+			('recompiled patterns', lambda dt, d = recompiledDate,
+				t = recompiledTime: uncached_DateTime (dt, d, t)),
+			('precompiled patterns', lambda dt: uncached_DateTime (
+				dt, uncached_Date, uncached_Time)),
+			('precompiled patterns and cache', parse_DateTime) ]:
+		DATE_CACHE.clear ()
+		start = time.time ()
+		for record in records:
+			loadDates (record, parser)
+		timings.append ((description, time.time () - start))
+	DATE_CACHE.clear ()
+	return timings
+
+
 #---NON-DATE & TIME FUNCTIONS--------------------------------------------
 
 def FieldStorage_to_Dict (fs):
@@ -645,54 +1300,554 @@ def duplicated_Quotes (s):
 	return regsub.gsub ("'", "''", s)
 
 
-def sql (queries):
+def sql (queries, batch = FALSE, params = None):
 	''' wrapper for db.sql which catches errors & writes diagnostics
 	#
-	# Assumes:	db has been initialized
+	# Assumes:	nothing
 	# Requires:	queries - a string or list of strings, each of which is
 	#			a SQL query.  (as appropriate for db.sql)
-	# Effects:	passes queries on to dbManager.execute (see its
+	#		batch - boolean; if true and queries is a list, run
+	#			them all in a single transaction (see runBatch).
+	#			Items in a batch may also be (query, params)
+	#			tuples.
+	#		params - list of values to bind to %s placeholders
+	#			in a single query string.  The values are
+	#			passed to the server as-is, so they need no
+	#			quoting (see duplicated_Quotes); a literal
+	#			percent sign must be written as %%.
+	# Effects:	borrows a warm session from getSession() and passes
+	#		queries on to its execute method (see dbManager.execute
 	#		documentation).  If no exceptions were raised, just
 	#		return the value from db.sql.  If an exception did
 	#		occur, catch it, write out some diagnostic information,
 	#		then raise a sqlError exception with a value that
-	#		identifies the diagnostic file.
+	#		identifies the diagnostic file.  If a transaction is
+	#		open (see beginTransaction), the queries run within it
+	#		and are not committed here; an error rolls it back.
 	# Modifies:	depends on queries
 	'''
 	if type(queries) == types.ListType:
+		if batch:
+			return runBatch (queries)
 		out = []
 		for q in queries:
 			out.append(sql(q))
 		return out
 
 	try:
-		results = db.execute (queries)
-		db.commit()
-		if results:
-			# if we had results, convert them to be Python
-			# dictionaries so we can add/delete key/value pairs
-			# as needed 
-
-			if results[0] == None:
-				return results
-
-			keys = results[0].keys()
-			out = []
-			for row in results:
-				d = {}
-				for key in keys:
-					d[key] = row[key]
-				out.append(d)
-			results = out
-		return results
+		if transaction is not None:
+			return toRows (transaction.execute (queries, params))
+
+		session = getSession()
+		try:
+			results = session.execute (queries, params)
+			session.commit()
+		except:
+			# do not hand a session with a failed transaction
+			# back to the pool
+
+			exc_type, exc_value, exc_traceback = sys.exc_info()
+			discardSession (session)
+			raise exc_type, exc_value, exc_traceback
+		releaseSession (session)
+		return toRows (results)
 	except:
 		global sqlError
-		filename = record_SQL_Errors (queries, sys.exc_type, \
-			sys.exc_value, sys.exc_traceback)
+		exc_type, exc_value, exc_traceback = sys.exc_info()
+		if transaction is not None:
+			rollbackTransaction ()
+		filename = record_SQL_Errors (queries, exc_type, \
+			exc_value, exc_traceback)
 		raise sqlError, 'Error occured in executing query.  ' + \
 			'Diagnostics are in ' + filename
 
 
+def toRows (results):
+	''' converts the results returned by dbManager to a list of Row objects
+	#
+	# Requires:	results - (list of column names, list of row tuples),
+	#			as returned by db.execute with Sybase-style
+	#			results turned off
+	# Effects:	returns a list with a Row for each row tuple.  The rows
+	#		share one Columns object and use the driver's tuples
+	#		as-is, so nothing is copied unless a caller changes a
+	#		row.  Statements which return no rows give [].
+	# Modifies:	no side effects
+	'''
+	if not results:
+		return []
+	if type(results) == types.ListType:
+		return results		# already converted (or Sybase-style)
+	columns, rows = results
+	if not columns or not rows:
+		return []
+
+	layout = Columns (columns)
+	out = []
+	for row in rows:
+		out.append (Row (layout, row))
+	return out
+
+
+class Columns:
+	# Concept:
+	#	IS: the column layout shared by the Rows from one result set
+	#	HAS: an ordered list of visible column names, a dictionary
+	#		mapping each to its position in a row's values, the
+	#		number of value slots in each row, and a cache of the
+	#		layouts derived from this one
+	#	DOES: finds column positions; makes the layout for a row which
+	#		gained or lost a column
+	# Implementation:
+	#	A Columns object is never changed once built.  When a Row gains
+	#	or loses a column, it switches to a derived layout, which is
+	#	cached here so that all the rows which make the same change
+	#	keep on sharing a layout.
+
+	def __init__ (self,
+		names,		# list of column names, in order
+		positions = None,	# name -> position; default is the
+					# order of 'names'
+		width = None	# number of value slots; default len(names)
+		):
+		self.names = list(names)
+		if positions is None:
+			positions = {}
+			for i in range(0, len(names)):
+				positions[names[i]] = i
+		self.positions = positions
+		if width is None:
+			width = len(names)
+		self.width = width
+		self.derived = {}	# (op, name) -> derived Columns
+		return
+
+	def extend (self,
+		name		# name of the column to add
+		):
+		# Returns: the layout for a row with 'name' added in a new
+		#	value slot at the end
+
+		if not self.derived.has_key ( ('+', name) ):
+			positions = self.positions.copy()
+			positions[name] = self.width
+			self.derived[('+', name)] = Columns (self.names + [name],
+				positions, self.width + 1)
+		return self.derived[('+', name)]
+
+	def remove (self,
+		name		# name of the column to drop
+		):
+		# Returns: the layout for a row with 'name' hidden.  (Its value
+		#	slot remains, so the row's values need not be copied.)
+
+		if not self.derived.has_key ( ('-', name) ):
+			positions = self.positions.copy()
+			del positions[name]
+			names = self.names[:]
+			names.remove (name)
+			self.derived[('-', name)] = Columns (names, positions,
+				self.width)
+		return self.derived[('-', name)]
+
+	def rename (self,
+		mapping		# dictionary; old column name -> new name
+		):
+		# Returns: the layout which shows only the columns in
+		#	'mapping' which this one has, under their new names
+
+		key = ('=', tuple(mapping.items()))
+		if not self.derived.has_key (key):
+			names = []
+			positions = {}
+			for name in self.names:
+				if mapping.has_key (name):
+					names.append (mapping[name])
+					positions[mapping[name]] = \
+						self.positions[name]
+			self.derived[key] = Columns (names, positions,
+				self.width)
+		return self.derived[key]
+
+
+class Row (object):
+	# Concept:
+	#	IS: one row of results from sql()
+	#	HAS: a shared Columns layout and a tuple (or, once changed, a
+	#		list) of values
+	#	DOES: acts like the dictionary of column name -> value which
+	#		sql() used to build for each row:  row['_tr_key'],
+	#		keys(), has_key(), assignment, del, etc.
+	# Implementation:
+	#	The values tuple comes straight from the database driver.  It
+	#	is copied to a list only when the row is first changed, and the
+	#	layout is only swapped (never copied) when a column is added or
+	#	removed.
+
+	__slots__ = ('columns', 'data')
+
+	def __init__ (self, columns, data):
+		self.columns = columns
+		self.data = data
+		return
+
+	def __getitem__ (self, key):
+		return self.data[self.columns.positions[key]]
+
+	def __setitem__ (self, key, value):
+		if type(self.data) != types.ListType:
+			self.data = list(self.data)		# copy on write
+		if self.columns.positions.has_key (key):
+			self.data[self.columns.positions[key]] = value
+		else:
+			self.columns = self.columns.extend (key)
+			self.data.append (value)
+		return
+
+	def __delitem__ (self, key):
+		if not self.columns.positions.has_key (key):
+			raise KeyError, key
+		self.columns = self.columns.remove (key)
+		return
+
+	def __len__ (self):
+		return len(self.columns.names)
+
+	def __iter__ (self):
+		return iter(self.columns.names)
+
+	def __contains__ (self, key):
+		return self.columns.positions.has_key (key)
+
+	def has_key (self, key):
+		return self.columns.positions.has_key (key)
+
+	def get (self, key, default = None):
+		if self.columns.positions.has_key (key):
+			return self[key]
+		return default
+
+	def keys (self):
+		return self.columns.names[:]
+
+	def values (self):
+		return map (self.__getitem__, self.columns.names)
+
+	def items (self):
+		return map (None, self.columns.names, self.values ())
+
+	def update (self, dict):
+		for key in dict.keys():
+			self[key] = dict[key]
+		return
+
+	def copy (self):
+		# returns a standard dictionary with this row's data
+
+		d = {}
+		for name in self.columns.names:
+			d[name] = self[name]
+		return d
+
+	def rename (self, mapping):
+		# returns a Row showing only the columns in 'mapping', under
+		# their new names.  It shares this row's values only while
+		# they are still the driver's tuple; a list (once this row has
+		# been changed) is copied, so neither row sees the other's
+		# later changes.
+
+		data = self.data
+		if type(data) == types.ListType:
+			data = data[:]
+		return Row (self.columns.rename (mapping), data)
+
+	def __copy__ (self):
+		return Row (self.columns, self.data[:])
+
+	def __deepcopy__ (self, memo):
+		return Row (self.columns, copy.deepcopy (self.data, memo))
+
+	def __getstate__ (self):
+		return (self.columns.names, self.values ())
+
+	def __setstate__ (self, state):
+		names, data = state
+		self.columns = Columns (names)
+		self.data = data
+		return
+
+	def __eq__ (self, other):
+		if isinstance (other, Row):
+			other = other.copy ()
+		return self.copy () == other
+
+	def __ne__ (self, other):
+		return not self.__eq__ (other)
+
+	def __repr__ (self):
+		return repr (self.copy ())
+
+
+def renameColumns (rows, mapping):
+	''' keeps and renames selected columns in a list of rows
+	#
+	# Requires:	rows - list of Row objects or dictionaries
+	#		mapping - dictionary; old column name -> new name
+	# Effects:	returns a new list of rows, each with only the columns
+	#		named in mapping (under their new names).  Rows which
+	#		share a layout keep sharing one, and no values are
+	#		copied unless a row has been changed.
+	# Modifies:	no side effects
+	'''
+	out = []
+	for row in rows:
+		if isinstance (row, Row):
+			out.append (row.rename (mapping))
+		else:
+			d = {}
+			for key in row.keys():
+				if mapping.has_key (key):
+					d[mapping[key]] = row[key]
+			out.append (d)
+	return out
+
+
+def runBatch (queries):
+	''' runs a list of queries as a single transaction
+	#
+	# Requires:	queries - a list of strings, each of which is a SQL
+	#			query
+	# Effects:	runs all the queries on one session, committing once
+	#		at the end (or leaving them for the caller to commit,
+	#		if a transaction is already open).  Consecutive queries
+	#		which do not return rows are sent to the server
+	#		together, so we make at most one round trip per result
+	#		set.  If any query fails, the whole batch is rolled
+	#		back and we raise sqlError, as sql() does.  Returns a
+	#		list with one entry per query, as sql() does for a
+	#		list; queries which return no rows have [] as results.
+	# Modifies:	depends on queries
+	'''
+	owner = (transaction is None)	# did we open the transaction?
+	try:
+		if owner:
+			beginTransaction ()
+		out = []
+		for results in transaction.batch (queries):
+			out.append (toRows (results))
+		if owner:
+			commitTransaction ()
+		return out
+	except:
+		global sqlError
+		exc_type, exc_value, exc_traceback = sys.exc_info()
+		if transaction is not None:
+			rollbackTransaction ()
+		filename = record_SQL_Errors (queries, exc_type, \
+			exc_value, exc_traceback)
+		raise sqlError, 'Error occured in executing batch; it ' + \
+			'was rolled back.  Diagnostics are in ' + filename
+
+
+def groupStatements (queries):
+	''' groups a list of queries for sending to the server in a batch
+	#
+	# Requires:	queries - a list of strings, each of which is a SQL
+	#			query
+	# Effects:	returns a list of (returns rows flag, list of queries)
+	#		tuples, in order.  Only runs of plain insert, update,
+	#		delete, create, and drop statements are grouped
+	#		together; any other query (select, with, one with a
+	#		returning clause, and so on) may return rows, so it is
+	#		in a group by itself, as is each (query, parameters)
+	#		tuple.
+	# Modifies:	no side effects
+	'''
+	groups = []
+	for q in queries:
+		if type(q) == types.TupleType:
+			# query with bind parameters; always alone
+
+			groups.append ( (TRUE, [ q ]) )
+			continue
+		lower = string.lower (q)
+		words = string.split (lower)
+		returnsRows = (len(words) == 0) or \
+			(words[0] not in BATCHABLE) or \
+			(string.find (lower, 'returning') >= 0)
+		if returnsRows or not groups or groups[-1][0]:
+			groups.append ( (returnsRows, [ q ]) )
+		else:
+			groups[-1][1].append (q)
+	return groups
+
+
+def beginTransaction ():
+	''' starts a transaction which spans multiple calls to sql()
+	#
+	# Effects:	pins a session from getSession() for all sql() calls
+	#		until commitTransaction() or rollbackTransaction() is
+	#		called.  Nothing is committed in between.
+	# Modifies:	global transaction
+	'''
+	global transaction
+	if transaction is not None:
+		raise error, 'A transaction is already open'
+	transaction = getSession ()
+	return
+
+
+def commitTransaction ():
+	''' commits the open transaction and releases its session
+	#
+	# Effects:	commits the work done since beginTransaction()
+	# Modifies:	global transaction
+	'''
+	global transaction
+	session = transaction
+	transaction = None
+	try:
+		session.commit ()
+	except:
+		exc_type, exc_value, exc_traceback = sys.exc_info()
+		discardSession (session)
+		raise exc_type, exc_value, exc_traceback
+	releaseSession (session)
+	return
+
+
+def rollbackTransaction ():
+	''' rolls back the open transaction and discards its session
+	#
+	# Effects:	undoes the work done since beginTransaction()
+	# Modifies:	global transaction
+	'''
+	global transaction
+	session = transaction
+	transaction = None
+	try:
+		session.rollback ()
+	except:
+		pass
+	discardSession (session)
+	return
+
+
+def definePrepared (name, paramTypes, query):
+	''' registers a query to be run as a server-side prepared statement
+	#
+	# Requires:	name - string; unique name for the statement
+	#		paramTypes - list of strings; the SQL type of each
+	#			parameter, in order (eg- 'int', 'text')
+	#		query - string; SQL query using $1, $2, ... for its
+	#			parameters
+	# Effects:	remembers the query in PREPARED.  It is not prepared on
+	#		the server until sqlPrepared() first runs it on a given
+	#		connection; from then on, that connection reuses the
+	#		plan rather than parsing and planning it again.
+	# Modifies:	global PREPARED
+	'''
+	PREPARED[name] = (paramTypes, query)
+	return
+
+
+def sqlPrepared (name, params):
+	''' runs a prepared statement which was set up by definePrepared()
+	#
+	# Requires:	name - string; name given to definePrepared()
+	#		params - list of values for the statement's parameters
+	# Effects:	runs the statement on a warm session, as sql() does,
+	#		and returns its results as a list of dictionaries.  The
+	#		values in params are bound by the driver, so they need
+	#		no quoting.  If an error occurs, we write diagnostics
+	#		and raise sqlError, as sql() does.
+	# Modifies:	depends on the statement
+	'''
+	try:
+		if transaction is not None:
+			return toRows (transaction.executePrepared (name,
+				params))
+
+		session = getSession()
+		try:
+			results = session.executePrepared (name, params)
+			session.commit()
+		except:
+			exc_type, exc_value, exc_traceback = sys.exc_info()
+			discardSession (session)
+			raise exc_type, exc_value, exc_traceback
+		releaseSession (session)
+		return toRows (results)
+	except:
+		global sqlError
+		exc_type, exc_value, exc_traceback = sys.exc_info()
+		if transaction is not None:
+			rollbackTransaction ()
+		if PREPARED.has_key (name):
+			query = '%s\n-- prepared as %s, with parameters: %s' % (
+				PREPARED[name][1], name, str(params))
+		else:
+			query = 'unknown prepared statement: %s' % name
+		filename = record_SQL_Errors (query, exc_type, \
+			exc_value, exc_traceback)
+		raise sqlError, 'Error occured in executing query.  ' + \
+			'Diagnostics are in ' + filename
+
+
+def sqlCursor (query, handler, batchSize = CURSOR_BATCH):
+	''' runs a query through a server-side cursor, a batch at a time
+	#
+	# Requires:	query - string; a SQL select statement
+	#		handler - function which accepts a list of rows (as
+	#			from sql()); called once for each batch
+	#		batchSize - integer; maximum number of rows to fetch
+	#			from the server at once
+	# Effects:	declares a cursor for query within a transaction (see
+	#		beginTransaction), and passes its rows to handler as
+	#		they are fetched, so the caller need never hold the
+	#		whole result set.  Returns the number of rows fetched.
+	#		A database error raises sqlError and rolls back the
+	#		open transaction, whoever began it, as sql() does.  If
+	#		handler fails, the transaction is rolled back if
+	#		sqlCursor began it; otherwise the cursor is closed and
+	#		the transaction is left for the caller to finish.
+	# Modifies:	depends on handler
+	'''
+	owner = (transaction is None)	# did we open the transaction?
+	if owner:
+		beginTransaction ()
+	count = 0
+	try:
+		sql ('declare wts_cursor no scroll cursor for %s' % query)
+		while 1:
+			rows = sql ('fetch forward %d from wts_cursor' % \
+				batchSize)
+			if not rows:
+				break
+			count = count + len (rows)
+			handler (rows)
+		sql ('close wts_cursor')
+	except:
+		# roll back only a transaction we began; one of the
+		# caller's is the caller's to finish, but without our cursor
+		# still open in it.  (If sql() failed, it has already rolled
+		# back the transaction, cursor and all.)
+
+		exc_type, exc_value, exc_traceback = sys.exc_info()
+		if transaction is not None:
+			if owner:
+				rollbackTransaction ()
+			else:
+				try:
+					sql ('close wts_cursor')
+				except sqlError:
+					pass
+		raise exc_type, exc_value, exc_traceback
+	if owner:
+		commitTransaction ()
+	return count
+
+
 def record_SQL_Errors (queries, exc_type, exc_value, exc_traceback):
 	''' creates a new file and writes diagnostic info to it, returns name
 	#
@@ -737,7 +1892,7 @@ def record_SQL_Errors (queries, exc_type, exc_value, exc_traceback):
 	fp.write ('\n--------\nQueries:\n--------\n')
 	if type (queries) == types.ListType:
 		for q in queries:
-			fp.write (q + '\n\n')
+			fp.write (str (q) + '\n\n')
 	else:
 		fp.write (queries + '\n\n')
 
@@ -810,6 +1965,56 @@ def dbValueString (x):
 		return str (x)
 
 
+JSON_ESCAPES = {		# maps characters which must be escaped in a
+	'"' : '\\"',		# JSON string to their escaped forms
+	'\\' : '\\\\',
+	'\n' : '\\n',
+	'\r' : '\\r',
+	'\t' : '\\t',
+	}
+
+def jsonString (x):
+	''' returns a string which represents x in JSON
+	#
+	# Requires:	x - can be None, a boolean, a number, a string, or a
+	#			list, tuple, or dictionary of these (nested as
+	#			deeply as needed).  Dictionary keys are
+	#			converted to strings.
+	# Effects:	returns the JSON text for x.  Dictionary keys are
+	#		written in sorted order, so the same x always gives the
+	#		same string.
+	# Modifies:	no side effects
+	'''
+	if x is None:
+		return 'null'
+	elif x is True:
+		return 'true'
+	elif x is False:
+		return 'false'
+	elif type (x) in [ types.IntType, types.LongType, types.FloatType ]:
+		return str (x)
+	elif type (x) in [ types.ListType, types.TupleType ]:
+		return '[' + string.join (map (jsonString, x), ', ') + ']'
+	elif type (x) == types.DictType:
+		items = []
+		keys = x.keys ()
+		keys.sort ()
+		for key in keys:
+			items.append ('%s: %s' % (jsonString (str (key)),
+				jsonString (x [key])))
+		return '{' + string.join (items, ', ') + '}'
+
+	chars = []
+	for c in str (x):
+		if JSON_ESCAPES.has_key (c):
+			chars.append (JSON_ESCAPES [c])
+		elif ord (c) < 32:
+			chars.append ('\\u%04x' % ord (c))
+		else:
+			chars.append (c)
+	return '"' + string.join (chars, '') + '"'
+
+
 def splitCommandLineOptions (
 	argv			# full list of command line parameters
 	):
@@ -1057,3 +2262,110 @@ def splitList (
 		return [ items ]
 	else:
 		return [ items [:n] ] + splitList (items [n:], n)
+
+#---SELF TESTING CODE----------------------------------------------------
+
+def check_Result (description, actual, expected):
+	''' reports whether one check made by a module's self test passed
+	#
+	# Requires:	description - string; what we checked
+	#		actual - value we got
+	#		expected - value we should have gotten
+	# Effects:	writes to stdout a line saying whether actual equals
+	#		expected, and if not, the two values
+	# Modifies:	stdout
+	'''
+	if actual == expected:
+		print 'successful test - %s' % description
+	else:
+		print 'failed test - %s' % description
+		print '	expected: %s' % str (expected)
+		print '	got:      %s' % str (actual)
+	return
+
+
+def self_test ():
+	''' checks the Row objects returned by sql(), format_DateTime, and
+	#	groupStatements, then runs benchmark_Dates and reports how long
+	#	each way took
+	#
+	# Requires:	nothing
+	# Effects:	writes to stdout a line for each check saying whether
+	#		it matched the expected results, then the timings
+	# Modifies:	clears DATE_CACHE
+	'''
+	check = check_Result
+
+	# Rows share their layout and the driver's tuples until changed
+
+	values = [ (1, 'one'), (2, 'two') ]
+	rows = toRows ((['_tr_key', 'tr_title'], values))
+	check ('rows share one layout', rows[0].columns is rows[1].columns,
+		TRUE)
+	check ('rows use the driver\'s tuples', rows[0].data is values[0],
+		TRUE)
+
+	renamed = renameColumns (rows, { 'tr_title' : 'Title' })
+	check ('renamed rows keep only the mapped columns',
+		(renamed[0].keys (), renamed[0]['Title']), (['Title'], 'one'))
+
+	rows[0]['tr_title'] = 'uno'
+	check ('changing a row copies its values',
+		(rows[0]['tr_title'], values[0], renamed[0]['Title']),
+		('uno', (1, 'one'), 'one'))
+
+	rows[0]['status'] = 'new'
+	rows[1]['status'] = 'done'
+	check ('adding a column', (rows[0].keys (), rows[1]['status']),
+		(['_tr_key', 'tr_title', 'status'], 'done'))
+	check ('rows which add the same column share a layout',
+		rows[0].columns is rows[1].columns, TRUE)
+
+	renamed = rows[0].rename ({ 'tr_title' : 'Title' })
+	rows[0]['tr_title'] = 'eins'
+	check ('renaming a changed row copies its values',
+		renamed['Title'], 'uno')
+
+	clone = copy.copy (rows[1])
+	clone['_tr_key'] = 20
+	del rows[1]['status']
+	check ('a copied row is independent',
+		(rows[1].copy (), clone['_tr_key'], clone['status']),
+		({ '_tr_key' : 2, 'tr_title' : 'two' }, 20, 'done'))
+	check ('a row equals the dictionary of its values',
+		rows[1] == { '_tr_key' : 2, 'tr_title' : 'two' }, TRUE)
+
+	# format_DateTime gives the standard form for each kind of value
+
+	check ('format a null date', format_DateTime (None), '')
+	check ('format a date string', format_DateTime ('3 Jan 99 1:05 PM'),
+		'01/03/1999 01:05 PM')
+	check ('format a date', format_DateTime (datetime.date (2004, 2, 29)),
+		'02/29/2004 12:00 AM')
+	check ('format a timestamp', map (format_DateTime, [
+		datetime.datetime (1998, 12, 31, 0, 59),
+		datetime.datetime (1998, 12, 31, 12, 0),
+		datetime.datetime (1998, 12, 31, 23, 15, 42) ]),
+		[ '12/31/1998 12:59 AM', '12/31/1998 12:00 PM',
+		'12/31/1998 11:15 PM' ])
+	check ('a formatted timestamp parses to itself',
+		parse_DateTime (format_DateTime (datetime.datetime (2001, 7,
+		4, 9, 30))), ('07/04/2001 09:30 AM', None))
+
+	# groupStatements sends only plain changes together
+
+	check ('group statements', groupStatements ([
+		'insert into t values (1)', 'update t set x = 2',
+		'insert into t values (3) returning x', 'delete from t',
+		'with s as (select 1) select * from s', 'drop table t' ]),
+		[ (FALSE, [ 'insert into t values (1)', 'update t set x = 2' ]),
+		(TRUE, [ 'insert into t values (3) returning x' ]),
+		(FALSE, [ 'delete from t' ]),
+		(TRUE, [ 'with s as (select 1) select * from s' ]),
+		(FALSE, [ 'drop table t' ]) ])
+
+	for (description, seconds) in benchmark_Dates ():
+		print '%-32s %7.3f seconds' % (description, seconds)
+
+if __name__ == '__main__':		# if executed from command line,
+	self_test()			# do a self test
@@ -16,6 +16,7 @@ import Configuration
 import regsub
 import wtslib
 import screenlib
+import Controlled_Vocab
 
 tables = [ 'CV_Staff',
 	'CV_WTS_Area',
@@ -223,6 +224,11 @@ def savedEntry (parms):
 					doubleQuote(value)))
 		s = s % string.join(t, ', ')
 	wtslib.sql (s)
+
+	# let every WTS process know that it needs to reload the CVs
+
+	if table[:3] == 'CV_':
+		Controlled_Vocab.bump_CV_Version ()
 	list = [
 		'saved!',
 		]
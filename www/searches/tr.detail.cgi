@@ -11,14 +11,16 @@
 #		parameters provided via a GET or POST submission.
 #	Uses: Python 1.4
 #	Envvars: none
-#	Inputs: three optional fields as via a GET or POST submission:  TR_Nr
+#	Inputs: four optional fields as via a GET or POST submission:  TR_Nr
 #		(a strings containing either a single tracking record number or
 #		a comma-separated sequence of tracking record numbers);
 #		Prev_TR_Screen (a string containing an integer (boolean 0/1)
 #		denoting whether or not the last screen displayed was a
 #		tracking record detail screen, and thus whether we should show
-#		a Previous button or not); and, Expanded (which, if present
-#		indicates that we should show an expanded detail page)
+#		a Previous button or not); Expanded (which, if present
+#		indicates that we should show an expanded detail page); and,
+#		All (which, if present, indicates that we should show every
+#		tracking record in TR_Nr on one page)
 #	Outputs: An HTML page (a tracking record detail screen) is sent to
 #		stdout, containing two tables of info for the first tracking
 #		record specified in TR_Nr.  A Next button would display a
@@ -96,7 +98,8 @@ try:
 
 		try:
 			doc = screenlib.TrackRec_Detail_Screen ()
-			doc.setup (tr_list, prev_tr, dict.has_key ('expanded'))
+			doc.setup (tr_list, prev_tr, dict.has_key ('expanded'),
+				dict.has_key ('all'))
 			doc.write ()
 		except ValueError:
 			# we need to find out what tracking record number we
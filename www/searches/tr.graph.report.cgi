@@ -0,0 +1,63 @@
+#!/usr/local/bin/python
+
+# Program: tr.graph.report.cgi
+# Purpose: to analyze the whole "Depends On" graph and return a Dependency
+#	Graph Report screen
+# User Requirements Satisfied by This Program:
+#	none
+# System Requirements Satisfied by This Program:
+#	Usage: Call only as a CGI script as part of the WTS web interface, with
+#		parameters provided via a GET or POST submission.
+#	Uses: Python 1.4
+#	Envvars: none
+#	Inputs: one optional field:
+#		Top = number of chains and most depended-on TRs to list
+#			(default 10)
+#	Outputs: May generate an HTML screen reporting an invalid Top value,
+#		giving the user the choice of going back to fix it.  Otherwise,
+#		generates an HTML screen listing the cycles, longest blocking
+#		chains, most depended-on TRs, and orphaned closure rows in the
+#		dependency graph.
+#	Exit Codes: none
+#	Other System Requirements: none
+# Assumes: nothing
+# Implementation:
+#	As with all WTS CGI scripts, the main code for this one is wrapped in a
+#	try..except statement.  This ensures that we can present an Exception
+#	Screen for the user rather than having a hard crash.  (Both are
+#	undesirable and should not happen under normal operating circumstances.)
+
+import os
+import sys
+import cgi
+import string
+import Configuration
+import wtslib		# provides auxiliary functions
+import TrackRec		# provides access to tracking record information and a
+			# means of manipulating tracking record data
+import screenlib	# provides a means of generating the HTML screens
+
+try:
+	form = cgi.FieldStorage ()			# input from GET / POST
+	dict = wtslib.FieldStorage_to_Dict (form)	# convert to dictionary
+
+	errors = []
+	top = 10
+	if dict.has_key ('Top'):
+		try:
+			top = string.atoi (dict ['Top'])
+		except ValueError:
+			errors.append ('Top must be a whole number.')
+
+	if len (errors) == 0:
+		doc = screenlib.Graph_Report_Screen ()
+		doc.setup (TrackRec.graphReport (top))
+	else:
+		# bring up the error notification screen to give the user the
+		# full info about what errors were discovered.
+
+		doc = screenlib.Error_Screen ()	# create the error screen
+		doc.setup (errors)		# setup it up w/ list of errors
+	doc.write ()
+except:
+	screenlib.gen_Exception_Screen ('tr.graph.report.cgi')
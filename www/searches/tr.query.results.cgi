@@ -51,6 +51,12 @@
 #				separated string by FieldStorage_to_Dict())
 #				that tells us which "Not" boxes were checked on
 #				the query form, if any
+#			As_Text - if submitted, send the results as a
+#				tab-delimited text file rather than as HTML
+#			Page - which page of the results to show (default 1)
+#			Page_Size - number of results to show on each page
+#				(default is the QUERY_PAGE_SIZE config
+#				parameter; 0 shows them all on one page)
 #		Note that FieldStorage_To_Dict() also converts underscores in
 #		the fieldnames to be spaces.
 #	Outputs: May generate an HTML screen with reports of various data
@@ -60,7 +66,8 @@
 #		used to generate and run queries to get selected information
 #		about tracking records from the database.  This info is then
 #		use to produce an HTML screen with a table of the query
-#		results.  The left most column in the table provides a checkbox
+#		results, QUERY_PAGE_SIZE rows at a time (with links to the
+#		previous and next pages).  The left most column in the table provides a checkbox
 #		for each row (a single tracking record) which may be checked to
 #		select that tracking record for another type of operation
 #		(Redisplay, Grid, or Detail).  The other columns vary depending
@@ -70,6 +77,9 @@
 #		Grid button will produce a grid of tracking records by area.  A
 #		Detail button provides detail displays for each checked tracking
 #		record.  A WTS Home button will return us to the WTS Home Page.
+#		With As_Text, the results are instead written (all of them,
+#		with no pages) as a tab-delimited file, as they are read from
+#		the database.
 #	Exit Codes: none
 #	Other System Requirements: none
 # Assumes: nothing
@@ -83,6 +93,7 @@ import os
 import sys
 import cgi
 import string
+import urllib
 import Configuration
 import wtslib		# provides auxiliary functions
 import TrackRec		# provides access to tracking record information and a
@@ -117,6 +128,52 @@ hidden_field_values = {
 	'Tertiary Order'	: 'asc'
 	}
 
+# --- functions ---
+
+def pageField (
+	fields,		# dictionary of fieldname -> value from the form
+	name,		# name of the paging field to get
+	default		# integer; value to use if the field is missing or bad
+	):
+	# Purpose: get (and remove from "fields") one of the fields which
+	#	say which page of results to show
+	# Returns: integer
+	# Assumes: nothing
+	# Effects: deletes "name" from "fields", as it is not part of the
+	#	query itself
+	# Throws: nothing
+
+	if not fields.has_key (name):
+		return default
+	value = fields [name]
+	del fields [name]
+	try:
+		value = string.atoi (string.strip (value))
+	except ValueError:
+		return default
+	if value < 0 or ((value == 0) and (name == 'Page')):
+		return default
+	return value
+
+def pageURL (
+	fields,		# dictionary of fieldname -> value from the form
+	page_number,	# integer; page to link to
+	page_size	# integer; number of rows on each page
+	):
+	# Purpose: get the URL for one page of the results of this query
+	# Returns: string
+	# Assumes: "fields" has no paging fields
+	# Effects: nothing
+	# Throws: nothing
+
+	pairs = []
+	for key in fields.keys ():
+		pairs.append ( (wtslib.underscored (key), fields [key]) )
+	pairs.append ( ('Page', str (page_number)) )
+	if page_size != TrackRec.queryPageSize ():
+		pairs.append ( ('Page_Size', str (page_size)) )
+	return 'tr.query.results.cgi?' + urllib.urlencode (pairs)
+
 # --- body of the script ---
 
 try:
@@ -157,6 +214,11 @@ try:
 
 			dict [field] = os.environ ['REMOTE_USER']
 
+	# find which page of results to show, and how many are on a page
+
+	page_number = pageField (dict, 'Page', 1)
+	page_size = pageField (dict, 'Page Size', TrackRec.queryPageSize ())
+
 	# Validate the entries in this dictionary.  If any errors are
 	# discovered in validation, an exception is raised in the
 	# validate_Query_Form function.
@@ -208,34 +270,60 @@ try:
 
 				hidden_field_values [key] = clean_dict [key]
 
-		# since the entries are valid, use them to generate and run
-		# SQL statements to query the database.
-
-		results = TrackRec.build_And_Run_SQL (clean_dict)
-
-		# These results could have multiple rows per tracking record
-		# because of the many-to-many relationships in several fields.
-		# Clean these results up, and condense them, so that all the
-		# information for a tracking record is contained in only one
-		# result row.
-
-		clean_results = TrackRec.parse_And_Merge (results, 'TR Nr')
-
 		if clean_dict.has_key ('As Text'):
-			# send out the results as a tab-delimited text file
-
-			t = TabFile.TabFile ()
-			t.setList (clean_results)
-			print "Content-type: text/plain"
-			print
-			if str(t) == '':
+			# send out the results as a tab-delimited text file.
+			# We write each batch of rows as it comes from the
+			# database, so the user starts getting them right
+			# away and we never hold them all.  (Each row is one
+			# tracking record, so we need not merge them.)
+
+			writer = TabFile.TabWriter (sys.stdout,
+				'Content-type: text/plain\n\n' + \
+				'# Current info as of %s\n#\n' % \
+					wtslib.current_Time ())
+			TrackRec.stream_Query (clean_dict, writer.write)
+			if writer.getCount () == 0:
+				print "Content-type: text/plain"
+				print
 				print "No tracking records were selected"
-			else:
-				print "# Current info as of %s" % \
-					wtslib.current_Time ()
-				print "#"
-				print t
 		else:
+			# since the entries are valid, use them to generate
+			# and run SQL statements to query the database (or get
+			# the results of the same query from the cache, if it
+			# was run recently).  We get only one page of results
+			# unless the page size is 0.
+
+			if page_size == 0:
+				results = TrackRec.run_Query (clean_dict)
+				paging = None
+			else:
+				(results, total) = TrackRec.run_Query_Page (
+					clean_dict, page_number, page_size)
+				last_page = max (1, (total + page_size - 1) / \
+					page_size)
+				paging = {
+					'first' : (page_number - 1) * \
+						page_size + 1,
+					'total' : total,
+					'previous' : None,
+					'next' : None }
+				if page_number > 1:
+					paging ['previous'] = pageURL (dict,
+						min (page_number - 1,
+						last_page), page_size)
+				if page_number < last_page:
+					paging ['next'] = pageURL (dict,
+						page_number + 1, page_size)
+
+			# These results could have multiple rows per tracking
+			# record because of the many-to-many relationships in
+			# several fields.  Clean these results up, and
+			# condense them, so that all the information for a
+			# tracking record is contained in only one result row.
+
+			clean_results = TrackRec.parse_And_Merge (results,
+				'TR Nr')
+
 			if dict.has_key ('Status Date'):
 				sd = dict ['Status Date']
 			else:
@@ -246,7 +334,8 @@ try:
 			# generate the query result screen.
 
 			doc = screenlib.Query_Result_Screen ()
-			doc.setup (clean_results, hidden_field_values, sd)
+			doc.setup (clean_results, hidden_field_values, sd,
+				paging)
 			doc.write ()
 
 	# if the entries were not valid, then we have already displayed an
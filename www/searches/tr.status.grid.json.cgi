@@ -0,0 +1,80 @@
+#!/usr/local/bin/python
+
+# Program: tr.status.grid.json.cgi
+# Purpose: to parse input fields and use them to query the database and return
+#	the counts for a Status Grid as JSON, for use by other programs
+# User Requirements Satisfied by This Program:
+#	see TR 659
+# System Requirements Satisfied by This Program:
+#	Usage: Call only as a CGI script as part of the WTS web interface, with
+#		parameters provided via a GET or POST submission.
+#	Uses: Python 1.4
+#	Envvars: none
+#	Inputs: Requires two fields be filled in, as for tr.status.grid.cgi:
+#		RowType = 'Area' or 'Type'
+#		DateRange = string, specifying range of dates
+#	Outputs: A JSON object, as returned by TrackRec.getStatusCounts():
+#		rowType, dateRange, statuses (list of Status names, in order),
+#		rows (list of Area or Type names, in order), counts (maps row
+#		name -> Status name -> number of TRs), rowTotals, statusTotals,
+#		and total.  Counts of zero are left out.  If the input is not
+#		valid, or if an error occurs, the object has one key instead:
+#		errors (list of strings).
+#	Exit Codes: none
+#	Other System Requirements: none
+# Assumes: nothing
+# Implementation:
+#	As with all WTS CGI scripts, the main code for this one is wrapped in a
+#	try..except statement.  Since the caller is expecting JSON rather than
+#	an HTML screen, we report an unexpected exception as an error in the
+#	JSON object.
+
+import os
+import sys
+import cgi
+import string
+import Configuration
+import wtslib		# provides auxiliary functions
+import TrackRec		# provides access to tracking record information and a
+			# means of manipulating tracking record data
+
+def writeJSON (
+	value		# dictionary to send back to the caller
+	):
+	# Purpose: write 'value' to stdout as the JSON response
+	# Returns: nothing
+	# Assumes: nothing has been written to stdout yet
+	# Effects: writes to stdout
+	# Throws: nothing
+
+	print 'Content-type: application/json'
+	print
+	print wtslib.jsonString (value)
+	return
+
+try:
+	form = cgi.FieldStorage ()			# input from GET / POST
+	dict = wtslib.FieldStorage_to_Dict (form)	# convert to dictionary
+
+	# Check the values in the input.  Both fields must be specified, and
+	# valid.
+
+	errors = []
+	if not dict.has_key ('DateRange'):
+		errors.append ('A date range must be specified.')
+	if not dict.has_key ('RowType'):
+		errors.append ('You must select a type of analysis.')
+	elif dict ['RowType'] not in [ 'Area', 'Type' ]:
+		errors.append ('Valid analysis options are Area and Type.')
+
+	if len (errors) == 0:
+		try:
+			writeJSON (TrackRec.getStatusCounts (dict ['RowType'],
+				dict ['DateRange']))
+		except TrackRec.error:
+			errors = wtslib.string_To_List (sys.exc_value,
+				TrackRec.error_separator)
+	if len(errors) > 0:
+		writeJSON ({ 'errors' : errors })
+except:
+	writeJSON ({ 'errors' : [ '%s: %s' % (sys.exc_type, sys.exc_value) ] })